@@ -0,0 +1,386 @@
+import math
+import threading
+import time
+from bisect import bisect_left
+from collections import namedtuple
+
+import numpy as np
+
+Alert = namedtuple("Alert", ["user_id", "figi", "ticker", "threshold", "baseline", "window"])
+LevelAlert = namedtuple("LevelAlert", ["user_id", "figi", "ticker", "level", "direction"])
+FiredAlert = namedtuple("FiredAlert", ["user_id", "figi", "ticker", "threshold", "old_price", "new_price", "change",
+                                       "window", "direction"], defaults=(None,))
+
+ABOVE = "above"
+BELOW = "below"
+
+INITIAL_CAPACITY = 1024
+
+
+def _grow(array, size):
+    capacity = len(array)
+    while capacity < size:
+        capacity *= 2
+    if capacity == len(array):
+        return array
+    grown = np.zeros(capacity, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class AlertEngine:
+    def __init__(self, capacity=INITIAL_CAPACITY, history=None):
+        self.history = history
+        self.evaluated = 0
+        self.fired = 0
+        self._lock = threading.RLock()
+        self._reset(capacity)
+        self._reset_levels()
+
+    def _reset(self, capacity):
+        self._user = np.zeros(capacity, dtype=np.int64)
+        self._instrument = np.zeros(capacity, dtype=np.int32)
+        self._threshold = np.zeros(capacity, dtype=np.float64)
+        self._baseline = np.zeros(capacity, dtype=np.float64)
+        self._window = np.zeros(capacity, dtype=np.float64)
+        self._since = np.zeros(capacity, dtype=np.float64)
+        self._active = np.zeros(capacity, dtype=bool)
+        self._position = np.zeros(capacity, dtype=np.int32)
+        self._row_ids = {}
+        self._size = 0
+        self._free = []
+        self._count = 0
+
+        self._figis = []
+        self._tickers = []
+        self._instrument_ids = {}
+        self._members = []
+        self._member_count = []
+
+    def _reset_levels(self):
+        self._levels = {}
+        self._level_tickers = {}
+        self._level_count = 0
+
+    def __len__(self):
+        return self._count + self._level_count
+
+    def _instrument_id(self, figi, ticker):
+        slot = self._instrument_ids.get(figi)
+        if slot is None:
+            slot = len(self._figis)
+            self._instrument_ids[figi] = slot
+            self._figis.append(figi)
+            self._tickers.append(ticker)
+            self._members.append(np.zeros(4, dtype=np.int32))
+            self._member_count.append(0)
+        return slot
+
+    def _rows(self, slot):
+        return self._members[slot][:self._member_count[slot]]
+
+    def _find(self, user_id, slot, window):
+        return self._row_ids.get((user_id, slot, window))
+
+    def _allocate(self):
+        if self._free:
+            return self._free.pop()
+        row = self._size
+        self._size += 1
+        if self._size > len(self._user):
+            self._user = _grow(self._user, self._size)
+            self._instrument = _grow(self._instrument, self._size)
+            self._threshold = _grow(self._threshold, self._size)
+            self._baseline = _grow(self._baseline, self._size)
+            self._window = _grow(self._window, self._size)
+            self._since = _grow(self._since, self._size)
+            self._active = _grow(self._active, self._size)
+            self._position = _grow(self._position, self._size)
+        return row
+
+    def add(self, user_id, figi, ticker, threshold, baseline, window=0):
+        with self._lock:
+            slot = self._instrument_id(figi, ticker)
+            row = self._find(user_id, slot, window)
+            created = row is None
+            if created:
+                row = self._allocate()
+                count = self._member_count[slot]
+                self._members[slot] = _grow(self._members[slot], count + 1)
+                self._members[slot][count] = row
+                self._member_count[slot] = count + 1
+                self._position[row] = count
+                self._row_ids[(user_id, slot, window)] = row
+                self._count += 1
+            self._user[row] = user_id
+            self._instrument[row] = slot
+            self._threshold[row] = threshold
+            self._baseline[row] = baseline
+            self._window[row] = window
+            self._since[row] = 0
+            self._active[row] = True
+            return created
+
+    def remove(self, user_id, figi, window=0):
+        with self._lock:
+            slot = self._instrument_ids.get(figi)
+            if slot is None:
+                return False
+            row = self._find(user_id, slot, window)
+            if row is None:
+                return False
+            members = self._members[slot]
+            last = self._member_count[slot] - 1
+            position = int(self._position[row])
+            members[position] = members[last]
+            self._position[members[position]] = position
+            self._member_count[slot] = last
+            del self._row_ids[(user_id, slot, window)]
+            self._active[row] = False
+            self._free.append(row)
+            self._count -= 1
+            return True
+
+    def load(self, rows):
+        rows = list(rows)
+        size = len(rows)
+        with self._lock:
+            self._reset(max(size, INITIAL_CAPACITY))
+            if not size:
+                return 0
+            users, figis, tickers, thresholds, baselines, windows = zip(*rows)
+            self._user[:size] = users
+            self._threshold[:size] = thresholds
+            self._baseline[:size] = baselines
+            self._window[:size] = windows
+            self._active[:size] = True
+            self._instrument[:size] = [self._instrument_id(figi, ticker) for figi, ticker in zip(figis, tickers)]
+
+            order = np.argsort(self._instrument[:size], kind="stable").astype(np.int32)
+            counts = np.bincount(self._instrument[:size], minlength=len(self._figis))
+            start = 0
+            for slot, count in enumerate(counts.tolist()):
+                self._members[slot] = order[start:start + count].copy()
+                self._member_count[slot] = count
+                self._position[self._members[slot]] = np.arange(count, dtype=np.int32)
+                start += count
+            self._row_ids = dict(zip(zip(self._user[:size].tolist(), self._instrument[:size].tolist(),
+                                         self._window[:size].tolist()), range(size)))
+            self._size = self._count = size
+            return size
+
+    def _alert(self, row):
+        slot = int(self._instrument[row])
+        return Alert(int(self._user[row]), self._figis[slot], self._tickers[slot],
+                     float(self._threshold[row]), float(self._baseline[row]), float(self._window[row]))
+
+    def user_alerts(self, user_id):
+        with self._lock:
+            size = self._size
+            rows = np.flatnonzero(self._active[:size] & (self._user[:size] == user_id))
+            return [self._alert(row) for row in rows]
+
+    def drop(self, figis):
+        with self._lock:
+            for figi in figis:
+                if figi in self._levels:
+                    above, below = self._levels.pop(figi)
+                    del self._level_tickers[figi]
+                    self._level_count -= len(above) + len(below)
+                slot = self._instrument_ids.get(figi)
+                if slot is None or not self._member_count[slot]:
+                    continue
+                rows = self._rows(slot)
+                for user_id, row, window in zip(self._user[rows].tolist(), rows.tolist(), self._window[rows].tolist()):
+                    del self._row_ids[(user_id, slot, window)]
+                    self._free.append(row)
+                self._active[rows] = False
+                self._count -= len(rows)
+                self._member_count[slot] = 0
+
+    def add_level(self, user_id, figi, ticker, level, direction):
+        with self._lock:
+            self.remove_level(user_id, figi, level)
+            above, below = self._levels.setdefault(figi, ([], []))
+            self._level_tickers[figi] = ticker
+            book, key = (above, (-level, user_id)) if direction == ABOVE else (below, (level, user_id))
+            book.insert(bisect_left(book, key), key)
+            self._level_count += 1
+
+    def remove_level(self, user_id, figi, level):
+        with self._lock:
+            books = self._levels.get(figi)
+            if books is None:
+                return False
+            for book, key in zip(books, ((-level, user_id), (level, user_id))):
+                index = bisect_left(book, key)
+                if index < len(book) and book[index] == key:
+                    del book[index]
+                    self._level_count -= 1
+                    self._drop_empty_levels(figi)
+                    return True
+            return False
+
+    def _drop_empty_levels(self, figi):
+        if not any(self._levels[figi]):
+            del self._levels[figi]
+            del self._level_tickers[figi]
+
+    def load_levels(self, rows):
+        with self._lock:
+            self._reset_levels()
+            for user_id, figi, ticker, level, direction in rows:
+                above, below = self._levels.setdefault(figi, ([], []))
+                self._level_tickers[figi] = ticker
+                if direction == ABOVE:
+                    above.append((-level, user_id))
+                else:
+                    below.append((level, user_id))
+            for above, below in self._levels.values():
+                above.sort()
+                below.sort()
+                self._level_count += len(above) + len(below)
+            return self._level_count
+
+    def user_levels(self, user_id):
+        with self._lock:
+            return [LevelAlert(user_id, figi, self._level_tickers[figi], abs(level), direction)
+                    for figi, books in self._levels.items()
+                    for direction, book in zip((ABOVE, BELOW), books)
+                    for level, owner in book if owner == user_id]
+
+    def instruments(self):
+        with self._lock:
+            figis = [figi for slot, figi in enumerate(self._figis) if self._member_count[slot]]
+            return figis + [figi for figi in self._levels if figi not in self._instrument_ids
+                            or not self._member_count[self._instrument_ids[figi]]]
+
+    def evaluate(self, figi, price, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            if price <= 0:
+                return []
+            result = self._evaluate_levels(figi, price)
+            slot = self._instrument_ids.get(figi)
+            if slot is not None and self._member_count[slot]:
+                if self.history is not None:
+                    self.history.record(figi, now, price)
+                rows = self._rows(slot)
+                windows = self._window[rows]
+                ticker = self._tickers[slot]
+
+                result.extend(self._evaluate_baseline(figi, ticker, rows[windows == 0], price))
+                for window in np.unique(windows[windows > 0]).tolist():
+                    result.extend(self._evaluate_window(figi, ticker, rows[windows == window], price, window, now))
+                self.evaluated += len(rows)
+            self.fired += len(result)
+            return result
+
+    def _evaluate_levels(self, figi, price):
+        books = self._levels.get(figi)
+        if books is None:
+            return []
+        above, below = books
+        ticker = self._level_tickers[figi]
+        crossed_up = bisect_left(above, (-price, -math.inf))
+        crossed_down = bisect_left(below, (price, -math.inf))
+        result = [FiredAlert(user_id, figi, ticker, -level, -level, price, (price + level) / -level * 100, 0.0, ABOVE)
+                  for level, user_id in above[crossed_up:]]
+        result.extend(FiredAlert(user_id, figi, ticker, level, level, price, (price - level) / level * 100, 0.0, BELOW)
+                      for level, user_id in below[crossed_down:])
+        del above[crossed_up:], below[crossed_down:]
+        self._level_count -= len(result)
+        self._drop_empty_levels(figi)
+        return result
+
+    def _evaluate_baseline(self, figi, ticker, rows, price):
+        if not len(rows):
+            return []
+        baseline = self._baseline[rows]
+        change = np.abs(price - baseline) / baseline * 100
+        mask = change >= self._threshold[rows]
+        fired = rows[mask]
+        if not len(fired):
+            return []
+
+        result = [FiredAlert(user_id, figi, ticker, threshold, old_price, price, fired_change, 0.0)
+                  for user_id, threshold, old_price, fired_change in zip(
+                      self._user[fired].tolist(), self._threshold[fired].tolist(),
+                      baseline[mask].tolist(), change[mask].tolist())]
+        self._baseline[fired] = price
+        return result
+
+    def _evaluate_window(self, figi, ticker, rows, price, window, now):
+        if self.history is None:
+            return []
+        stats = self.history.window(figi, now - window, now - 2 * window)
+        if stats is None:
+            return []
+        rise = (price - stats.low) / stats.low * 100
+        fall = (stats.high - price) / stats.high * 100
+        change, old_price = (rise, stats.low) if rise >= fall else (fall, stats.high)
+
+        rows = rows[now - self._since[rows] >= window]
+        fired = rows[self._threshold[rows] <= change]
+        if not len(fired):
+            return []
+
+        result = [FiredAlert(user_id, figi, ticker, threshold, old_price, price, change, window)
+                  for user_id, threshold in zip(self._user[fired].tolist(), self._threshold[fired].tolist())]
+        self._baseline[fired] = price
+        self._since[fired] = now
+        return result
+
+    def evaluate_many(self, quotes, now=None):
+        fired = []
+        for figi, quote in quotes.items():
+            fired.extend(self.evaluate(figi, quote.price, now))
+        return fired
+
+    def min_window(self, figi):
+        with self._lock:
+            slot = self._instrument_ids.get(figi)
+            if slot is None or not self._member_count[slot]:
+                return None
+            windows = self._window[self._rows(slot)]
+            windows = windows[windows > 0]
+            return float(windows.min()) if len(windows) else None
+
+    def headroom(self, figi, price, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            if price <= 0:
+                return None
+            margins = []
+            above, below = self._levels.get(figi, ((), ()))
+            if above:
+                margins.append((-above[-1][0] - price) / price * 100)
+            if below:
+                margins.append((price - below[-1][0]) / price * 100)
+
+            slot = self._instrument_ids.get(figi)
+            if slot is None or not self._member_count[slot]:
+                return min(margins) if margins else None
+            rows = self._rows(slot)
+            windows = self._window[rows]
+
+            baseline_rows = rows[windows == 0]
+            if len(baseline_rows):
+                baseline = self._baseline[baseline_rows]
+                change = np.abs(price - baseline) / baseline * 100
+                margins.append(float((self._threshold[baseline_rows] - change).min()))
+
+            for window in np.unique(windows[windows > 0]).tolist():
+                threshold = float(self._threshold[rows[windows == window]].min())
+                stats = self.history.window(figi, now - window, now - 2 * window) if self.history is not None else None
+                if stats is None:
+                    margins.append(threshold)
+                    continue
+                change = max((price - stats.low) / stats.low, (stats.high - price) / stats.high) * 100
+                margins.append(threshold - change)
+            return min(margins)
+
+    def nbytes(self):
+        arrays = [self._user, self._instrument, self._threshold, self._baseline, self._window, self._since,
+                  self._active, self._position]
+        return sum(a.nbytes for a in arrays) + sum(m.nbytes for m in self._members)
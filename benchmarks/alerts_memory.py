@@ -0,0 +1,43 @@
+import argparse
+import random
+import time
+import tracemalloc
+
+from alerts import AlertEngine
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Память и скорость AlertEngine на большом числе уведомлений")
+    parser.add_argument("--alerts", type=int, default=1_000_000)
+    parser.add_argument("--instruments", type=int, default=2000)
+    parser.add_argument("--per-user", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    figis = [f"FIGI{i:08d}" for i in range(args.instruments)]
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    engine = AlertEngine()
+    for i in range(args.alerts):
+        figi = figis[rng.randrange(args.instruments)]
+        engine.add(i // args.per_user, figi, figi, rng.uniform(1, 10), 100.0)
+    build_time = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    fired = 0
+    for figi in figis:
+        fired += len(engine.evaluate(figi, rng.uniform(90, 110)))
+    evaluate_time = time.perf_counter() - started
+
+    print(f"alerts: {len(engine)}, instruments: {args.instruments}")
+    print(f"arrays: {engine.nbytes() / 2 ** 20:.1f} MiB, peak traced: {peak / 2 ** 20:.1f} MiB")
+    print(f"bytes per alert: {engine.nbytes() / len(engine):.1f}")
+    print(f"build: {build_time:.2f} s")
+    print(f"evaluate all instruments: {evaluate_time * 1000:.1f} ms, fired: {fired}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import argparse
+import statistics
+import time
+
+from benchmarks.fakes import FakeClient, FakeMarket, make_shares
+from client_pool import ClientPool
+
+
+def find_price_nested(factory, ticker):
+    with factory() as cl:
+        shares = cl.instruments.shares().instruments
+        stock = next(s for s in shares if s.ticker == ticker)
+        for _ in range(2):
+            with factory() as client:
+                figi = next(s for s in client.instruments.shares().instruments if s.ticker == ticker).figi
+                with factory() as price_client:
+                    price_client.market_data.get_last_prices(figi=[figi])
+    return stock
+
+
+def find_price_pooled(pool, ticker, index):
+    stock = index[ticker]
+    with pool.client() as client:
+        client.market_data.get_last_prices(figi=[stock.figi])
+    return stock
+
+
+def measure(fn, requests):
+    samples = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def report(name, samples, calls):
+    samples = sorted(samples)
+    print(f"{name:<8} mean {statistics.mean(samples):7.2f} ms  p95 {samples[int(len(samples) * 0.95) - 1]:7.2f} ms  "
+          f"calls {dict(sorted(calls.items()))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Задержка /find_price: вложенные Client против общего пула")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--connect-ms", type=float, default=40)
+    parser.add_argument("--rpc-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    market = FakeMarket(make_shares(2000))
+    ticker = market.shares[100].ticker
+
+    before_calls = {}
+    before = measure(lambda: find_price_nested(
+        lambda: FakeClient(market, args.connect_ms / 1000, args.rpc_ms / 1000, before_calls), ticker), args.requests)
+
+    after_calls = {}
+    pool = ClientPool(lambda: FakeClient(market, args.connect_ms / 1000, args.rpc_ms / 1000, after_calls))
+    index = {share.ticker: share for share in market.shares}
+    after = measure(lambda: find_price_pooled(pool, ticker, index), args.requests)
+
+    report("before", before, before_calls)
+    report("after", after, after_calls)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import argparse
+import threading
+import time
+
+from dispatch import ChatDispatcher
+
+SLOW_CHAT = 1
+MAX_LATENCY_SHARE = 0.25
+
+
+def run(workers, slow_seconds, fast_chats):
+    latencies = {}
+    order = []
+    done = threading.Event()
+    expected = 3 + fast_chats
+
+    def handler(item):
+        chat_id, seq, submitted = item
+        if chat_id == SLOW_CHAT:
+            time.sleep(slow_seconds)
+            order.append(seq)
+        else:
+            time.sleep(0.001)
+            latencies[chat_id] = time.perf_counter() - submitted
+        if len(order) + len(latencies) == expected:
+            done.set()
+
+    dispatcher = ChatDispatcher(handler, workers=workers)
+    dispatcher.start()
+    for seq in range(3):
+        dispatcher.submit(SLOW_CHAT, (SLOW_CHAT, seq, time.perf_counter()))
+    for chat_id in range(2, fast_chats + 2):
+        dispatcher.submit(chat_id, (chat_id, 0, time.perf_counter()))
+    done.wait(slow_seconds * 3 + 10)
+    dispatcher.stop()
+    return max(latencies.values(), default=float("inf")), order
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Один медленный чат против быстрых: задержка быстрых чатов")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--slow", type=float, default=0.5)
+    parser.add_argument("--fast-chats", type=int, default=50)
+    args = parser.parse_args()
+
+    failures = []
+    for workers in (1, args.workers):
+        worst, order = run(workers, args.slow, args.fast_chats)
+        print(f"workers {workers:>3}: worst fast-chat latency {worst * 1000:8.1f} ms, slow chat order {order}")
+        if order != [0, 1, 2]:
+            failures.append(f"workers {workers}: slow chat order {order}, expected [0, 1, 2]")
+        if workers > 1 and worst >= args.slow * MAX_LATENCY_SHARE:
+            failures.append(f"workers {workers}: worst fast-chat latency {worst * 1000:.1f} ms is not under "
+                            f"{args.slow * MAX_LATENCY_SHARE * 1000:.0f} ms")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        raise SystemExit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+import json
+import math
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+FX_RATES = {"usd": 90.0, "eur": 98.0, "cny": 12.5}
+CANDLE_STEPS = {"CANDLE_INTERVAL_5_MIN": (5 * 60, 24 * 60 * 60), "CANDLE_INTERVAL_HOUR": (60 * 60, 7 * 24 * 60 * 60),
+                "CANDLE_INTERVAL_DAY": (24 * 60 * 60, 365 * 24 * 60 * 60)}
+TRADING_HOURS = {"MOEX": (7 * 3600, 20 * 3600 + 50 * 60), "SPB": (13 * 3600 + 30 * 60, 20 * 3600)}
+
+
+def quotation(value):
+    units = int(value)
+    return SimpleNamespace(units=units, nano=int(round((value - units) * 1_000_000_000)))
+
+
+def make_shares(count, seed=1):
+    rng = random.Random(seed)
+    currencies = ["rub", "rub", "rub", "usd"]
+    sectors = ["financial", "energy", "it", "consumer", "materials", "telecom"]
+    shares, seen = [], set()
+    for i in range(count):
+        ticker = None
+        while ticker is None or ticker in seen:
+            ticker = "".join(rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ") for _ in range(rng.randint(3, 5)))
+        seen.add(ticker)
+        name = "".join(rng.choice("абвгдежзиклмнопрстуфхя") for _ in range(rng.randint(5, 10))).capitalize()
+        name = f"{name} {rng.choice(['ПАО', 'Inc.', 'Group'])}"
+        currency = rng.choice(currencies)
+        shares.append(SimpleNamespace(
+            figi=f"BBG{i:09d}", ticker=ticker, name=name, currency=currency, sector=rng.choice(sectors),
+            exchange="MOEX" if currency == "rub" else "SPB", lot=1,
+        ))
+    return shares
+
+
+class FakeApiError(Exception):
+    def __init__(self, code, reset=None):
+        super().__init__(code)
+        self.code = SimpleNamespace(name=code)
+        self.metadata = SimpleNamespace(ratelimit_reset=reset)
+
+
+class FakeThrottle:
+    def __init__(self, per_second):
+        self.per_second = per_second
+        self.rejected = 0
+        self._window = deque()
+        self._lock = threading.Lock()
+
+    def check(self):
+        with self._lock:
+            now = time.monotonic()
+            while self._window and self._window[0] <= now - 1:
+                self._window.popleft()
+            if len(self._window) >= self.per_second:
+                self.rejected += 1
+                raise FakeApiError("RESOURCE_EXHAUSTED", reset=self._window[0] + 1 - now)
+            self._window.append(now)
+
+
+class FakeMarket:
+    def __init__(self, shares, seed=1):
+        self.shares = shares
+        self.rng = random.Random(seed)
+        self.prices = {share.figi: self.rng.uniform(1, 5000) for share in shares}
+        self.trading_hours = TRADING_HOURS
+        self.throttle = None
+        self.outage = False
+        self.currencies = [SimpleNamespace(figi=f"BBGFX{code.upper()}", ticker=f"{code.upper()}RUB_TOM",
+                                           iso_currency_name=code, nominal=quotation(1))
+                           for code in FX_RATES]
+        self.fx_prices = {f"BBGFX{code.upper()}": rate for code, rate in FX_RATES.items()}
+
+    def price(self, figi):
+        return self.prices.get(figi, self.fx_prices.get(figi))
+
+    def tick(self, volatility=0.02):
+        for figi, price in self.prices.items():
+            self.prices[figi] = price * (1 + self.rng.uniform(-volatility, volatility))
+
+
+class ClockMarket(FakeMarket):
+    def __init__(self, shares, amplitude=0.1, period=20.0, seed=1):
+        super().__init__(shares, seed)
+        self.amplitude = amplitude
+        self.period = period
+        self.phases = {figi: self.rng.uniform(0, 2 * math.pi) for figi in self.prices}
+        self.trading_hours = {}
+
+    def price(self, figi):
+        base = self.prices.get(figi)
+        if base is None:
+            return self.fx_prices.get(figi)
+        return base * (1 + self.amplitude * math.sin(2 * math.pi * time.time() / self.period + self.phases[figi]))
+
+
+class FakeServices:
+    def __init__(self, market, rpc_latency, calls):
+        self.market = market
+        self.rpc_latency = rpc_latency
+        self.calls = calls
+        self.instruments = SimpleNamespace(shares=self._shares, currencies=self._currencies,
+                                           trading_schedules=self._trading_schedules)
+        self.market_data = SimpleNamespace(get_last_prices=self._get_last_prices, get_candles=self._get_candles)
+        self.users = SimpleNamespace(get_info=self._get_info)
+
+    def _rpc(self, name):
+        if self.market.outage:
+            raise FakeApiError("UNAVAILABLE")
+        if self.market.throttle is not None:
+            self.market.throttle.check()
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if self.rpc_latency:
+            time.sleep(self.rpc_latency)
+
+    def _shares(self):
+        self._rpc("shares")
+        return SimpleNamespace(instruments=self.market.shares)
+
+    def _currencies(self):
+        self._rpc("currencies")
+        return SimpleNamespace(instruments=self.market.currencies)
+
+    def _trading_schedules(self, exchange="", from_=None, to=None):
+        self._rpc("trading_schedules")
+        schedules = []
+        for name, (opens, closes) in self.market.trading_hours.items():
+            if exchange and exchange != name:
+                continue
+            days, day = [], from_
+            while day < to:
+                trading = day.weekday() < 5
+                days.append(SimpleNamespace(date=day, is_trading_day=trading,
+                                            start_time=day + timedelta(seconds=opens) if trading else None,
+                                            end_time=day + timedelta(seconds=closes) if trading else None))
+                day += timedelta(days=1)
+            schedules.append(SimpleNamespace(exchange=name, days=days))
+        return SimpleNamespace(exchanges=schedules)
+
+    def _get_last_prices(self, figi):
+        self._rpc("get_last_prices")
+        now = datetime.now(timezone.utc)
+        prices = ((f, self.market.price(f)) for f in figi)
+        return SimpleNamespace(last_prices=[
+            SimpleNamespace(figi=f, price=quotation(price), time=now) for f, price in prices if price is not None
+        ])
+
+    def _get_candles(self, figi, from_, to, interval):
+        self._rpc("get_candles")
+        step, limit = CANDLE_STEPS[getattr(interval, "name", interval)]
+        start, end = from_.timestamp(), to.timestamp()
+        if end - start > limit:
+            raise ValueError(f"interval {end - start} s exceeds {limit} s")
+        base = self.market.prices.get(figi)
+        candles = []
+        if base is None:
+            return SimpleNamespace(candles=candles)
+        for moment in range(int(-(-start // step) * step), int(end), step):
+            seconds = moment % (24 * 60 * 60)
+            if step < 24 * 60 * 60 and not 7 * 3600 <= seconds < 20 * 3600:
+                continue
+            close = base * (1 + 0.1 * math.sin(moment / 86400 / 10))
+            candles.append(SimpleNamespace(
+                time=datetime.fromtimestamp(moment, timezone.utc), open=quotation(close * 0.999),
+                high=quotation(close * 1.005), low=quotation(close * 0.995), close=quotation(close), volume=100,
+                is_complete=moment + step <= time.time()))
+        return SimpleNamespace(candles=candles)
+
+    def _get_info(self):
+        self._rpc("get_info")
+        return SimpleNamespace()
+
+
+class FakeClient:
+    def __init__(self, market, connect_latency=0.0, rpc_latency=0.0, calls=None):
+        self.market = market
+        self.connect_latency = connect_latency
+        self.rpc_latency = rpc_latency
+        self.calls = calls if calls is not None else {}
+
+    def __enter__(self):
+        self.calls["connect"] = self.calls.get("connect", 0) + 1
+        if self.connect_latency:
+            time.sleep(self.connect_latency)
+        return FakeServices(self.market, self.rpc_latency, self.calls)
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeResponse:
+    def __init__(self, payload, status_code=200):
+        self.status_code = status_code
+        self.text = json.dumps(payload)
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+
+class FakeTelegram:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = {}
+        self.sent_bytes = 0
+        self._message_id = 0
+
+    def _upload_size(self, value):
+        if isinstance(value, (tuple, list)):
+            return sum(self._upload_size(item) for item in value)
+        if hasattr(value, "read"):
+            return len(value.read())
+        if isinstance(value, (bytes, bytearray)):
+            return len(value)
+        return 0
+
+    def __call__(self, method, url, params=None, files=None, **kwargs):
+        name = url.rsplit("/", 1)[-1]
+        params = params or {}
+        self.calls[name] = self.calls.get(name, 0) + 1
+        for value in (files or {}).values():
+            self.sent_bytes += self._upload_size(value)
+        if self.latency:
+            time.sleep(self.latency)
+        self._message_id += 1
+        return FakeResponse({"ok": True, "result": {
+            "message_id": self._message_id, "date": int(time.time()),
+            "chat": {"id": int(params.get("chat_id", 0)), "type": "private"}, "text": params.get("text", ""),
+        }})
@@ -0,0 +1,98 @@
+import argparse
+import threading
+import time
+from collections import Counter
+from functools import partial
+
+from benchmarks.fakes import FakeClient, FakeMarket, FakeThrottle, make_shares
+from client_pool import ClientPool
+from gateway import ApiGateway, ApiUnavailable
+
+
+def hammer(client_factory, figis, threads, seconds):
+    outcomes, latencies, lock = Counter(), [], threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def run(offset):
+        index = offset
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                with client_factory() as client:
+                    client.market_data.get_last_prices(figi=[figis[index % len(figis)]])
+                outcome = "ok"
+            except ApiUnavailable:
+                outcome = "unavailable"
+            except Exception as e:
+                outcome = getattr(getattr(e, "code", None), "name", type(e).__name__)
+            with lock:
+                outcomes[outcome] += 1
+                latencies.append(time.perf_counter() - started)
+            index += threads
+
+    workers = [threading.Thread(target=run, args=(offset,)) for offset in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    latencies.sort()
+    return outcomes, latencies[len(latencies) // 2] if latencies else 0.0, latencies[-1] if latencies else 0.0
+
+
+def report(stage, outcomes, median, worst, throttle, extra=""):
+    calls = sum(outcomes.values())
+    print(f"{stage:<22} вызовов {calls:<6} {dict(outcomes)}  отклонено сервером {throttle.rejected:<5} "
+          f"медиана {median * 1000:.1f} мс  максимум {worst * 1000:.0f} мс {extra}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Поведение шлюза Invest API при лимитах и недоступности сервера")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--limit", type=int, default=50, help="лимит сервера, запросов в секунду")
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--reset-timeout", type=float, default=1)
+    args = parser.parse_args()
+
+    shares = make_shares(100)
+    figis = [share.figi for share in shares]
+    market = FakeMarket(shares)
+    pool = ClientPool(partial(FakeClient, market), size=2, max_concurrency=args.threads)
+    gateway = ApiGateway(pool.client, quotas={"market_data": args.limit * 60 * 0.9}, burst=1, max_wait=1,
+                         backoff_base=0.05, backoff_cap=1, reset_timeout=args.reset_timeout)
+    failed = []
+
+    market.throttle = FakeThrottle(args.limit)
+    result = hammer(pool.client, figis, args.threads, args.seconds)
+    report("без шлюза", *result, market.throttle)
+
+    market.throttle = FakeThrottle(args.limit)
+    result = hammer(gateway.client, figis, args.threads, args.seconds)
+    report("через шлюз", *result, market.throttle, f"повторов {gateway.stats['retries']}")
+    if result[0]["ok"] < args.limit * args.seconds * 0.8 or market.throttle.rejected > args.limit:
+        failed.append("лимит")
+
+    market.outage = True
+    stale, rejected = gateway.stats["stale"], gateway.stats["rejected"]
+    result = hammer(gateway.client, figis, args.threads, args.seconds / 2)
+    state = gateway.breakers()["market_data"].state
+    report("сбой сервера", *result, market.throttle,
+           f"из кэша {gateway.stats['stale'] - stale}, отсечено {gateway.stats['rejected'] - rejected}, {state}")
+    if state != "open" or gateway.stats["stale"] == stale:
+        failed.append("сбой")
+
+    market.outage = False
+    time.sleep(args.reset_timeout)
+    result = hammer(gateway.client, figis, args.threads, args.seconds / 2)
+    state = gateway.breakers()["market_data"].state
+    report("восстановление", *result, market.throttle, state)
+    if state != "closed":
+        failed.append("восстановление")
+
+    print(f"статистика шлюза {gateway.stats}")
+    if failed:
+        print(f"не пройдены этапы: {', '.join(failed)}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
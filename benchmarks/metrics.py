@@ -0,0 +1,62 @@
+import argparse
+import time
+
+from metrics import Metrics, timed_client
+
+
+def noop():
+    return None
+
+
+class Services:
+    def __init__(self):
+        self.market_data = self
+
+    def get_last_prices(self, figi):
+        return figi
+
+
+class Client:
+    def __enter__(self):
+        return Services()
+
+    def __exit__(self, *exc):
+        return False
+
+
+def per_call(fn, calls):
+    started = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - started) / calls * 1_000_000
+
+
+def rpc(metrics):
+    with timed_client(Client(), metrics) as client:
+        client.market_data.get_last_prices(figi=["BBG000000001"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Накладные расходы метрик на горячих путях")
+    parser.add_argument("--calls", type=int, default=200_000)
+    args = parser.parse_args()
+
+    baseline = per_call(noop, args.calls)
+    for enabled in (False, True):
+        metrics = Metrics(enabled=enabled)
+        timed = metrics.timed("bench_seconds", noop, path="noop")
+        wrapped = per_call(timed, args.calls) - baseline
+        rpc_cost = per_call(lambda: rpc(metrics), args.calls // 10)
+        print(f"metrics {'on ' if enabled else 'off'}  timed call +{wrapped:5.2f} µs  "
+              f"rpc through client proxy {rpc_cost:5.2f} µs")
+
+    metrics = Metrics()
+    for i in range(50):
+        metrics.timed("bench_seconds", noop, path=f"p{i}")()
+    started = time.perf_counter()
+    text = metrics.render()
+    print(f"render {len(text.splitlines())} lines in {(time.perf_counter() - started) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
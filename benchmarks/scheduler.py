@@ -0,0 +1,113 @@
+import argparse
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from alerts import AlertEngine
+from benchmarks.fakes import TRADING_HOURS, FakeClient, FakeMarket, make_shares
+from instruments import InstrumentIndex
+from quotes import QuoteService
+from scheduler import AlertScheduler, TradingCalendar
+from storage import Storage
+
+STEP = 60
+DAY = 24 * 60 * 60
+START = datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp()
+
+
+class PricePaths:
+    def __init__(self, shares, days, daily_volatility, seed=1):
+        rng = np.random.default_rng(seed)
+        steps = days * DAY // STEP
+        times = START + np.arange(steps) * STEP
+        weekday = ((times - START) // DAY % 7) < 5
+        seconds = (times - START) % DAY
+        self.figis = {share.figi: i for i, share in enumerate(shares)}
+        sigma = daily_volatility / np.sqrt(30600) * np.sqrt(STEP)
+        moves = rng.normal(0, sigma, (len(shares), steps))
+        for i, share in enumerate(shares):
+            opens, closes = TRADING_HOURS[share.exchange]
+            moves[i, ~(weekday & (seconds >= opens) & (seconds < closes))] = 0
+        start = rng.uniform(10, 5000, len(shares))
+        self.paths = start[:, None] * np.exp(np.cumsum(moves, axis=1))
+
+    def apply(self, market, figis, now):
+        step = min(int((now - START) // STEP), self.paths.shape[1] - 1)
+        for figi in figis:
+            market.prices[figi] = float(self.paths[self.figis[figi], step])
+
+
+def make_alerts(shares, market, alerts_count, seed=1):
+    rng = np.random.default_rng(seed)
+    engine = AlertEngine()
+    picks = rng.integers(0, len(shares), alerts_count)
+    thresholds = rng.uniform(1, 10, alerts_count)
+    engine.load((user_id, shares[i].figi, shares[i].ticker, float(threshold), market.prices[shares[i].figi], 0)
+                for user_id, (i, threshold) in enumerate(zip(picks.tolist(), thresholds.tolist())))
+    return engine
+
+
+def simulate(strategy, shares, paths, args):
+    market = FakeMarket(shares)
+    paths.apply(market, market.prices, START)
+    calls = {}
+    client = lambda: FakeClient(market, calls=calls)
+    service = QuoteService(client)
+    alerts = make_alerts(shares, market, args.alerts)
+    clock = [START]
+    fired = [0]
+
+    def check(figis):
+        paths.apply(market, figis, clock[0])
+        quotes = service.get_last_prices(figis)
+        fired[0] += len(alerts.evaluate_many(quotes, clock[0]))
+        return quotes
+
+    end = START + args.days * DAY
+    if strategy == "fixed":
+        checked = 0
+        while clock[0] < end:
+            figis = alerts.instruments()
+            check(figis)
+            checked += len(figis)
+            clock[0] += args.interval
+        return calls, fired[0], checked, 0
+
+    storage = Storage(":memory:")
+    index = InstrumentIndex(client, storage)
+    index.refresh()
+    scheduler = AlertScheduler(check, alerts, TradingCalendar(client, storage), index,
+                               min_interval=args.min_interval, max_interval=args.max_interval)
+    scheduler.sync(alerts.instruments(), START)
+    while clock[0] < end:
+        scheduler.run_once(clock[0])
+        due = scheduler.next_due()
+        clock[0] = max(clock[0] + 1, due if due is not None else end)
+    storage.close()
+    return calls, fired[0], scheduler.checked, scheduler.skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Опрос раз в N секунд против планировщика с учётом торговых часов")
+    parser.add_argument("--shares", type=int, default=500)
+    parser.add_argument("--alerts", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--interval", type=float, default=300)
+    parser.add_argument("--min-interval", type=float, default=120)
+    parser.add_argument("--max-interval", type=float, default=900)
+    parser.add_argument("--daily-volatility", type=float, default=0.02)
+    args = parser.parse_args()
+
+    shares = make_shares(args.shares)
+    paths = PricePaths(shares, args.days, args.daily_volatility)
+    for strategy in ("fixed", "scheduled"):
+        started = time.perf_counter()
+        calls, fired, checked, deferred = simulate(strategy, shares, paths, args)
+        print(f"{strategy:<10} get_last_prices {calls.get('get_last_prices', 0):6}  "
+              f"trading_schedules {calls.get('trading_schedules', 0):3}  instrument checks {checked:8}  "
+              f"deferred while closed {deferred:6}  fired {fired:6}  ({time.perf_counter() - started:.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
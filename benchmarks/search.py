@@ -0,0 +1,57 @@
+import argparse
+import time
+
+from benchmarks.fakes import make_shares
+from instruments import Instrument
+from search import InstrumentSearch
+
+
+class StaticInstruments:
+    def __init__(self, items):
+        self.items = items
+        self.loaded_at = 1.0
+
+    def ensure_loaded(self):
+        pass
+
+    def all(self):
+        return self.items
+
+
+def typo(word):
+    return word[:1] + word[2] + word[1] + word[3:] if len(word) > 3 else word + "x"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Скорость поиска тикеров и названий компаний")
+    parser.add_argument("--instruments", type=int, default=2500)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    items = [Instrument(s.figi, s.ticker, s.name, s.currency, s.sector, s.exchange, s.lot)
+             for s in make_shares(args.instruments)]
+    search = InstrumentSearch(StaticInstruments(items))
+    started = time.perf_counter()
+    search.search("warmup")
+    print(f"build: {(time.perf_counter() - started) * 1000:.1f} ms for {len(items)} instruments")
+
+    sample = items[::max(1, len(items) // 50)]
+    cases = {
+        "exact ticker": [item.ticker for item in sample],
+        "ticker prefix": [item.ticker[:2] for item in sample],
+        "ticker typo": [typo(item.ticker) for item in sample],
+        "name prefix": [item.name[:4] for item in sample],
+        "name typo": [typo(item.name.split()[0]) for item in sample],
+        "miss": ["qqqqqq"] * len(sample),
+    }
+    for case, queries in cases.items():
+        started = time.perf_counter()
+        hits = 0
+        for i in range(args.repeat):
+            hits += bool(search.search(queries[i % len(queries)]))
+        elapsed = (time.perf_counter() - started) / args.repeat
+        print(f"{case:<14} {elapsed * 1_000_000:8.1f} µs/lookup, found {hits / args.repeat:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import argparse
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from functools import partial
+
+from benchmarks.fakes import ClockMarket, FakeClient, make_shares
+from sharding import DELIVERY_LEASE, AlertDeliveries, HashRing, LeaseCoordinator, shard_lease
+from storage import Storage
+from worker import run_worker
+
+
+def seed_alerts(storage, shares, market, count):
+    with storage.transaction() as db:
+        db.executemany("INSERT OR REPLACE INTO alerts (user_id, figi, ticker, threshold, baseline, window) "
+                       "VALUES (?, ?, ?, ?, ?, 0)",
+                       [(user_id, share.figi, share.ticker, 3 + user_id % 5, market.price(share.figi))
+                        for user_id in range(count) for share in shares[user_id % len(shares):][:1]])
+
+
+def ownership(storage, shards, now=None):
+    now = time.time() if now is None else now
+    rows = storage.query("SELECT name, owner FROM leases WHERE name LIKE 'shard:%' AND expires_at > ?", (now,))
+    owners = dict(rows)
+    return Counter(owners.get(shard_lease(shard)) for shard in range(shards))
+
+
+def deliver(storage, owner, delivered, stop, interval):
+    coordinator = LeaseCoordinator(storage, owner)
+    deliveries = AlertDeliveries(storage)
+    while not stop.is_set():
+        if coordinator.acquire(DELIVERY_LEASE):
+            delivered.extend((owner, alert) for alert in deliveries.take(coordinator))
+        stop.wait(interval)
+
+
+def pending(storage):
+    return storage.query("SELECT COUNT(*) FROM alert_deliveries WHERE delivered_at IS NULL")[0][0]
+
+
+def live_workers(storage, now=None):
+    now = time.time() if now is None else now
+    return {row[0] for row in storage.query("SELECT worker_id FROM workers WHERE expires_at > ?", (now,))}
+
+
+def wait_balanced(storage, shards, workers, timeout, gone=None):
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        alive = {worker for worker in live_workers(storage) if gone is None or gone not in worker}
+        now = time.time()
+        leases = dict(storage.query("SELECT name, owner FROM leases WHERE expires_at > ?", (now,)))
+        ring = HashRing(alive)
+        if len(alive) == workers and all(leases.get(shard_lease(shard)) == ring.owner(shard_lease(shard))
+                                         for shard in range(shards)):
+            return time.perf_counter() - started, ownership(storage, shards, now)
+        time.sleep(0.05)
+    return None, ownership(storage, shards)
+
+
+def report(stage, seconds, owners):
+    took = "не сбалансировано" if seconds is None else f"за {seconds:.1f} с"
+    shares = "  ".join(f"{owner.rsplit(':', 1)[-1] if owner else '-'}:{count}" for owner, count in sorted(
+        owners.items(), key=lambda item: str(item[0])))
+    print(f"{stage:<24} {took:<18} шарды по воркерам {shares}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Шардирование уведомлений по нескольким процессам-воркерам")
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--shares", type=int, default=200)
+    parser.add_argument("--alerts", type=int, default=2000)
+    parser.add_argument("--shards", type=int, default=16)
+    parser.add_argument("--lease-ttl", type=float, default=2)
+    parser.add_argument("--seconds", type=float, default=6)
+    args = parser.parse_args()
+
+    shares = make_shares(args.shares)
+    market = ClockMarket(shares, amplitude=0.05, period=10)
+    options = {"client_factory": partial(FakeClient, market), "shards": args.shards, "lease_ttl": args.lease_ttl,
+               "sync_interval": args.lease_ttl / 4, "min_interval": 0.2, "max_interval": 1}
+    context = multiprocessing.get_context("spawn")
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_name = os.path.join(directory, "sharding.sqlite")
+        storage = Storage(db_name)
+        seed_alerts(storage, shares, market, args.alerts)
+        delivered, stop = [], threading.Event()
+        bots = [threading.Thread(target=deliver, args=(Storage(db_name), f"bot:{i}", delivered, stop, 0.2))
+                for i in range(2)]
+        for thread in bots:
+            thread.start()
+
+        def spawn(index):
+            process = context.Process(target=run_worker, args=(db_name, index), kwargs=options, daemon=True)
+            process.start()
+            return process
+
+        processes = {index: spawn(index) for index in range(args.workers - 1)}
+        report("старт", *wait_balanced(storage, args.shards, args.workers - 1, args.seconds * 2))
+        time.sleep(args.seconds / 2)
+
+        processes[args.workers - 1] = spawn(args.workers - 1)
+        report("подключение воркера", *wait_balanced(storage, args.shards, args.workers, args.seconds * 2))
+        time.sleep(args.seconds / 2)
+
+        victim = processes.pop(0)
+        victim.kill()
+        victim.join()
+        report("падение воркера", *wait_balanced(storage, args.shards, args.workers - 1, args.lease_ttl * 4,
+                                                 gone=f":{victim.pid}:"))
+        time.sleep(args.seconds / 2)
+
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join()
+        deadline = time.perf_counter() + args.seconds
+        while pending(storage) and time.perf_counter() < deadline:
+            time.sleep(0.1)
+        stop.set()
+        for thread in bots:
+            thread.join()
+
+        left = pending(storage)
+        published = Counter(row[0].rsplit(":", 2)[-2] for row in storage.query(
+            "SELECT worker_id FROM alert_deliveries"))
+        keys = Counter((alert.user_id, alert.figi, alert.old_price) for _, alert in delivered)
+        duplicates = sum(count - 1 for count in keys.values() if count > 1)
+        by_bot = Counter(owner for owner, _ in delivered)
+        storage.close()
+
+    print(f"опубликовано по процессам {dict(published)}")
+    print(f"доставлено {len(delivered)} (по экземплярам бота {dict(by_bot)}), в очереди {left}, "
+          f"дубликатов {duplicates}")
+    if duplicates or left:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
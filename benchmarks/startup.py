@@ -0,0 +1,76 @@
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from storage import Storage, hash_password
+
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+if sys.argv[1] == "ready":
+    from benchmarks.fakes import FakeClient, FakeMarket, make_shares
+    market = FakeMarket(make_shares(int(sys.argv[3])))
+    main.create_app(token="0:bench", db_name=sys.argv[2],
+                    client_factory=lambda: FakeClient(market, float(sys.argv[4])))
+    main.start_services()
+ready = time.perf_counter()
+print(json.dumps({"import": imported - started, "ready": ready - started, "modules": len(sys.modules)}))
+"""
+
+
+def seed(db_name, users, alerts_per_user, shares):
+    Storage(db_name).close()
+    password = hash_password("bench")
+    with sqlite3.connect(db_name) as db:
+        db.executemany("INSERT INTO users (user_id, password) VALUES (?, ?)",
+                       [(user_id, password) for user_id in range(users)])
+        db.executemany("INSERT INTO portfolios (user_id, ticker) VALUES (?, ?)",
+                       [(user_id, f"T{user_id % shares}") for user_id in range(users)])
+        db.executemany("INSERT INTO alerts (user_id, figi, ticker, threshold, baseline, window) "
+                       "VALUES (?, ?, ?, ?, ?, ?)",
+                       [(user_id, f"BBG{(user_id + i) % shares:09d}", f"T{(user_id + i) % shares}", 5.0, 100.0, 0)
+                        for user_id in range(users) for i in range(alerts_per_user)])
+
+
+def run_child(mode, db_name, shares, connect_ms):
+    output = subprocess.run([sys.executable, "-c", CHILD, mode, db_name, str(shares), str(connect_ms / 1000)],
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def report(name, samples):
+    samples = sorted(samples)
+    print(f"{name:<8} median {statistics.median(samples) * 1000:7.1f} ms  "
+          f"min {samples[0] * 1000:7.1f} ms  max {samples[-1] * 1000:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Холодный старт: импорт main и готовность к обработке обновлений")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--alerts", type=int, default=3)
+    parser.add_argument("--shares", type=int, default=2000)
+    parser.add_argument("--connect-ms", type=float, default=40)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_name = os.path.join(directory, "startup.sqlite")
+        seed(db_name, args.users, args.alerts, args.shares)
+
+        imports = [run_child("import", db_name, args.shares, args.connect_ms) for _ in range(args.runs)]
+        readies = [run_child("ready", db_name, args.shares, args.connect_ms) for _ in range(args.runs)]
+
+    print(f"users {args.users}, alerts {args.users * args.alerts}, modules after import {imports[-1]['modules']}")
+    report("import", [sample["import"] for sample in imports])
+    report("ready", [sample["ready"] for sample in readies])
+
+
+if __name__ == "__main__":
+    main()
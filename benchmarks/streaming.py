@@ -0,0 +1,96 @@
+import argparse
+import os
+import tempfile
+import threading
+import time
+from functools import partial
+
+import main as app
+from benchmarks.fakes import FakeClient, FakeMarket, make_shares
+from streaming import FakeMarketDataStream, PriceStream
+
+
+def wait_for(condition, timeout):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Переход от потока цен к опросу при обрыве соединения")
+    parser.add_argument("--timeout", type=float, default=2, help="допустимая задержка реакции, секунд")
+    args = parser.parse_args()
+
+    shares = make_shares(3)
+    first, second, third = (share.figi for share in shares)
+    market = FakeMarket(shares)
+    market.trading_hours = {}
+    checks, fired, streams = [], [], []
+
+    def open_stream():
+        streams.append(FakeMarketDataStream())
+        return streams[-1]
+
+    def counted_check(figis=None):
+        checks.append(set(figis or ()))
+        return app.check_prices_once(figis)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app.create_app(token="1:bench", db_name=os.path.join(tmp, "bench.sqlite"),
+                       client_factory=partial(FakeClient, market))
+        app.notify_alerts = fired.extend
+        app.SCHEDULER.check = counted_check
+        for user_id, share in enumerate(shares[:2]):
+            app.ALERTS.add(user_id, share.figi, share.ticker, 1, market.price(share.figi))
+        app.STREAM = PriceStream(open_stream, app.on_stream_price, reconnect_delay=args.timeout * 5)
+        app.STREAM.start(app.ALERTS.instruments())
+        app.SCHEDULER.sync(app.ALERTS.instruments())
+        checker = threading.Thread(target=app.check_price_changes, daemon=True)
+
+        failures = []
+        if not wait_for(lambda: app.STREAM.connected, args.timeout):
+            raise SystemExit("FAIL: поток цен не подключился")
+        checker.start()
+        if streams[0].subscribed != {first, second}:
+            failures.append(f"подписка при подключении {sorted(streams[0].subscribed)}")
+
+        streams[0].push(first, market.price(first) * 1.05)
+        streams[0].push(third, market.price(third) * 1.05)
+        if not wait_for(lambda: fired, args.timeout) or {alert.figi for alert in fired} != {first}:
+            failures.append(f"из потока сработали {[alert.figi for alert in fired]}, ожидался {first}")
+
+        streamed = len(fired)
+        app.ALERTS.add(2, third, shares[2].ticker, 1, market.price(third))
+        app.ALERTS.remove(1, second)
+        app.sync_alert_checks()
+        if streams[0].subscribed != {first, third}:
+            failures.append(f"подписка после sync {sorted(streams[0].subscribed)}, ожидалась {[first, third]}")
+        time.sleep(0.1)
+        if checks:
+            failures.append(f"опрос при подключённом потоке: {len(checks)} проверок")
+
+        dropped = time.perf_counter()
+        streams[0].drop()
+        polled = wait_for(lambda: checks, args.timeout)
+        took = time.perf_counter() - dropped
+        if not polled:
+            failures.append(f"check_prices_once не вызван за {args.timeout:g} с после обрыва")
+        elif checks[0] != {first, third}:
+            failures.append(f"после обрыва проверены {sorted(checks[0])}, ожидались {[first, third]}")
+        print(f"подписок {len(streams)}  сработало из потока {streamed}  "
+              f"опрос после обрыва через {took * 1000:.0f} мс")
+        app.STREAM.stop()
+        app.STORAGE.close()
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        raise SystemExit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
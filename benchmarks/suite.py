@@ -0,0 +1,248 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+import telebot
+
+import main as app
+from alerts import ABOVE, BELOW, AlertEngine
+from benchmarks.fakes import FX_RATES, FakeClient, FakeMarket, FakeTelegram, make_shares
+from candles import CandleStore
+from charts import render_chart
+from export import FORMATS
+from instruments import InstrumentIndex
+from quotes import QuoteService
+from storage import Storage
+from valuation import PortfolioValuations
+
+SHARES = 2000
+ALERTS_PER_USER = 3
+CHECK_USERS = [10, 100, 1000, 10000, 100000]
+QUICK_CHECK_USERS = [10, 100, 1000, 10000]
+PORTFOLIO_SIZES = [20, 500]
+PRICE_TABLE_SIZES = [1, 20]
+REPRICE_USERS = 10000
+POSITIONS_PER_USER = 10
+LEVEL_ALERTS = 100000
+TOLERANCE = 0.25
+
+
+def measure(fn, repeat, number=1):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - started) / number)
+    return {"median": statistics.median(samples), "min": min(samples), "repeat": repeat, "number": number}
+
+
+class Bench:
+    def __init__(self, directory, quick):
+        self.directory = directory
+        self.quick = quick
+        self.market = FakeMarket(make_shares(SHARES))
+        self.telegram = FakeTelegram()
+        self.rng = random.Random(1)
+
+    def client(self):
+        return FakeClient(self.market)
+
+    def db_name(self, name):
+        return os.path.join(self.directory, f"{name}.sqlite")
+
+    def create_app(self, name):
+        if app.STORAGE is not None:
+            app.STORAGE.close()
+        app.USER_DB.clear()
+        app.USER_PORTFOLIOS.clear()
+        app.create_app(token="0:bench", db_name=self.db_name(name), client_factory=self.client)
+        app.INSTRUMENTS.refresh()
+
+    def instrument_lookup(self):
+        storage = Storage(self.db_name("instruments"))
+        index = InstrumentIndex(self.client, storage)
+        index.refresh()
+        tickers = [share.ticker.lower() for share in self.market.shares]
+        try:
+            yield "instrument_lookup", len(tickers), 20, lambda: [index.by_ticker(ticker) for ticker in tickers]
+        finally:
+            storage.close()
+
+    def quote_parsing(self):
+        service = QuoteService(self.client)
+        figis = [share.figi for share in self.market.shares]
+        yield "quote_parsing", len(figis), 20, lambda: service.get_last_prices(figis)
+
+    def check_cycle(self):
+        for users in QUICK_CHECK_USERS if self.quick else CHECK_USERS:
+            self.create_app(f"check_{users}")
+            shares = self.market.shares
+            rows = []
+            for user_id in range(users):
+                for share in self.rng.sample(shares, ALERTS_PER_USER):
+                    rows.append((user_id, share.figi, share.ticker, self.rng.uniform(1, 10),
+                                 self.market.prices[share.figi], 0))
+            app.ALERTS.load(rows)
+
+            def cycle():
+                self.market.tick(0.05)
+                app.check_prices_once()
+                app.STORAGE.flush()
+
+            yield f"check_cycle_{users}", len(rows), 5, cycle
+
+    def portfolio_setup(self, name, size):
+        self.create_app(name)
+        user_id = 1
+        tickers = [share.ticker for share in self.market.shares[:size]]
+        app.USER_PORTFOLIOS[user_id] = dict.fromkeys(tickers, 1)
+        app.STORAGE.executemany("INSERT INTO portfolios (user_id, ticker) VALUES (?, ?)",
+                                [(user_id, ticker) for ticker in tickers])
+        app.load_valuations()
+        return SimpleNamespace(chat=SimpleNamespace(id=user_id))
+
+    def portfolio_valuation(self):
+        for size in PORTFOLIO_SIZES:
+            message = self.portfolio_setup(f"portfolio_{size}", size)
+            yield f"portfolio_valuation_{size}", size, 20, lambda: app.show_full_portfolio(message.chat.id)
+
+    def portfolio_repricing(self):
+        valuations = PortfolioValuations()
+        shares = self.market.shares
+        for user_id in range(REPRICE_USERS):
+            for share in self.rng.sample(shares, POSITIONS_PER_USER):
+                valuations.set_position(user_id, share.figi, share.currency, self.rng.randint(1, 100))
+        ticks = []
+        for _ in range(2):
+            self.market.tick(0.01)
+            ticks.append(dict(self.market.prices))
+        valuations.update(ticks[0], FX_RATES)
+        figi = shares[0].figi
+        next_tick = itertools.cycle(ticks).__next__
+        yield f"portfolio_reprice_all_{len(valuations)}", len(valuations), 20, \
+            lambda: valuations.update(next_tick())
+        yield f"portfolio_reprice_one_{len(valuations)}", 1, 20, \
+            lambda: valuations.update({figi: ticks[0][figi] * self.rng.uniform(0.99, 1.01)})
+
+    def level_alerts(self):
+        engine = AlertEngine()
+        shares = self.market.shares
+        rows = []
+        for user_id in range(LEVEL_ALERTS):
+            share = shares[user_id % len(shares)]
+            direction = self.rng.choice((ABOVE, BELOW))
+            offset = self.rng.uniform(0.05, 0.3)
+            price = self.market.prices[share.figi]
+            rows.append((user_id, share.figi, share.ticker, price * (1 + offset if direction == ABOVE else 1 - offset),
+                         direction))
+        engine.load_levels(rows)
+        ticks = []
+        for _ in range(2):
+            self.market.tick(0.01)
+            ticks.append({figi: SimpleNamespace(price=price) for figi, price in self.market.prices.items()})
+        next_tick = itertools.cycle(ticks).__next__
+        yield f"level_check_{LEVEL_ALERTS}", len(engine), 20, lambda: engine.evaluate_many(next_tick())
+
+    def charts(self):
+        storage = Storage(self.db_name("candles"))
+        calls = {}
+        store = CandleStore(lambda: FakeClient(self.market, calls=calls), storage)
+        figi = self.market.shares[0].figi
+        try:
+            candles = store.chart(figi, "1y")
+            yield "chart_cached_1y", len(candles.times), 20, lambda: store.chart(figi, "1y")
+            yield "chart_render_1y", len(candles.times), 5, lambda: render_chart(candles, "bench", "rub")
+        finally:
+            storage.close()
+
+    def price_table(self):
+        self.create_app("price_table")
+        app.QUOTE_CACHE.ttl = 0
+        for size in PRICE_TABLE_SIZES:
+            tickers = [share.ticker for share in self.market.shares[:size]]
+            yield f"find_price_{size}", size, 20, lambda: app.send_price_table(1, tickers)
+
+    def export(self):
+        for size in PORTFOLIO_SIZES:
+            message = self.portfolio_setup(f"export_{size}", size)
+            for export_format in FORMATS:
+                yield f"export_{export_format}_{size}", size, 10, \
+                    lambda: app.send_export(message, export_format, export_format)
+
+
+CASES = ["instrument_lookup", "quote_parsing", "check_cycle", "portfolio_valuation", "portfolio_repricing", "level_alerts",
+         "charts", "price_table", "export"]
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get("results", {}).get(name)
+        if before is None:
+            continue
+        ratio = result["median"] / before["median"]
+        result["baseline"] = before["median"]
+        result["ratio"] = ratio
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Набор микробенчмарков на фейковых Invest API и Bot API")
+    parser.add_argument("--quick", action="store_true", help="без прогона на 100k пользователей")
+    parser.add_argument("--filter", default="", help="запускать только кейсы, содержащие подстроку")
+    parser.add_argument("--json", help="куда записать результаты в JSON")
+    parser.add_argument("--baseline", help="JSON с эталонными результатами для сравнения")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        bench = Bench(directory, args.quick)
+        telebot.apihelper.CUSTOM_REQUEST_SENDER = bench.telegram
+        for case in CASES:
+            for name, items, repeat, fn in getattr(bench, case)():
+                if args.filter not in name:
+                    continue
+                result = measure(fn, repeat)
+                result["items"] = items
+                results[name] = result
+                print(f"{name:<28} median {result['median'] * 1000:9.3f} ms  "
+                      f"min {result['min'] * 1000:9.3f} ms  items {items}", flush=True)
+        if app.STORAGE is not None:
+            app.STORAGE.close()
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for name in regressions:
+            print(f"РЕГРЕССИЯ {name}: {results[name]['ratio']:.2f}x от эталона")
+
+    if args.json:
+        report = {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "quick": args.quick,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "results": results,
+            "regressions": regressions,
+        }
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+
+from webhook import SECRET_HEADER, WebhookServer
+
+SECRET = "bench-secret"
+
+
+def fake_update(update_id, chat_id):
+    return {"update_id": update_id, "message": {"message_id": update_id, "date": int(time.time()),
+                                                 "chat": {"id": chat_id, "type": "private"}, "text": "/help"}}
+
+
+def post(url, payload, secret=SECRET):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode(), method="POST",
+                                     headers={"Content-Type": "application/json", SECRET_HEADER: secret})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def fill_queue(url, updates):
+    for update_id in range(updates):
+        if post(url, fake_update(update_id, update_id % 100)) == 429:
+            return update_id
+    return updates
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Фейковый Telegram отправляет обновления в локальный webhook")
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--senders", type=int, default=8)
+    parser.add_argument("--handler-ms", type=float, default=0.0)
+    parser.add_argument("--max-queue", type=int, default=1000)
+    parser.add_argument("--timeout", type=float, default=30)
+    args = parser.parse_args()
+
+    handled = []
+    batches = []
+    gate = threading.Event()
+
+    def on_updates(batch):
+        gate.wait()
+        batches.append(len(batch))
+        if args.handler_ms:
+            time.sleep(args.handler_ms / 1000 * len(batch))
+        handled.extend(batch)
+
+    server = WebhookServer(on_updates, SECRET, host="127.0.0.1", port=0, max_queue=args.max_queue)
+    server.serve_in_background()
+    url = f"http://127.0.0.1:{server.address[1]}/webhook"
+    failures = []
+
+    forbidden = post(url, fake_update(0, 0), secret="wrong")
+    if forbidden != 403:
+        failures.append(f"неверный секрет -> {forbidden}, ожидался 403")
+
+    first_rejected = fill_queue(url, args.updates)
+    if first_rejected == args.updates or server.rejected == 0:
+        failures.append(f"полная очередь ни разу не ответила 429 за {args.updates} обновлений")
+    gate.set()
+
+    statuses = {}
+    lock = threading.Lock()
+
+    def sender(offset):
+        for update_id in range(first_rejected + offset, args.updates, args.senders):
+            while True:
+                status = post(url, fake_update(update_id, update_id % 100))
+                with lock:
+                    statuses[status] = statuses.get(status, 0) + 1
+                if status != 429:
+                    break
+                time.sleep(0.01)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=sender, args=(i,)) for i in range(args.senders)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    deadline = time.perf_counter() + args.timeout
+    while len(handled) < args.updates and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    time.sleep(0.1)
+    server.shutdown()
+
+    delivered = Counter(update["update_id"] for update in handled)
+    duplicates = sorted(update_id for update_id, count in delivered.items() if count > 1)
+    missing = sorted(set(range(args.updates)) - set(delivered))
+    if duplicates:
+        failures.append(f"доставлены повторно: {len(duplicates)}, например {duplicates[:5]}")
+    if missing:
+        failures.append(f"не доставлены: {len(missing)}, например {missing[:5]}")
+    if set(statuses) - {200, 429}:
+        failures.append(f"неожиданные ответы сервера: {statuses}")
+
+    print(f"updates: {len(handled)} in {elapsed:.2f} s ({len(handled) / elapsed:.0f}/s)")
+    print(f"statuses: {statuses}, wrong secret -> {forbidden}, full queue -> 429 after {first_rejected}")
+    if batches:
+        print(f"batches: {len(batches)}, mean size {sum(batches) / len(batches):.1f}, max {max(batches)}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        raise SystemExit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
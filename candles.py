@@ -0,0 +1,204 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timezone
+
+import numpy as np
+
+from quotes import quotation_to_float
+
+DAY = 24 * 60 * 60
+CANDLE_INTERVALS = {
+    "5min": ("CANDLE_INTERVAL_5_MIN", 5 * 60, DAY),
+    "hour": ("CANDLE_INTERVAL_HOUR", 60 * 60, 7 * DAY),
+    "day": ("CANDLE_INTERVAL_DAY", DAY, 365 * DAY),
+}
+CHART_PERIODS = {
+    "1d": (DAY, "5min"),
+    "1w": (7 * DAY, "hour"),
+    "1m": (30 * DAY, "hour"),
+    "3m": (91 * DAY, "day"),
+    "6m": (182 * DAY, "day"),
+    "1y": (365 * DAY, "day"),
+}
+DEFAULT_PERIOD = "1m"
+SERIES_CACHE_SIZE = 256
+TAIL_TTL = 60
+
+Candles = namedtuple("Candles", ["times", "open", "high", "low", "close", "volume"])
+
+
+def candle_interval(name):
+    try:
+        from tinkoff.invest import CandleInterval
+    except ImportError:
+        return name
+    return CandleInterval[name]
+
+
+def _timestamp(value):
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _datetime(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc)
+
+
+def _empty():
+    return Candles(np.zeros(0), np.zeros(0), np.zeros(0), np.zeros(0), np.zeros(0), np.zeros(0))
+
+
+def merge_ranges(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(item) for item in merged]
+
+
+def missing_ranges(ranges, start, end):
+    missing = []
+    for covered_start, covered_end in ranges:
+        if covered_end <= start:
+            continue
+        if covered_start >= end:
+            break
+        if covered_start > start:
+            missing.append((start, covered_start))
+        start = max(start, covered_end)
+    if start < end:
+        missing.append((start, end))
+    return missing
+
+
+class CandleStore:
+    def __init__(self, client_factory, storage, cache_size=SERIES_CACHE_SIZE, tail_ttl=TAIL_TTL):
+        self.client_factory = client_factory
+        self.storage = storage
+        self.cache_size = cache_size
+        self.tail_ttl = tail_ttl
+        self.requests = 0
+        self._series = OrderedDict()
+        self._ranges = {}
+        self._tails = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+        with self.storage.transaction() as db:
+            db.execute('''CREATE TABLE IF NOT EXISTS candles (
+                figi TEXT,
+                interval TEXT,
+                time REAL,
+                open REAL,
+                high REAL,
+                low REAL,
+                close REAL,
+                volume REAL,
+                PRIMARY KEY (figi, interval, time)
+            ) WITHOUT ROWID''')
+            db.execute('''CREATE TABLE IF NOT EXISTS candle_ranges (
+                figi TEXT,
+                interval TEXT,
+                start_time REAL,
+                end_time REAL,
+                PRIMARY KEY (figi, interval, start_time)
+            )''')
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _covered(self, key):
+        ranges = self._ranges.get(key)
+        if ranges is None:
+            ranges = self._ranges[key] = [tuple(row) for row in self.storage.query(
+                "SELECT start_time, end_time FROM candle_ranges WHERE figi = ? AND interval = ? ORDER BY start_time",
+                key)]
+        return ranges
+
+    def _fetch(self, figi, interval, start, end):
+        name, _, limit = CANDLE_INTERVALS[interval]
+        rows = []
+        with self.client_factory() as client:
+            for chunk_start in range(int(start), int(end), limit):
+                response = client.market_data.get_candles(figi=figi, from_=_datetime(chunk_start),
+                                                          to=_datetime(min(end, chunk_start + limit)),
+                                                          interval=candle_interval(name))
+                self.requests += 1
+                rows.extend((_timestamp(candle.time), quotation_to_float(candle.open),
+                             quotation_to_float(candle.high), quotation_to_float(candle.low),
+                             quotation_to_float(candle.close), float(candle.volume))
+                            for candle in response.candles)
+        return rows
+
+    def _save(self, key, rows, ranges):
+        try:
+            with self.storage.transaction() as db:
+                db.executemany("INSERT OR REPLACE INTO candles (figi, interval, time, open, high, low, close, volume) "
+                               "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [(*key, *row) for row in rows])
+                db.execute("DELETE FROM candle_ranges WHERE figi = ? AND interval = ?", key)
+                db.executemany("INSERT INTO candle_ranges (figi, interval, start_time, end_time) VALUES (?, ?, ?, ?)",
+                               [(*key, *item) for item in ranges])
+        except sqlite3.Error as e:
+            print(f"Ошибка базы данных: {e}")
+
+    def _load(self, key):
+        series = self._series.get(key)
+        if series is None:
+            rows = self.storage.query("SELECT time, open, high, low, close, volume FROM candles "
+                                      "WHERE figi = ? AND interval = ? ORDER BY time", key)
+            series = Candles(*np.array(rows, dtype=float).reshape(-1, 6).T) if rows else _empty()
+        self._remember(key, series)
+        return series
+
+    def _remember(self, key, series):
+        with self._lock:
+            self._series[key] = series
+            self._series.move_to_end(key)
+            while len(self._series) > self.cache_size:
+                self._series.popitem(last=False)
+
+    @staticmethod
+    def _merge(series, rows):
+        if not rows:
+            return series
+        new = np.array(rows, dtype=float).T
+        columns = [np.concatenate((old, fresh)) for old, fresh in zip(series, new)]
+        times = columns[0][::-1]
+        _, last = np.unique(times, return_index=True)
+        keep = len(times) - 1 - last
+        return Candles(*(column[keep] for column in columns))
+
+    def get(self, figi, interval, start, end, now=None):
+        now = time.time() if now is None else now
+        step = CANDLE_INTERVALS[interval][1]
+        start = start // step * step
+        complete = min(end, now // step * step)
+        key = (figi, interval)
+        with self._key_lock(key):
+            ranges = self._covered(key)
+            missing = missing_ranges(ranges, start, end)
+            if missing and missing[0][0] >= complete and now - self._tails.get(key, 0.0) < self.tail_ttl:
+                missing = []
+            series = self._load(key)
+            if missing:
+                self._tails[key] = now
+                rows = [row for gap in missing for row in self._fetch(figi, interval, *gap)]
+                ranges = merge_ranges(ranges + [(gap_start, min(gap_end, complete)) for gap_start, gap_end in missing
+                                                if gap_start < min(gap_end, complete)])
+                self._ranges[key] = ranges
+                self._save(key, rows, ranges)
+                series = self._merge(series, rows)
+                self._remember(key, series)
+        first, last = np.searchsorted(series.times, [start, end])
+        return Candles(*(column[first:last] for column in series))
+
+    def chart(self, figi, period=DEFAULT_PERIOD, now=None):
+        now = time.time() if now is None else now
+        length, interval = CHART_PERIODS[period]
+        return self.get(figi, interval, now - length, now, now)
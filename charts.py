@@ -0,0 +1,24 @@
+import io
+from datetime import datetime, timezone
+
+CHART_SIZE = (8, 4.5)
+CHART_DPI = 100
+
+
+def render_chart(candles, title, currency):
+    from matplotlib import dates
+    from matplotlib.figure import Figure
+
+    times = [datetime.fromtimestamp(value, timezone.utc) for value in candles.times.tolist()]
+    figure = Figure(figsize=CHART_SIZE, dpi=CHART_DPI, layout="tight")
+    axes = figure.subplots()
+    axes.fill_between(times, candles.low, candles.high, color="tab:blue", alpha=0.15, linewidth=0)
+    axes.plot(times, candles.close, color="tab:blue", linewidth=1.2)
+    axes.set_title(title)
+    axes.set_ylabel(currency)
+    axes.grid(True, alpha=0.3)
+    axes.xaxis.set_major_formatter(dates.ConciseDateFormatter(axes.xaxis.get_major_locator()))
+    out = io.BytesIO()
+    figure.savefig(out, format="png")
+    out.seek(0)
+    return out
@@ -0,0 +1,109 @@
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+POOL_SIZE = 2
+MAX_CONCURRENCY = 8
+HEALTH_CHECK_INTERVAL = 60
+RECONNECT_CODES = ("UNAVAILABLE", "CANCELLED", "DEADLINE_EXCEEDED")
+
+
+def is_connection_error(error):
+    if isinstance(error, (ConnectionError, OSError)):
+        return True
+    code = getattr(error, "code", None)
+    if callable(code):
+        code = code()
+    return getattr(code, "name", None) in RECONNECT_CODES
+
+
+def new_invest_client():
+    from tinkoff.invest import Client
+    return Client(os.getenv("API_TOKEN_INVEST"))
+
+
+def default_health_check(services):
+    services.users.get_info()
+
+
+class _Connection:
+    def __init__(self, factory):
+        self.factory = factory
+        self.client = None
+        self.services = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        with self.lock:
+            if self.services is None:
+                client = self.factory()
+                self.services = client.__enter__()
+                self.client = client
+            return self.services
+
+    def reset(self):
+        with self.lock:
+            client, self.client, self.services = self.client, None, None
+        if client is not None:
+            try:
+                client.__exit__(None, None, None)
+            except Exception as e:
+                print(f"Ошибка закрытия соединения с Invest API: {e}")
+
+
+class ClientPool:
+    def __init__(self, client_factory, size=POOL_SIZE, max_concurrency=MAX_CONCURRENCY,
+                 health_check=default_health_check, health_interval=HEALTH_CHECK_INTERVAL):
+        self.client_factory = client_factory
+        self.health_check = health_check
+        self.health_interval = health_interval
+        self._connections = [_Connection(client_factory) for _ in range(size)]
+        self._next = itertools.cycle(self._connections)
+        self._next_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._thread = None
+
+    def _pick(self):
+        with self._next_lock:
+            return next(self._next)
+
+    @contextmanager
+    def client(self):
+        with self._slots:
+            connection = self._pick()
+            try:
+                yield connection.get()
+            except Exception as e:
+                if is_connection_error(e):
+                    connection.reset()
+                raise
+
+    def check(self):
+        healthy = 0
+        for connection in self._connections:
+            if connection.services is None:
+                continue
+            try:
+                with self._slots:
+                    self.health_check(connection.services)
+                healthy += 1
+            except Exception as e:
+                print(f"Соединение с Invest API не отвечает, переподключаемся: {e}")
+                connection.reset()
+        return healthy
+
+    def _health_loop(self):
+        while True:
+            time.sleep(self.health_interval)
+            self.check()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._health_loop, daemon=True)
+            self._thread.start()
+
+    def close(self):
+        for connection in self._connections:
+            connection.reset()
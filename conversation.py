@@ -0,0 +1,117 @@
+import json
+import threading
+import time
+
+STATE_TTL = 15 * 60
+
+
+class MemoryStateStore:
+    def __init__(self, ttl=STATE_TTL):
+        self.ttl = ttl
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def get(self, chat_id, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._states.get(chat_id)
+            if entry is None:
+                return None
+            if entry[2] <= now:
+                del self._states[chat_id]
+                return None
+            return entry[0], entry[1]
+
+    def set(self, chat_id, state, data=(), now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            self._states[chat_id] = (state, list(data), now + self.ttl)
+
+    def clear(self, chat_id):
+        with self._lock:
+            return self._states.pop(chat_id, None) is not None
+
+    def purge(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            expired = [chat_id for chat_id, entry in self._states.items() if entry[2] <= now]
+            for chat_id in expired:
+                del self._states[chat_id]
+        return len(expired)
+
+    def __len__(self):
+        return len(self._states)
+
+
+class SqliteStateStore:
+    def __init__(self, storage, ttl=STATE_TTL):
+        self.storage = storage
+        self.ttl = ttl
+        self._next_purge = 0.0
+
+        with self.storage.transaction() as db:
+            db.execute('''CREATE TABLE IF NOT EXISTS conversation_states (
+                chat_id INTEGER PRIMARY KEY,
+                state TEXT,
+                data TEXT,
+                expires_at REAL
+            )''')
+            db.execute("CREATE INDEX IF NOT EXISTS conversation_states_expires ON conversation_states (expires_at)")
+
+    def get(self, chat_id, now=None):
+        now = time.time() if now is None else now
+        rows = self.storage.query("SELECT state, data FROM conversation_states WHERE chat_id = ? AND expires_at > ?",
+                                  (chat_id, now))
+        if not rows:
+            return None
+        return rows[0][0], json.loads(rows[0][1])
+
+    def set(self, chat_id, state, data=(), now=None):
+        now = time.time() if now is None else now
+        self.storage.execute("INSERT OR REPLACE INTO conversation_states (chat_id, state, data, expires_at) "
+                             "VALUES (?, ?, ?, ?)",
+                             (chat_id, state, json.dumps(list(data), separators=(",", ":")), now + self.ttl))
+        if now >= self._next_purge:
+            self._next_purge = now + self.ttl
+            self.purge(now)
+
+    def clear(self, chat_id):
+        return self.storage.execute("DELETE FROM conversation_states WHERE chat_id = ?", (chat_id,)) > 0
+
+    def purge(self, now=None):
+        now = time.time() if now is None else now
+        return self.storage.execute("DELETE FROM conversation_states WHERE expires_at <= ?", (now,))
+
+    def __len__(self):
+        return self.storage.query("SELECT COUNT(*) FROM conversation_states WHERE expires_at > ?",
+                                  (time.time(),))[0][0]
+
+
+class Conversation:
+    def __init__(self, store):
+        self.store = store
+        self._steps = {}
+
+    def register(self, name, handler):
+        self._steps[name] = handler
+
+    def expect(self, chat_id, step, *args):
+        if step.__name__ not in self._steps:
+            raise KeyError(step.__name__)
+        self.store.set(chat_id, step.__name__, args)
+
+    def pending(self, chat_id):
+        return self.store.get(chat_id) is not None
+
+    def resume(self, message):
+        entry = self.store.get(message.chat.id)
+        if entry is None:
+            return False
+        state, data = entry
+        self.store.clear(message.chat.id)
+        handler = self._steps.get(state)
+        if handler is None:
+            print(f"Неизвестное состояние диалога {state} для чата {message.chat.id}")
+            return False
+        handler(message, *data)
+        return True
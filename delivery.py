@@ -0,0 +1,140 @@
+import heapq
+import itertools
+import threading
+import time
+
+from ratelimit import TokenBucket
+
+GLOBAL_RATE = 30
+CHAT_RATE = 1
+SENDERS = 4
+MAX_MESSAGE_LENGTH = 4096
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 1
+
+
+def retry_after(error):
+    if getattr(error, "error_code", None) != 429:
+        return None
+    parameters = (getattr(error, "result_json", None) or {}).get("parameters") or {}
+    return parameters.get("retry_after", RETRY_DELAY)
+
+
+def is_permanent(error):
+    return getattr(error, "error_code", None) in (400, 403)
+
+
+class Outbox:
+    def __init__(self, send, senders=SENDERS, global_rate=GLOBAL_RATE, chat_rate=CHAT_RATE,
+                 max_length=MAX_MESSAGE_LENGTH):
+        self.send = send
+        self.senders = senders
+        self.chat_rate = chat_rate
+        self.max_length = max_length
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self._global = TokenBucket(global_rate)
+        self._chat_buckets = {}
+        self._pending = {}
+        self._attempts = {}
+        self._scheduled = []
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+        self._threads = []
+
+    def enqueue(self, chat_id, text):
+        with self._condition:
+            texts = self._pending.get(chat_id)
+            if texts is None:
+                self._pending[chat_id] = [text]
+                self._schedule(chat_id, 0)
+            else:
+                texts.append(text)
+
+    def _schedule(self, chat_id, delay):
+        heapq.heappush(self._scheduled, (time.monotonic() + delay, next(self._order), chat_id))
+        self._condition.notify()
+
+    def pending(self):
+        with self._condition:
+            return sum(len(texts) for texts in self._pending.values())
+
+    def _next_chat(self):
+        with self._condition:
+            while True:
+                if self._scheduled:
+                    wait = self._scheduled[0][0] - time.monotonic()
+                    if wait <= 0:
+                        return heapq.heappop(self._scheduled)[2]
+                    self._condition.wait(wait)
+                else:
+                    self._condition.wait()
+
+    def _take(self, chat_id):
+        with self._condition:
+            texts = self._pending[chat_id]
+            taken, length = [], 0
+            while texts and (not taken or length + len(texts[0]) + 2 <= self.max_length):
+                length += len(texts[0]) + 2
+                taken.append(texts.pop(0))
+            return taken
+
+    def _finish(self, chat_id, taken=None, delay=0):
+        with self._condition:
+            texts = self._pending[chat_id]
+            if taken:
+                texts[:0] = taken
+            if texts:
+                self._schedule(chat_id, delay)
+            else:
+                del self._pending[chat_id]
+                self._attempts.pop(chat_id, None)
+
+    def _chat_bucket(self, chat_id):
+        with self._condition:
+            bucket = self._chat_buckets.get(chat_id)
+            if bucket is None:
+                if len(self._chat_buckets) > 10000:
+                    for idle_chat in [c for c, b in self._chat_buckets.items() if b.idle()]:
+                        del self._chat_buckets[idle_chat]
+                bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, 1)
+            return bucket
+
+    def _deliver(self, chat_id):
+        wait = self._chat_bucket(chat_id).try_acquire()
+        if wait:
+            return self._finish(chat_id, delay=wait)
+
+        taken = self._take(chat_id)
+        self._global.acquire()
+        try:
+            self.send(chat_id, "\n\n".join(taken))
+        except Exception as e:
+            delay = retry_after(e)
+            attempts = self._attempts.get(chat_id, 0) + 1
+            if is_permanent(e) or (delay is None and attempts >= MAX_ATTEMPTS):
+                print(f"Не удалось доставить сообщение пользователю {chat_id}: {e}")
+                self.dropped += len(taken)
+                return self._finish(chat_id)
+            self._attempts[chat_id] = attempts
+            return self._finish(chat_id, taken, delay if delay is not None else RETRY_DELAY * 2 ** attempts)
+
+        self.sent += 1
+        self.coalesced += len(taken) - 1
+        self._attempts.pop(chat_id, None)
+        self._finish(chat_id)
+
+    def _work(self):
+        while True:
+            chat_id = self._next_chat()
+            try:
+                self._deliver(chat_id)
+            except Exception as e:
+                print(f"Ошибка отправки сообщений пользователю {chat_id}: {e}")
+
+    def start(self):
+        while len(self._threads) < self.senders:
+            thread = threading.Thread(target=self._work, daemon=True)
+            thread.start()
+            self._threads.append(thread)
@@ -0,0 +1,78 @@
+import queue
+import threading
+from collections import deque
+
+WORKERS = 8
+MAX_PENDING = 1000
+
+
+def update_chat_id(update):
+    for name in ("message", "edited_message", "channel_post", "edited_channel_post"):
+        message = getattr(update, name, None)
+        if message is not None:
+            return message.chat.id
+    callback_query = getattr(update, "callback_query", None)
+    if callback_query is not None:
+        return callback_query.from_user.id
+    return ("update", update.update_id)
+
+
+class ChatDispatcher:
+    def __init__(self, handler, workers=WORKERS, max_pending=MAX_PENDING):
+        self.handler = handler
+        self.workers = workers
+        self._pending = {}
+        self._ready = queue.Queue()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._threads = []
+
+    def pending(self):
+        with self._lock:
+            return sum(len(items) for items in self._pending.values())
+
+    def submit(self, key, item, timeout=None):
+        if not self._slots.acquire(timeout=timeout):
+            return False
+        with self._lock:
+            items = self._pending.get(key)
+            if items is None:
+                self._pending[key] = deque([item])
+                self._ready.put(key)
+            else:
+                items.append(item)
+        return True
+
+    def _work(self):
+        while True:
+            key = self._ready.get()
+            if key is None:
+                return
+            with self._lock:
+                item = self._pending[key][0]
+            try:
+                self.handler(item)
+            except Exception as e:
+                print(f"Ошибка обработки обновления для {key}: {e}")
+            finally:
+                with self._lock:
+                    items = self._pending[key]
+                    items.popleft()
+                    if items:
+                        self._ready.put(key)
+                    else:
+                        del self._pending[key]
+                self._slots.release()
+
+    def start(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        for _ in self._threads:
+            self._ready.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
@@ -0,0 +1,109 @@
+import csv
+import gzip
+import io
+import tempfile
+from collections import namedtuple
+from datetime import datetime
+
+from quotes import format_price
+
+ExportRow = namedtuple("ExportRow", ["ticker", "quantity", "name", "price", "currency", "sector"])
+
+SPOOL_MAX_SIZE = 1 << 20
+GZIP_ROWS = 200
+SQL_INSERT_BATCH = 500
+ENCODING = "utf-16"
+
+
+def portfolio_snapshot(positions, instruments, quotes):
+    stocks = [(stock_info, quantity) for stock_info, quantity in
+              ((instruments.by_ticker(ticker), quantity) for ticker, quantity in positions.items())
+              if stock_info is not None]
+    prices = quotes.get_last_prices([stock_info.figi for stock_info, _ in stocks])
+    rows = []
+    for stock_info, quantity in stocks:
+        quote = prices.get(stock_info.figi)
+        rows.append(ExportRow(stock_info.ticker, quantity, stock_info.name, quote.price if quote else None,
+                              stock_info.currency, stock_info.sector))
+    return rows
+
+
+def _price_text(price):
+    return format_price(price) if price is not None else "N/A"
+
+
+def _quantity_text(quantity):
+    return f"{quantity:g}"
+
+
+def write_txt(out, rows, exported_at, user_id):
+    line = "{:<10} {:<12} {:<30} {:<15} {:<10} {:<20}\n"
+    out.write(f"Портфель пользователя на {exported_at}\n\n")
+    out.write(line.format("Тикер", "Количество", "Название", "Цена", "Валюта", "Сектор"))
+    out.write("-" * 98 + "\n")
+    for row in rows:
+        out.write(line.format(row.ticker, _quantity_text(row.quantity), row.name or "N/A", _price_text(row.price),
+                              row.currency or "N/A", row.sector or "N/A"))
+
+
+def write_csv(out, rows, exported_at, user_id):
+    writer = csv.writer(out)
+    writer.writerow(["Тикер", "Количество", "Название", "Цена", "Валюта", "Сектор", "Дата экспорта"])
+    writer.writerows([row.ticker, _quantity_text(row.quantity), row.name or "N/A", _price_text(row.price),
+                      row.currency or "N/A", row.sector or "N/A", exported_at] for row in rows)
+
+
+def sql_literal(value):
+    if value is None or value == "":
+        return "NULL"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def write_sql(out, rows, exported_at, user_id, batch=SQL_INSERT_BATCH):
+    out.write(f"-- Экспорт портфеля пользователя {user_id}\n"
+              f"-- Дата экспорта: {exported_at}\n\n"
+              "CREATE TABLE IF NOT EXISTS exported_portfolio (\n"
+              "    ticker TEXT PRIMARY KEY,\n"
+              "    quantity REAL,\n"
+              "    name TEXT,\n"
+              "    price REAL,\n"
+              "    currency TEXT,\n"
+              "    sector TEXT,\n"
+              "    export_date TEXT\n);\n")
+    date = sql_literal(exported_at)
+    for start in range(0, len(rows), batch):
+        out.write("\nINSERT INTO exported_portfolio (ticker, quantity, name, price, currency, sector, export_date) "
+                  "VALUES\n")
+        out.write(",\n".join(
+            f"    ({sql_literal(row.ticker)}, {sql_literal(row.quantity)}, {sql_literal(row.name)}, "
+            f"{sql_literal(row.price)}, {sql_literal(row.currency)}, {sql_literal(row.sector)}, {date})"
+            for row in rows[start:start + batch]
+        ))
+        out.write(";\n")
+
+
+FORMATS = {
+    "txt": ("portfolio.txt", write_txt),
+    "csv": ("portfolio.csv", write_csv),
+    "sql": ("portfolio.sql", write_sql),
+}
+
+
+def render_export(export_format, rows, user_id, gzip_rows=GZIP_ROWS, exported_at=None):
+    filename, writer = FORMATS[export_format]
+    exported_at = exported_at or datetime.now().strftime('%Y-%m-%d %H:%M')
+    compress = gzip_rows is not None and len(rows) >= gzip_rows
+
+    document = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    raw = gzip.GzipFile(filename=filename, fileobj=document, mode="wb") if compress else document
+    out = io.TextIOWrapper(raw, encoding=ENCODING, newline="")
+    writer(out, rows, exported_at, user_id)
+    out.flush()
+    out.detach()
+    if compress:
+        raw.close()
+        filename += ".gz"
+    document.seek(0)
+    return filename, document
@@ -0,0 +1,227 @@
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from client_pool import is_connection_error
+from ratelimit import TokenBucket
+
+API_QUOTAS = {"instruments": 200, "market_data": 600, "users": 100, "operations": 200}
+QUOTA_PERIOD = 60
+BURST_SECONDS = 5
+MAX_WAIT = 5
+RETRIES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 10
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 30
+STALE_SIZE = 1000
+RETRY_CODES = ("RESOURCE_EXHAUSTED", "UNAVAILABLE")
+
+
+class ApiUnavailable(Exception):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ThrottledError(ApiUnavailable):
+    pass
+
+
+class CircuitOpenError(ApiUnavailable):
+    pass
+
+
+def error_code(error):
+    code = getattr(error, "code", None)
+    if callable(code):
+        code = code()
+    return getattr(code, "name", code)
+
+
+def is_retryable(error):
+    return error_code(error) in RETRY_CODES or is_connection_error(error)
+
+
+def retry_delay(attempt, error, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    reset = getattr(getattr(error, "metadata", None), "ratelimit_reset", None)
+    return max(delay, min(cap, reset)) if reset else delay
+
+
+class CircuitBreaker:
+    def __init__(self, threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return 0.0
+            wait = self.opened_at + self.reset_timeout - time.monotonic()
+            if wait > 0:
+                return wait
+            if self._trial:
+                return self.reset_timeout
+            self._trial = True
+            return 0.0
+
+    def abandon(self):
+        with self._lock:
+            self._trial = False
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+
+class _Service:
+    def __init__(self, gateway, name):
+        self._gateway = gateway
+        self._name = name
+
+    def __getattr__(self, method):
+        gateway, service = self._gateway, self._name
+
+        def call(*args, **kwargs):
+            return gateway.call(service, method, args, kwargs)
+
+        setattr(self, method, call)
+        return call
+
+
+class _Services:
+    def __init__(self, gateway):
+        self._gateway = gateway
+
+    def __getattr__(self, name):
+        service = _Service(self._gateway, name)
+        setattr(self, name, service)
+        return service
+
+
+class ApiGateway:
+    def __init__(self, client_factory, quotas=API_QUOTAS, scale=1.0, burst=BURST_SECONDS, max_wait=MAX_WAIT,
+                 retries=RETRIES, backoff_base=BACKOFF_BASE, backoff_cap=BACKOFF_CAP,
+                 failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT, stale_size=STALE_SIZE):
+        self.client_factory = client_factory
+        self.quotas = quotas
+        self.scale = scale
+        self.burst = burst
+        self.max_wait = max_wait
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.stale_size = stale_size
+        self.stats = {"calls": 0, "retries": 0, "throttled": 0, "rejected": 0, "stale": 0, "failures": 0}
+        self._buckets = {}
+        self._breakers = {}
+        self._stale = OrderedDict()
+        self._lock = threading.Lock()
+        self._services = _Services(self)
+
+    @contextmanager
+    def client(self):
+        yield self._services
+
+    def _bucket(self, service, method):
+        key = f"{service}.{method}"
+        quota_key = key if key in self.quotas else service
+        with self._lock:
+            bucket = self._buckets.get(quota_key)
+            if bucket is None and quota_key in self.quotas:
+                rate = self.quotas[quota_key] * self.scale / QUOTA_PERIOD
+                bucket = self._buckets[quota_key] = TokenBucket(rate, max(1.0, rate * self.burst))
+            return bucket
+
+    def breaker(self, service):
+        with self._lock:
+            breaker = self._breakers.get(service)
+            if breaker is None:
+                breaker = self._breakers[service] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return breaker
+
+    def breakers(self):
+        with self._lock:
+            return dict(self._breakers)
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _remember(self, key, result):
+        with self._lock:
+            self._stale[key] = result
+            self._stale.move_to_end(key)
+            while len(self._stale) > self.stale_size:
+                self._stale.popitem(last=False)
+
+    def _stale_or_raise(self, key, error):
+        with self._lock:
+            result = self._stale.get(key, self)
+        if result is self:
+            raise error
+        self._count("stale")
+        return result
+
+    def _throttle(self, bucket, service):
+        if bucket is not None and not bucket.acquire(timeout=self.max_wait):
+            self._count("throttled")
+            return ThrottledError(f"Превышен лимит запросов к Invest API ({service})", 1 / bucket.rate)
+        return None
+
+    def call(self, service, method, args, kwargs):
+        self._count("calls")
+        key = (service, method, repr(args), repr(sorted(kwargs.items())))
+        breaker = self.breaker(service)
+        wait = breaker.allow()
+        if wait:
+            self._count("rejected")
+            return self._stale_or_raise(key, CircuitOpenError(f"Invest API ({service}) временно недоступен", wait))
+
+        bucket = self._bucket(service, method)
+        for attempt in range(self.retries + 1):
+            error = self._throttle(bucket, service)
+            if error is not None:
+                breaker.abandon()
+                return self._stale_or_raise(key, error)
+            try:
+                with self.client_factory() as client:
+                    result = getattr(getattr(client, service), method)(*args, **kwargs)
+            except Exception as e:
+                if not is_retryable(e):
+                    breaker.abandon()
+                    raise
+                if attempt == self.retries:
+                    self._count("failures")
+                    breaker.failure()
+                    return self._stale_or_raise(key, e)
+                self._count("retries")
+                time.sleep(retry_delay(attempt, e, self.backoff_base, self.backoff_cap))
+                continue
+            breaker.success()
+            self._remember(key, result)
+            return result
@@ -0,0 +1,117 @@
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+Instrument = namedtuple("Instrument", ["figi", "ticker", "name", "currency", "sector", "exchange", "lot"])
+
+INSTRUMENTS_TTL = 6 * 60 * 60
+RETRY_DELAY = 60
+
+
+class InstrumentIndex:
+    def __init__(self, client_factory, storage, ttl=INSTRUMENTS_TTL):
+        self.client_factory = client_factory
+        self.storage = storage
+        self.ttl = ttl
+        self.loaded_at = 0.0
+        self._by_ticker = {}
+        self._by_figi = {}
+        self._lock = threading.RLock()
+        self._thread = None
+
+        with self.storage.transaction() as db:
+            db.execute('''CREATE TABLE IF NOT EXISTS instruments (
+                figi TEXT PRIMARY KEY,
+                ticker TEXT,
+                name TEXT,
+                currency TEXT,
+                sector TEXT,
+                exchange TEXT,
+                lot INTEGER,
+                updated_at REAL
+            )''')
+            db.execute("CREATE INDEX IF NOT EXISTS instruments_ticker ON instruments (ticker)")
+
+    def __len__(self):
+        return len(self._by_figi)
+
+    def _swap(self, instruments, loaded_at):
+        by_ticker, by_figi = {}, {}
+        for item in instruments:
+            by_figi[item.figi] = item
+            by_ticker.setdefault(item.ticker.upper(), item)
+        self._by_ticker, self._by_figi = by_ticker, by_figi
+        self.loaded_at = loaded_at
+
+    def load(self):
+        rows = self.storage.query("SELECT figi, ticker, name, currency, sector, exchange, lot, updated_at "
+                                  "FROM instruments ORDER BY rowid")
+        if rows:
+            self._swap([Instrument(*row[:7]) for row in rows], min(row[7] for row in rows))
+        return len(rows)
+
+    def refresh(self):
+        with self._lock:
+            with self.client_factory() as client:
+                shares = client.instruments.shares().instruments
+            instruments = [Instrument(s.figi, s.ticker, s.name, s.currency, s.sector, s.exchange, s.lot)
+                           for s in shares]
+            now = time.time()
+            self._swap(instruments, now)
+            self._save(instruments, now)
+        return len(instruments)
+
+    def _save(self, instruments, updated_at):
+        try:
+            with self.storage.transaction() as db:
+                db.execute("DELETE FROM instruments")
+                db.executemany("""
+                    INSERT OR REPLACE INTO instruments (figi, ticker, name, currency, sector, exchange, lot, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, [(*item, updated_at) for item in instruments])
+        except sqlite3.Error as e:
+            print(f"Ошибка базы данных: {e}")
+
+    def is_stale(self):
+        return time.time() - self.loaded_at >= self.ttl
+
+    def ensure_loaded(self):
+        if not self._by_figi:
+            with self._lock:
+                if not self._by_figi:
+                    self.refresh()
+
+    def by_ticker(self, ticker):
+        self.ensure_loaded()
+        return self._by_ticker.get(ticker.strip().upper())
+
+    def by_figi(self, figi):
+        self.ensure_loaded()
+        return self._by_figi.get(figi)
+
+    def all(self):
+        self.ensure_loaded()
+        return list(self._by_figi.values())
+
+    def _refresh_loop(self):
+        while True:
+            delay = self.loaded_at + self.ttl - time.time()
+            if delay > 0:
+                time.sleep(delay)
+                continue
+            try:
+                count = self.refresh()
+                print(f"Справочник инструментов обновлён: {count}")
+            except Exception as e:
+                print(f"Ошибка обновления справочника инструментов: {e}")
+                time.sleep(RETRY_DELAY)
+
+    def start(self):
+        try:
+            self.load()
+        except sqlite3.Error as e:
+            print(f"Ошибка базы данных: {e}")
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._refresh_loop, daemon=True)
+            self._thread.start()
@@ -1,34 +1,126 @@
 import telebot
-from pandas import DataFrame
-from tinkoff.invest import Client
 from telebot import types
+import html
+import multiprocessing
+import re
 import threading
 import time
-from io import StringIO
 import sqlite3
-import csv
-from datetime import datetime
 import os
 from dotenv import load_dotenv
-
-load_dotenv()
-bot = telebot.TeleBot(os.getenv("API_TOKEN"))
+from alerts import ABOVE, BELOW, AlertEngine
+from candles import CHART_PERIODS, DEFAULT_PERIOD, CandleStore
+from charts import render_chart
+from client_pool import ClientPool, new_invest_client
+from conversation import STATE_TTL, Conversation, MemoryStateStore, SqliteStateStore
+from delivery import Outbox
+from dispatch import ChatDispatcher, update_chat_id
+from export import portfolio_snapshot, render_export
+from gateway import ApiGateway, ApiUnavailable
+from instruments import InstrumentIndex
+from metrics import Metrics, MetricsServer, timed_client
+from portfolio_import import MAX_IMPORT_SIZE, ImportTooLarge, parse_portfolio
+from quotes import QuoteCache, QuoteService, format_price
+from scheduler import AlertScheduler, TradingCalendar
+from search import InstrumentSearch
+from sharding import DELIVERY_LEASE, AlertDeliveries, LeaseCoordinator
+from storage import Storage, check_password, hash_password
+from streaming import PriceStream, TinkoffMarketDataStream
+from tick_history import TickHistory
+from valuation import BASE_CURRENCY, FX_TTL, VALUATION_INTERVAL, FxRates, PortfolioValuations
+from webhook import WEBHOOK_PATH, WebhookServer
+from worker import run_worker, worker_id
 
 DB_NAME = "database.sqlite"
-with sqlite3.connect(DB_NAME) as db:
-    db.execute('''CREATE TABLE IF NOT EXISTS portfolios (
-        user_id INTEGER,
-        ticker TEXT,
-        PRIMARY KEY (user_id, ticker)
-    )''')
-
-ticker = ""
-USER_ALERTS = {}
+ALERT_WINDOWS = ["5 мин", "15 мин", "30 мин", "60 мин"]
+LEVEL_WORDS = {"выше": ABOVE, "above": ABOVE, ">": ABOVE, "ниже": BELOW, "below": BELOW, "<": BELOW}
+ALERT_CHECK_INTERVAL = 300
+ALERT_DELIVERY_INTERVAL = 1
+IMPORT_REPORT_ROWS = 10
+ALERT_SAVE_ERROR = "❌ Не удалось сохранить уведомление, попробуйте ещё раз."
+MAX_PRICE_TICKERS = 20
+PRICE_TABLE_NAME_WIDTH = 18
+
+bot = None
+DISPATCHER = None
+OUTBOX = None
+STORAGE = None
+POOL = None
+GATEWAY = None
+INSTRUMENTS = None
+QUOTES = None
+QUOTE_CACHE = None
+SEARCH = None
+HISTORY = None
+ALERTS = None
+CALENDAR = None
+SCHEDULER = None
+COORDINATOR = None
+DELIVERIES = None
+WORKERS = []
+STREAM = None
+CONVERSATION = None
+FX = None
+VALUATIONS = None
+CANDLES = None
+METRICS = Metrics(enabled=False)
+
+
+def dispatch_updates(updates):
+    for update in updates:
+        DISPATCHER.submit(update_chat_id(update), update)
+
+
+def invest_client():
+    return GATEWAY.client()
+
+
+def api_quota_share():
+    if os.getenv("ALERTS_MODE") == "sharded":
+        return 1 / (int(os.getenv("ALERT_WORKERS", 2)) + 1)
+    return 1.0
+
+
+def api_error_message(error, default):
+    if isinstance(error, ApiUnavailable):
+        return f"⏳ Сервис котировок перегружен, попробуйте через {max(1, round(error.retry_after))} с."
+    return default
+
+
+def timed_handler(handler):
+    return METRICS.timed("bot_handler_seconds", handler, handler=handler.__name__)
+
+
+def collect_stats():
+    cache = QUOTE_CACHE.stats()
+    return [
+        ("counter", "quote_cache_hits_total", cache["hits"], {}),
+        ("counter", "quote_cache_misses_total", cache["misses"], {}),
+        ("counter", "quote_cache_shared_total", cache["shared"], {}),
+        ("counter", "alerts_evaluated_total", ALERTS.evaluated, {}),
+        ("counter", "alerts_fired_total", ALERTS.fired, {}),
+        ("counter", "db_errors_total", STORAGE.errors, {}),
+        ("counter", "alert_checks_total", SCHEDULER.checked, {}),
+        ("counter", "alert_checks_deferred_closed_total", SCHEDULER.skipped, {}),
+        ("gauge", "alerts_active", len(ALERTS), {}),
+        ("gauge", "alert_schedule_instruments", len(SCHEDULER), {}),
+        ("gauge", "alert_cycle_wait_seconds", SCHEDULER.last_wait, {}),
+        ("gauge", "alert_check_lag_seconds", SCHEDULER.due_lag, {}),
+        ("gauge", "outbox_pending", OUTBOX.pending(), {}),
+        ("gauge", "dispatcher_pending", DISPATCHER.pending(), {}),
+        ("gauge", "conversations_active", len(CONVERSATION.store), {}),
+        ("gauge", "portfolio_positions", len(VALUATIONS), {}),
+    ] + [("counter", f"invest_api_{name}_total", value, {}) for name, value in GATEWAY.stats.items()] + [
+        ("gauge", "invest_api_circuit_open", int(breaker.state != "closed"), {"service": service})
+        for service, breaker in GATEWAY.breakers().items()
+    ]
+
+
 USER_PORTFOLIOS = {}
+EXPORT_GZIP_ROWS = 200
 POPULAR_TICKERS = ["sber", "gazp", "smlt", "ydex", "nvtk", "ozon", "lkoh", "rosn", "tsla",
                    "aapl", "goog", "msft", "nvda", "amzn", "meta"]
 USER_DB = {}
-TEMPORARY_DATA = {}
 
 MARKUP_MAIN = types.ReplyKeyboardMarkup(resize_keyboard=True)
 BTN1, BTN2 = types.KeyboardButton("/find_price"), types.KeyboardButton("/export")
@@ -38,7 +130,6 @@ MARKUP_MAIN.row(BTN3, BTN4)
 MARKUP_MAIN.row(BTN5)
 
 
-@bot.message_handler(commands=['start'])
 def start(message):
     user_id = message.chat.id
 
@@ -58,15 +149,13 @@ def start(message):
                          reply_markup=markup)
 
 
-@bot.message_handler(func=lambda message: message.text.lower() == "зарегистрироваться")
 def register_start(message):
     user_id = message.chat.id
-    TEMPORARY_DATA[user_id] = {"step": "waiting_password"}
 
     bot.send_message(user_id,
                      "🔐 Придумайте пароль для регистрации (минимум 4 символа):",
                      reply_markup=types.ReplyKeyboardRemove())
-    bot.register_next_step_handler(message, register_finish)
+    CONVERSATION.expect(user_id, register_finish)
 
 
 def register_finish(message):
@@ -80,15 +169,15 @@ def register_finish(message):
         return
 
     USER_DB[user_id] = {
-        "password": password,
+        "password": hash_password(password),
         "portfolio": [],
         "alerts": {}
     }
+    STORAGE.add_user(user_id, USER_DB[user_id]["password"])
 
     show_main_menu(user_id, "✅ Регистрация успешно завершена!")
 
 
-@bot.message_handler(func=lambda message: message.text.lower() == "авторизоваться")
 def login_start(message):
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
     btn = types.KeyboardButton("Зарегистрироваться")
@@ -99,11 +188,8 @@ def login_start(message):
         bot.send_message(user_id, "❌ Вы не зарегистрированы. Пожалуйста, зарегистрируйтесь.", reply_markup=markup)
         return
 
-    TEMPORARY_DATA[user_id] = {"step": "waiting_password"}
-
     bot.send_message(user_id, "🔐 Введите ваш пароль:", reply_markup=types.ReplyKeyboardRemove())
-
-    bot.register_next_step_handler(message, login_finish)
+    CONVERSATION.expect(user_id, login_finish)
 
 
 def login_finish(message):
@@ -114,7 +200,7 @@ def login_finish(message):
     btn = types.KeyboardButton("Авторизация")
     markup.add(btn)
 
-    if USER_DB[user_id]["password"] != password:
+    if not check_password(password, USER_DB[user_id]["password"]):
         bot.send_message(user_id, "❌ Неверный пароль. Попробуйте снова.", reply_markup=markup)
         login_start(message)
         return
@@ -129,102 +215,171 @@ def show_main_menu(user_id, welcome_message=""):
                      reply_markup=MARKUP_MAIN)
 
 
-@bot.message_handler(commands=['help'])
 def help(message):
     bot.send_message(message.chat.id, '📊 Доступные команды:\n\n'
-                                      '/find_price - получения информации и текущей цены акции по тикеру\n'
+                                      '/find_price - получения информации и текущей цены акции по тикеру '
+                                      '(можно несколько через пробел: SBER GAZP LKOH)\n'
                                       '/export - экспорт данных\n'
                                       '/portfolio - добавление/удаление акциий из портфеля\n'
-                                      '/alerts - настройка уведомлений о изменениях цен\n\n'
+                                      '/alerts - настройка уведомлений о изменениях цен и уровнях цены\n'
+                                      f'/chart ТИКЕР [{"|".join(CHART_PERIODS)}] - график цены\n'
+                                      'CSV/TXT-файл с тикерами и количеством - импорт портфеля\n\n'
                                       'Пример использования:\n'
                                       '1. Введи /find_price\n'
-                                      '2. Выберите или введите тикер акции (например, SBER)\n'
+                                      '2. Выберите или введите тикер акции (например, SBER или SBER GAZP LKOH)\n'
                                       '3. Получи текущую цену акции')
 
 
-@bot.message_handler(commands=['find_price'])
 def find_price(message):
+    tickers = split_tickers(" ".join(message.text.split()[1:]))
+    if tickers:
+        send_price_table(message.chat.id, tickers)
+        return
+
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=3)
     buttons = [types.KeyboardButton(ticker) for ticker in POPULAR_TICKERS]
     markup.add(*buttons)
     markup.add(types.KeyboardButton("Отмена"))
 
-    bot.send_message(message.chat.id, '📈 Введи тикер акции или выбери из списка:', reply_markup=markup)
-    bot.register_next_step_handler(message, process_ticker)
+    bot.send_message(message.chat.id, '📈 Введи тикер акции (или несколько через пробел) или выбери из списка:',
+                     reply_markup=markup)
+    CONVERSATION.expect(message.chat.id, process_ticker)
+
+
+def suggest_tickers(message, query, next_step, *args):
+    suggestions = SEARCH.search(query)
+    if not suggestions:
+        return False
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=3)
+    markup.add(*[types.KeyboardButton(item.ticker) for item in suggestions])
+    markup.add(types.KeyboardButton("Отмена"))
+    lines = "\n".join(f"{item.ticker} — {item.name}" for item in suggestions)
+    bot.send_message(message.chat.id, f"❌ Тикер не найден. Возможно, вы имели в виду:\n\n{lines}",
+                     reply_markup=markup)
+    CONVERSATION.expect(message.chat.id, next_step, *args)
+    return True
+
+
+def split_tickers(text):
+    return list(dict.fromkeys(part.upper() for part in re.split(r"[\s,;]+", text) if part))
+
+
+def send_price_table(user_id, tickers):
+    if len(tickers) > MAX_PRICE_TICKERS:
+        bot.send_message(user_id, f"❌ Можно запросить не больше {MAX_PRICE_TICKERS} тикеров за раз.",
+                         reply_markup=MARKUP_MAIN)
+        return
+
+    try:
+        stocks = {ticker: INSTRUMENTS.by_ticker(ticker) for ticker in tickers}
+        quotes = QUOTE_CACHE.get_last_prices([stock_info.figi for stock_info in stocks.values() if stock_info])
+    except Exception as e:
+        print(f"Ошибка получения цен {' '.join(tickers)}: {str(e)}")
+        bot.send_message(user_id, api_error_message(e, "❌ Не удалось получить цены, попробуйте ещё раз."),
+                         reply_markup=MARKUP_MAIN)
+        return
+
+    rows = []
+    for ticker, stock_info in stocks.items():
+        if stock_info is None:
+            suggestions = SEARCH.search(ticker)
+            hint = f"возможно, {suggestions[0].ticker}" if suggestions else ""
+            rows.append((ticker, "не найден", hint))
+            continue
+        quote = quotes.get(stock_info.figi)
+        price = f"{format_price(quote.price)} {stock_info.currency}" if quote else "нет цены"
+        rows.append((stock_info.ticker, price, (stock_info.name or "")[:PRICE_TABLE_NAME_WIDTH]))
+
+    ticker_width = max(len(row[0]) for row in rows)
+    price_width = max(len(row[1]) for row in rows)
+    table = "\n".join(f"{ticker:<{ticker_width}}  {price:>{price_width}}  {name}".rstrip()
+                      for ticker, price, name in rows)
+    bot.send_message(user_id, f"📋 Текущие цены:\n<pre>{html.escape(table)}</pre>", parse_mode="HTML",
+                     reply_markup=MARKUP_MAIN)
 
 
 def process_ticker(message):
-    global ticker
     if message.text.lower() == "отмена":
         bot.send_message(message.chat.id, "❌ Действие отменено", reply_markup=MARKUP_MAIN)
         return
+    tickers = split_tickers(message.text)
+    if len(tickers) > 1 and any(INSTRUMENTS.by_ticker(ticker) is not None for ticker in tickers):
+        send_price_table(message.chat.id, tickers)
+        return
     ticker = message.text.strip().lower()
 
     try:
-        with Client(os.getenv("API_TOKEN_INVEST")) as cl:
-            instruments = cl.instruments
-            r = DataFrame(
-                instruments.shares().instruments,
-                columns=['name', 'figi', 'ticker', 'currency', 'sector']
-            )
-            stock_info = r[r['ticker'] == ticker.upper()].iloc[0]
-            price_a = run(ticker, message).rstrip(''')( /.,''')
-            info_msg = f"📋 Информация об акции:\n\n" \
-                       f"Компания: {stock_info['name']}\n" \
-                       f"Тикер: {stock_info['ticker']}\n" \
-                       f"Валюта: {stock_info['currency']}\n" \
-                       f"Сектор: {stock_info['sector']}\n" \
-                       f"Текущая цена {ticker.upper()}: {price_a} {stock_info['currency']}\n"
-
-            info_msg += f"\nСсылка на покупку: https://www.tbank.ru/invest/stocks/{stock_info['ticker']}/"
+        stock_info = INSTRUMENTS.by_ticker(ticker)
+        if stock_info is None:
+            if not suggest_tickers(message, ticker, process_ticker):
+                bot.send_message(message.chat.id, '❌ Тикер не найден. Проверьте правильность и попробуйте снова.',
+                                 reply_markup=MARKUP_MAIN)
+            return
+        quote = QUOTE_CACHE.get_last_price(stock_info.figi)
+        if quote is None:
+            bot.send_message(message.chat.id, f'❌ Не удалось получить цену, попробуйте ещё раз.',
+                             reply_markup=MARKUP_MAIN)
+            return
+        price_a = format_price(quote.price)
+        info_msg = f"📋 Информация об акции:\n\n" \
+                   f"Компания: {stock_info.name}\n" \
+                   f"Тикер: {stock_info.ticker}\n" \
+                   f"Валюта: {stock_info.currency}\n" \
+                   f"Сектор: {stock_info.sector}\n" \
+                   f"Текущая цена {ticker.upper()}: {price_a} {stock_info.currency}\n"
+
+        info_msg += f"\nСсылка на покупку: https://www.tbank.ru/invest/stocks/{stock_info.ticker}/"
+
+        bot.send_message(message.chat.id, info_msg, reply_markup=MARKUP_MAIN)
+
+    except Exception as e:
+        bot.send_message(message.chat.id,
+                         api_error_message(e, '❌ Ошибка! Проверьте правильность тикера и попробуйте снова.'),
+                         reply_markup=MARKUP_MAIN)
 
-            bot.send_message(message.chat.id, info_msg, reply_markup=MARKUP_MAIN)
-            run(ticker, message)
 
-    except Exception:
-        bot.send_message(message.chat.id, f'❌ Ошибка! Проверьте правильность тикера и попробуйте снова.',
+def chart(message):
+    user_id = message.chat.id
+    args = message.text.split()[1:]
+    if not args:
+        bot.send_message(user_id, f"📉 Использование: /chart ТИКЕР [период], например /chart SBER {DEFAULT_PERIOD}\n"
+                                  f"Периоды: {', '.join(CHART_PERIODS)}", reply_markup=MARKUP_MAIN)
+        return
+    ticker = args[0].upper()
+    period = args[1].lower() if len(args) > 1 else DEFAULT_PERIOD
+    if period not in CHART_PERIODS:
+        bot.send_message(user_id, f"❌ Неизвестный период. Доступны: {', '.join(CHART_PERIODS)}",
                          reply_markup=MARKUP_MAIN)
+        return
 
-
-def run(TICKER, message):
     try:
-        with Client(os.getenv("API_TOKEN_INVEST")) as client:
-            instruments = client.instruments
-            r = DataFrame(
-                instruments.shares().instruments,
-                columns=['name', 'figi', 'ticker']
-            )
-            figi = r[r['ticker'] == TICKER.upper()]['figi'].iloc[0]
-            return main(figi, message, TICKER)
-    except Exception:
-        bot.send_message(message.chat.id, f'❌ Ошибка, проблема с запросом по акции.')
-
+        stock_info = INSTRUMENTS.by_ticker(ticker)
+        if stock_info is None:
+            suggestions = ", ".join(item.ticker for item in SEARCH.search(ticker))
+            hint = f" Возможно, вы имели в виду: {suggestions}" if suggestions else ""
+            bot.send_message(user_id, f"❌ Тикер не найден.{hint}", reply_markup=MARKUP_MAIN)
+            return
+        candles = CANDLES.chart(stock_info.figi, period)
+    except Exception as e:
+        print(f"Ошибка получения свечей {ticker}: {str(e)}")
+        bot.send_message(user_id, api_error_message(e, "❌ Не удалось получить историю цен, попробуйте ещё раз."),
+                         reply_markup=MARKUP_MAIN)
+        return
 
-def main(figi, message, TICKER):
-    try:
-        with Client(os.getenv("API_TOKEN_INVEST")) as client:
-            k = client.market_data.get_last_prices(figi=[str(figi)])
-            massive = list(str(k).split(','))
-            tmp1 = "".join(massive[1]).split("=")
-            tmp2 = "".join(massive[2]).split("=")
-            price = f'{tmp1[2]}.{(tmp2[1])[:2]}'
-
-            return price
-    except Exception:
-        bot.send_message(message.chat.id, f'❌ Не удалось получить цену, попробуйте ещё раз.')
+    if not len(candles.times):
+        bot.send_message(user_id, f"❌ Нет данных по {ticker} за период {period}.", reply_markup=MARKUP_MAIN)
+        return
+    photo = render_chart(candles, f"{stock_info.ticker} — {stock_info.name}, {period}", stock_info.currency)
+    change = (candles.close[-1] / candles.open[0] - 1) * 100 if candles.open[0] else 0.0
+    bot.send_photo(user_id, photo, caption=f"📉 {stock_info.ticker}: {format_price(candles.close[-1])} "
+                                           f"{stock_info.currency} ({change:+.2f}% за {period})",
+                   reply_markup=MARKUP_MAIN)
 
 
-@bot.message_handler(commands=['export'])
 def export_menu(message):
     user_id = message.chat.id
 
-    conn = sqlite3.connect('database.sqlite')
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT ticker FROM portfolios WHERE user_id=?", (user_id,))
-    portfolio = cursor.fetchall()
-    print(portfolio)
-    conn.close()
+    portfolio = STORAGE.portfolio(user_id)
 
     if not portfolio:
         bot.send_message(user_id, "❌ Ваш портфель пуст.", reply_markup=MARKUP_MAIN)
@@ -245,136 +400,37 @@ def export_menu(message):
     )
 
 
-def get_portfolio_data(user_id, message):
-    conn = sqlite3.connect('database.sqlite')
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT ticker FROM portfolios WHERE user_id=?", (user_id,))
-    tcrk = [i[0] for i in cursor.fetchall()]
-    conn.close()
-
-    portfolio = []
-    for i in tcrk:
-        temp = []
-        with Client(os.getenv("API_TOKEN_INVEST")) as cl:
-            instruments = cl.instruments
-            r = DataFrame(
-                instruments.shares().instruments,
-                columns=['name', 'figi', 'ticker', 'currency', 'sector']
-            )
-            stock_info = r[r['ticker'] == i.upper()].iloc[0]
-            price_a = run(i, message).rstrip(''')( /.,''')
-            temp.append(stock_info['ticker'])
-            temp.append(stock_info['name'])
-            temp.append(price_a)
-            temp.append(stock_info['currency'])
-            temp.append(stock_info['sector'])
-        portfolio.append(temp)
-
-    return portfolio
-
-
-@bot.message_handler(func=lambda m: m.text.lower() in ["📝 txt", "txt"])
-def export_txt(message):
+def send_export(message, export_format, caption):
     user_id = message.chat.id
-    portfolio = get_portfolio_data(user_id, message)
+    try:
+        rows = portfolio_snapshot(STORAGE.portfolio(user_id), INSTRUMENTS, QUOTES)
+    except Exception as e:
+        print(f"Ошибка экспорта портфеля {user_id}: {str(e)}")
+        bot.send_message(user_id, api_error_message(e, "❌ Не удалось получить данные портфеля, попробуйте ещё раз."),
+                         reply_markup=MARKUP_MAIN)
+        return
 
-    if not portfolio:
+    if not rows:
         bot.send_message(user_id, "❌ Ваш портфель пуст.", reply_markup=MARKUP_MAIN)
         return
 
-    txt_content = f"Портфель пользователя на {datetime.now().strftime('%Y-%m-%d %H:%M')}\n\n"
-    txt_content += "{:<10} {:<30} {:<15} {:<10} {:<20}\n".format(
-        "Тикер", "Название", "Цена", "Валюта", "Сектор"
-    )
-    txt_content += "-" * 85 + "\n"
+    filename, document = render_export(export_format, rows, user_id, gzip_rows=EXPORT_GZIP_ROWS)
+    with document:
+        bot.send_document(user_id, (filename, document), caption=caption, reply_markup=MARKUP_MAIN)
 
-    for item in portfolio:
-        ticker, name, price, currency, sector = item
-        txt_content += "{:<10} {:<30} {:<15} {:<10} {:<20}\n".format(
-            ticker, name or "N/A", str(price) or "N/A", currency or "N/A", sector or "N/A"
-        )
 
-    bot.send_document(
-        user_id,
-        ("portfolio.txt", txt_content.encode('utf-16')),
-        caption="📝 Ваш портфель в формате TXT",
-        reply_markup=MARKUP_MAIN
-    )
+def export_txt(message):
+    send_export(message, "txt", "📝 Ваш портфель в формате TXT")
 
 
-@bot.message_handler(func=lambda m: m.text.lower() in ["📊 csv", "csv"])
 def export_csv(message):
-    user_id = message.chat.id
-    portfolio = get_portfolio_data(user_id, message)
-
-    if not portfolio:
-        bot.send_message(user_id, "❌ Ваш портфель пуст.", reply_markup=MARKUP_MAIN)
-        return
-
-    csv_file = StringIO()
-    writer = csv.writer(csv_file)
-
-    writer.writerow(["Тикер", "Название", "Цена", "Валюта", "Сектор", "Дата экспорта"])
+    send_export(message, "csv", "📊 Ваш портфель в формате CSV")
 
-    for item in portfolio:
-        ticker, name, price, currency, sector = item
-        writer.writerow([
-            ticker,
-            name or "N/A",
-            price or "N/A",
-            currency or "N/A",
-            sector or "N/A",
-            datetime.now().strftime('%Y-%m-%d %H:%M')
-        ])
-
-    csv_file.seek(0)
-    bot.send_document(
-        user_id,
-        ("portfolio.csv", csv_file.getvalue().encode('utf-16')),
-        caption="📊 Ваш портфель в формате CSV",
-        reply_markup=MARKUP_MAIN
-    )
 
-
-@bot.message_handler(func=lambda m: m.text.lower() in ["🗃️ sql", " sql"])
 def export_sql(message):
-    user_id = message.chat.id
-    portfolio = get_portfolio_data(user_id, message)
+    send_export(message, "sql", "🗃️ Ваш портфель в формате SQL")
 
-    if not portfolio:
-        bot.send_message(user_id, "❌ Ваш портфель пуст.", reply_markup=MARKUP_MAIN)
-        return
-
-    sql_content = f"-- Экспорт портфеля пользователя {user_id}\n"
-    sql_content += f"-- Дата экспорта: {datetime.now().strftime('%Y-%m-%d %H:%M')}\n\n"
-    sql_content += "CREATE TABLE IF NOT EXISTS exported_portfolio (\n"
-    sql_content += "    ticker TEXT PRIMARY KEY,\n"
-    sql_content += "    name TEXT,\n"
-    sql_content += "    price REAL,\n"
-    sql_content += "    currency TEXT,\n"
-    sql_content += "    sector TEXT,\n"
-    sql_content += "    export_date TEXT\n);\n\n"
-
-    for item in portfolio:
-        ticker, name, price, currency, sector = item
-        sql_content += (
-            f"""INSERT INTO exported_portfolio (ticker, name, price, currency, sector, export_date) """
-            f"""VALUES ('{ticker}', {f"'{name}'" if name else 'NULL'}, """
-            f"""{price if price else 'NULL'}, {f"'{currency}'" if currency else 'NULL'}, """
-            f"""{f"'{sector}'" if sector else 'NULL'}, """
-            f"""'{datetime.now().strftime('%Y-%m-%d %H:%M')}');\n"""
-        )
 
-    bot.send_document(
-        user_id,
-        ("portfolio.sql", sql_content.encode('utf-16')),
-        caption="🗃️ Ваш портфель в формате SQL",
-        reply_markup=MARKUP_MAIN
-    )
-
-
-@bot.message_handler(commands=['portfolio'])
 def portfolio(message):
     user_id = message.chat.id
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
@@ -385,7 +441,7 @@ def portfolio(message):
     markup.row(btn3)
     bot.send_message(user_id, f"📊 Управление портфелем", reply_markup=markup)
 
-    bot.register_next_step_handler(message, process_portfolio)
+    CONVERSATION.expect(message.chat.id, process_portfolio)
 
 
 def process_portfolio(message):
@@ -398,7 +454,7 @@ def process_portfolio(message):
         markup.add(*buttons)
         markup.add(types.KeyboardButton("Отмена"))
         bot.send_message(user_id, "Выберете или введите тикер акции для добавления в портфель:", reply_markup=markup)
-        bot.register_next_step_handler(message, add_to_portfolio)
+        CONVERSATION.expect(message.chat.id, add_to_portfolio)
     elif text == "удалить акцию":
         show_portfolio_for_deletion(user_id, message)
     elif text == "показать портфель":
@@ -417,50 +473,100 @@ def add_to_portfolio(message):
         return
 
     try:
-        with Client(os.getenv("API_TOKEN_INVEST")) as cl:
-            instruments = cl.instruments
-            r = DataFrame(
-                instruments.shares().instruments,
-                columns=['name', 'figi', 'ticker']
-            )
-
-            if ticker not in r['ticker'].values:
+        if INSTRUMENTS.by_ticker(ticker) is None:
+            if not suggest_tickers(message, ticker, add_to_portfolio):
                 bot.send_message(user_id, "❌ Такой тикер не найден", reply_markup=MARKUP_MAIN)
-                return
+            return
 
-            if user_id not in USER_PORTFOLIOS:
-                USER_PORTFOLIOS[user_id] = []
-
-            if ticker not in USER_PORTFOLIOS[user_id]:
-                USER_PORTFOLIOS[user_id].append(ticker)
-                bot.send_message(user_id, f"✅ Акция {ticker} добавлена в ваш портфель", reply_markup=MARKUP_MAIN)
-                add_to_portfolio_db(user_id, ticker)
-            else:
-                bot.send_message(user_id, f"ℹ️ Акция {ticker} уже есть в вашем портфеле", reply_markup=MARKUP_MAIN)
+        markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=4)
+        markup.add(*[types.KeyboardButton(quantity) for quantity in ("1", "10", "100", "1000")])
+        markup.add(types.KeyboardButton("Отмена"))
+        bot.send_message(user_id, f"Введите количество акций {ticker}:", reply_markup=markup)
+        CONVERSATION.expect(user_id, add_to_portfolio_quantity, ticker)
 
     except Exception:
         bot.send_message(user_id, f"❌ Ошибка, попробуйте снова.", reply_markup=MARKUP_MAIN)
 
 
-def add_to_portfolio_db(user_id, ticker):
-    conn = None
+def add_to_portfolio_quantity(message, ticker):
+    user_id = message.chat.id
+    if message.text.lower() == "отмена":
+        bot.send_message(user_id, "❌ Действие отменено.", reply_markup=MARKUP_MAIN)
+        return
+
     try:
-        conn = sqlite3.connect('database.sqlite')
-        cursor = conn.cursor()
+        quantity = float(message.text.replace(",", "."))
+        if quantity <= 0:
+            raise ValueError(quantity)
+    except ValueError:
+        bot.send_message(user_id, "❌ Некорректное количество.", reply_markup=MARKUP_MAIN)
+        return
+
+    positions = USER_PORTFOLIOS.setdefault(user_id, {})
+    if ticker in positions:
+        quantity += positions[ticker]
+        bot.send_message(user_id, f"ℹ️ Количество {ticker} в портфеле увеличено до {quantity:g}",
+                         reply_markup=MARKUP_MAIN)
+    else:
+        bot.send_message(user_id, f"✅ Акция {ticker} ({quantity:g} шт.) добавлена в ваш портфель",
+                         reply_markup=MARKUP_MAIN)
+    positions[ticker] = quantity
+    set_valuation(user_id, ticker, quantity)
+    add_to_portfolio_db(user_id, ticker, quantity)
 
-        cursor.execute("""
-            INSERT INTO portfolios (user_id, ticker)
-            VALUES (?, ?)
-        """, (user_id, ticker))
 
-        conn.commit()
+def add_to_portfolio_db(user_id, ticker, quantity=1):
+    try:
+        STORAGE.add_to_portfolio(user_id, ticker, quantity)
     except sqlite3.Error as e:
         print(f"Database error: {e}")
-        if conn:
-            conn.rollback()
-    finally:
-        if conn:
-            conn.close()
+
+
+def import_portfolio(message):
+    user_id = message.chat.id
+    document = message.document
+    if document.file_size and document.file_size > MAX_IMPORT_SIZE:
+        bot.send_message(user_id, f"❌ Файл слишком большой, максимум {MAX_IMPORT_SIZE // 1024} КБ.",
+                         reply_markup=MARKUP_MAIN)
+        return
+
+    try:
+        data = bot.download_file(bot.get_file(document.file_id).file_path)
+        result = parse_portfolio(data, INSTRUMENTS)
+    except ImportTooLarge as e:
+        bot.send_message(user_id, f"❌ Распакованный файл слишком большой, максимум {e.args[0] // 1024} КБ.",
+                         reply_markup=MARKUP_MAIN)
+        return
+    except Exception as e:
+        print(f"Ошибка импорта портфеля {user_id}: {str(e)}")
+        bot.send_message(user_id, api_error_message(e, "❌ Не удалось прочитать файл, проверьте формат."),
+                         reply_markup=MARKUP_MAIN)
+        return
+
+    lines = []
+    if result.positions:
+        try:
+            STORAGE.import_portfolio(user_id, result.positions.items())
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            bot.send_message(user_id, "❌ Не удалось сохранить портфель, попробуйте ещё раз.", reply_markup=MARKUP_MAIN)
+            return
+        positions = USER_PORTFOLIOS.setdefault(user_id, {})
+        for ticker, quantity in result.positions.items():
+            positions[ticker] = quantity
+            set_valuation(user_id, ticker, quantity)
+        lines.append(f"✅ Импортировано позиций: {len(result.positions)}")
+    else:
+        lines.append("❌ В файле не найдено ни одного известного тикера.")
+
+    if result.invalid:
+        lines.append(f"\n⚠️ Пропущено строк: {len(result.invalid)}")
+        lines.extend(f"{row.line}: {row.text[:40]} — {row.reason}" for row in result.invalid[:IMPORT_REPORT_ROWS])
+        if len(result.invalid) > IMPORT_REPORT_ROWS:
+            lines.append(f"… и ещё {len(result.invalid) - IMPORT_REPORT_ROWS}")
+    if result.truncated:
+        lines.append("\n⚠️ Файл прочитан не полностью: слишком много строк.")
+    bot.send_message(user_id, "\n".join(lines), reply_markup=MARKUP_MAIN)
 
 
 def show_portfolio_for_deletion(user_id, message):
@@ -475,41 +581,86 @@ def show_portfolio_for_deletion(user_id, message):
 
     bot.send_message(user_id, "📋 Выберите акцию для удаления:", reply_markup=markup)
 
-    bot.register_next_step_handler(message, process_ticker_selection, user_id)
+    CONVERSATION.expect(message.chat.id, process_ticker_selection, user_id)
 
 
-def show_full_portfolio(user_id):
-    if user_id not in USER_PORTFOLIOS or not USER_PORTFOLIOS[user_id]:
-        bot.send_message(user_id, "💼 Ваш портфель пуст.", reply_markup=MARKUP_MAIN)
-        return
+def set_valuation(user_id, ticker, quantity):
+    stock_info = INSTRUMENTS.by_ticker(ticker)
+    if stock_info is not None:
+        VALUATIONS.set_position(user_id, stock_info.figi, stock_info.currency, quantity)
+
 
-    portfolio_msg = "💼 Ваш портфель:\n\n"
-    total_value = 0
+def load_valuations():
+    started = time.perf_counter()
+    for user_id, positions in USER_PORTFOLIOS.items():
+        for ticker, quantity in positions.items():
+            set_valuation(user_id, ticker, quantity)
+    print(f"Позиции портфелей загружены за {time.perf_counter() - started:.3f} с: {len(VALUATIONS)}")
 
-    with Client(os.getenv("API_TOKEN_INVEST")) as client:
-        for ticker in USER_PORTFOLIOS[user_id]:
-            try:
-                instruments = client.instruments
-                r = DataFrame(
-                    instruments.shares().instruments,
-                    columns=['name', 'figi', 'ticker']
-                )
-                figi = r[r['ticker'] == ticker]['figi'].iloc[0]
 
-                k = client.market_data.get_last_prices(figi=[str(figi)])
-                massive = list(str(k).split(','))
-                tmp1 = "".join(massive[1]).split("=")
-                tmp2 = "".join(massive[2]).split("=")
-                price = float(f'{tmp1[2]}.{(tmp2[1])[:2]}'.rstrip(''')( /.,'''))
-                total_value += price
+def update_valuations(figis):
+    quotes = QUOTE_CACHE.get_last_prices(figis)
+    VALUATIONS.update({figi: quote.price for figi, quote in quotes.items()}, FX.rates(VALUATIONS.currencies()))
 
-                portfolio_msg += f"{ticker}: {price} руб.\n"
 
-            except Exception:
-                portfolio_msg += f"{ticker}: не удалось получить цену.\n"
+def trading_figis(figis, now):
+    CALENDAR.ensure_fresh(now)
+    trading = []
+    for figi in figis:
+        stock_info = INSTRUMENTS.by_figi(figi)
+        if CALENDAR.is_open(stock_info.exchange if stock_info is not None else None, now):
+            trading.append(figi)
+    return trading
 
-    portfolio_msg += f"\n💰Общая стоимость: {round(total_value, 2)} руб."
-    bot.send_message(user_id, portfolio_msg, reply_markup=MARKUP_MAIN)
+
+def refresh_valuations():
+    while True:
+        try:
+            figis = trading_figis(VALUATIONS.instruments(), time.time())
+            if figis:
+                update_valuations(figis)
+        except Exception as e:
+            print(f"Ошибка переоценки портфелей: {str(e)}")
+        time.sleep(VALUATION_INTERVAL)
+
+
+def show_full_portfolio(user_id):
+    if user_id not in USER_PORTFOLIOS or not USER_PORTFOLIOS[user_id]:
+        bot.send_message(user_id, "💼 Ваш портфель пуст.", reply_markup=MARKUP_MAIN)
+        return
+
+    positions = VALUATIONS.positions(user_id)
+    unpriced = [figi for figi, (_, _, value) in positions.items() if value is None]
+    if unpriced:
+        try:
+            update_valuations(unpriced)
+            positions = VALUATIONS.positions(user_id)
+        except Exception as e:
+            print(f"Ошибка получения цен портфеля {user_id}: {str(e)}")
+
+    lines = ["💼 Ваш портфель:\n"]
+    missing = 0
+    for ticker, quantity in USER_PORTFOLIOS[user_id].items():
+        stock_info = INSTRUMENTS.by_ticker(ticker)
+        position = positions.get(stock_info.figi) if stock_info is not None else None
+        if position is None or position[1] is None:
+            missing += 1
+            lines.append(f"{ticker}: не удалось получить цену.")
+            continue
+        _, price, value = position
+        line = f"{ticker}: {quantity:g} × {format_price(price)} {stock_info.currency}"
+        if value is None:
+            missing += 1
+            lines.append(f"{line} (нет курса валюты)")
+        elif stock_info.currency.lower() == BASE_CURRENCY:
+            lines.append(f"{line} = {format_price(value)} руб.")
+        else:
+            lines.append(f"{line} ≈ {format_price(value)} руб.")
+
+    lines.append(f"\n💰Общая стоимость: {VALUATIONS.total(user_id):.2f} руб.")
+    if missing:
+        lines.append(f"(без учёта позиций без цены: {missing})")
+    bot.send_message(user_id, "\n".join(lines), reply_markup=MARKUP_MAIN)
 
 
 def process_ticker_selection(message, user_id):
@@ -518,34 +669,22 @@ def process_ticker_selection(message, user_id):
         return
 
     selected_ticker = message.text
-    if selected_ticker in USER_PORTFOLIOS.get(user_id, []):
-        USER_PORTFOLIOS[user_id].remove(selected_ticker)
+    if selected_ticker in USER_PORTFOLIOS.get(user_id, {}):
+        del USER_PORTFOLIOS[user_id][selected_ticker]
+        set_valuation(user_id, selected_ticker, 0)
         bot.send_message(user_id, f"✅ Акция {selected_ticker} успешно удалена из портфеля.", reply_markup=MARKUP_MAIN)
-        delete_from_portfolio(user_id, ticker)
+        delete_from_portfolio(user_id, selected_ticker)
     else:
         bot.send_message(user_id, "❌ Указанная акция не найдена в вашем портфеле.", reply_markup=MARKUP_MAIN)
 
 
 def delete_from_portfolio(user_id, ticker):
-    conn = None
     try:
-        conn = sqlite3.connect('database.sqlite')
-        cursor = conn.cursor()
-        cursor.execute("""
-            DELETE FROM portfolios 
-            WHERE user_id = ? AND ticker = ?
-        """, (user_id, ticker))
-        conn.commit()
+        STORAGE.delete_from_portfolio(user_id, ticker)
     except sqlite3.Error as e:
         print(f"Ошибка базы данных: {e}")
-        if conn:
-            conn.rollback()
-    finally:
-        if conn:
-            conn.close()
 
 
-@bot.message_handler(commands=['alerts'])
 def alerts(message):
     user_id = message.chat.id
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
@@ -558,7 +697,7 @@ def alerts(message):
 
     bot.send_message(user_id, "🔔 Управление уведомлениями:", reply_markup=markup)
 
-    bot.register_next_step_handler(message, process_alerts)
+    CONVERSATION.expect(message.chat.id, process_alerts)
 
 
 def process_alerts(message):
@@ -571,7 +710,7 @@ def process_alerts(message):
         markup.add(*buttons)
         markup.add(types.KeyboardButton("Отмена"))
         bot.send_message(user_id, "Введите или выберите тикер акции для уведомления:", reply_markup=markup)
-        bot.register_next_step_handler(message, add_alert_step1)
+        CONVERSATION.expect(message.chat.id, add_alert_step1)
     elif text == "удалить уведомление":
         show_alerts_for_deletion(user_id)
     elif text == "мои уведомления":
@@ -590,85 +729,181 @@ def add_alert_step1(message):
         return
 
     try:
-        with Client(os.getenv("API_TOKEN_INVEST")) as cl:
-            instruments = cl.instruments
-            r = DataFrame(
-                instruments.shares().instruments,
-                columns=['name', 'figi', 'ticker']
-            )
-
-            if ticker not in r['ticker'].values:
+        if INSTRUMENTS.by_ticker(ticker) is None:
+            if not suggest_tickers(message, ticker, add_alert_step1):
                 bot.send_message(user_id, "❌ Данный тикер не найден.", reply_markup=MARKUP_MAIN)
-                return
+            return
 
-            bot.send_message(user_id, f"Введите процент изменения цены для уведомления (например, 5 для 5%):",
-                             reply_markup=types.ReplyKeyboardRemove())
-            bot.register_next_step_handler(message, add_alert_step2, ticker)
+        markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
+        markup.row(types.KeyboardButton("Изменение цены"), types.KeyboardButton("Изменение за период"))
+        markup.row(types.KeyboardButton("Уровень цены"), types.KeyboardButton("Отмена"))
+        bot.send_message(user_id, "Выберите тип уведомления:", reply_markup=markup)
+        CONVERSATION.expect(message.chat.id, add_alert_type, ticker)
 
     except Exception:
         bot.send_message(user_id, f"❌ Ошибка, попробуйте снова.", reply_markup=MARKUP_MAIN)
 
 
-def add_alert_step2(message, ticker):
+def add_alert_type(message, ticker):
     user_id = message.chat.id
+    text = message.text.lower()
+
+    if text == "изменение цены":
+        bot.send_message(user_id, f"Введите процент изменения цены для уведомления (например, 5 для 5%):",
+                         reply_markup=types.ReplyKeyboardRemove())
+        CONVERSATION.expect(message.chat.id, add_alert_step2, ticker)
+    elif text == "изменение за период":
+        markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=4)
+        markup.add(*[types.KeyboardButton(window) for window in ALERT_WINDOWS])
+        markup.add(types.KeyboardButton("Отмена"))
+        bot.send_message(user_id, "Выберите период, за который отслеживать изменение:", reply_markup=markup)
+        CONVERSATION.expect(message.chat.id, add_alert_window, ticker)
+    elif text == "уровень цены":
+        try:
+            stock_info = INSTRUMENTS.by_ticker(ticker)
+            quote = QUOTE_CACHE.get_last_price(stock_info.figi)
+        except Exception as e:
+            bot.send_message(user_id, api_error_message(e, "❌ Ошибка, попробуйте снова."), reply_markup=MARKUP_MAIN)
+            return
+        current = f"Текущая цена {ticker}: {format_price(quote.price)} {stock_info.currency}\n" if quote else ""
+        bot.send_message(user_id, f"{current}Введите уровень, например «выше 310» или «ниже 280»:",
+                         reply_markup=types.ReplyKeyboardRemove())
+        CONVERSATION.expect(message.chat.id, add_alert_level, ticker)
+    elif text == "отмена":
+        bot.send_message(user_id, "❌ Действие отменено.", reply_markup=MARKUP_MAIN)
+    else:
+        bot.send_message(user_id, "❌ Неизвестный тип уведомления.", reply_markup=MARKUP_MAIN)
+
+
+def add_alert_window(message, ticker):
+    user_id = message.chat.id
+    if message.text.lower() == "отмена":
+        bot.send_message(user_id, "❌ Действие отменено.", reply_markup=MARKUP_MAIN)
+        return
+
     try:
-        percent = float(message.text)
+        minutes = int(message.text.split()[0])
+        if minutes <= 0 or minutes * 60 > HISTORY.capacity * HISTORY.min_interval:
+            raise ValueError(minutes)
+    except (ValueError, IndexError):
+        bot.send_message(user_id, "❌ Некорректный период.", reply_markup=MARKUP_MAIN)
+        return
+
+    bot.send_message(user_id, f"Введите процент изменения цены за {minutes} мин (например, 3 для 3%):",
+                     reply_markup=types.ReplyKeyboardRemove())
+    CONVERSATION.expect(message.chat.id, add_alert_step2, ticker, minutes * 60)
 
-        if user_id not in USER_ALERTS:
-            USER_ALERTS[user_id] = {}
 
-        USER_ALERTS[user_id][ticker] = percent
+def describe_window(window):
+    return f" за {window / 60:g} мин" if window else ""
 
-        with Client(os.getenv("API_TOKEN_INVEST")) as client:
-            instruments = client.instruments
-            r = DataFrame(
-                instruments.shares().instruments,
-                columns=['name', 'figi', 'ticker']
-            )
-            figi = r[r['ticker'] == ticker]['figi'].iloc[0]
-            k = client.market_data.get_last_prices(figi=[str(figi)])
-            massive = list(str(k).split(','))
-            tmp1 = "".join(massive[1]).split("=")
-            tmp2 = "".join(massive[2]).split("=")
-            current_price = float(f'{tmp1[2]}.{(tmp2[1])[:2]}'.rstrip(''')( /.,'''))
-            USER_ALERTS[user_id][f"{ticker}_price"] = current_price
-        bot.send_message(user_id, f"🔔 Уведомление для {ticker} на {percent}% успешно добавлено!",
+
+def describe_level(level, direction):
+    return f"{'выше' if direction == ABOVE else 'ниже'} {format_price(level)}"
+
+
+def parse_level(text, price):
+    match = re.fullmatch(r"\s*(выше|ниже|above|below|>|<)?\s*([\d\s]+(?:[.,]\d+)?)\s*", text.lower())
+    if match is None:
+        raise ValueError(text)
+    level = float(re.sub(r"\s", "", match.group(2)).replace(",", "."))
+    if level <= 0:
+        raise ValueError(level)
+    return level, LEVEL_WORDS.get(match.group(1)) or (ABOVE if level > price else BELOW)
+
+
+def add_alert_level(message, ticker):
+    user_id = message.chat.id
+    if message.text.lower() == "отмена":
+        bot.send_message(user_id, "❌ Действие отменено.", reply_markup=MARKUP_MAIN)
+        return
+
+    try:
+        stock_info = INSTRUMENTS.by_ticker(ticker)
+        price = QUOTE_CACHE.get_last_price(stock_info.figi).price
+        level, direction = parse_level(message.text, price)
+    except ValueError:
+        bot.send_message(user_id, "❌ Некорректный уровень.", reply_markup=MARKUP_MAIN)
+        return
+    except Exception as e:
+        bot.send_message(user_id, api_error_message(e, "❌ Ошибка, попробуйте снова."), reply_markup=MARKUP_MAIN)
+        return
+
+    if (level <= price) if direction == ABOVE else (level >= price):
+        bot.send_message(user_id, f"❌ Цена {ticker} уже {describe_level(level, direction)}: "
+                                  f"сейчас {format_price(price)}.", reply_markup=MARKUP_MAIN)
+        return
+    try:
+        STORAGE.save_level_alert(user_id, stock_info.figi, stock_info.ticker, level, direction)
+    except sqlite3.Error:
+        bot.send_message(user_id, ALERT_SAVE_ERROR, reply_markup=MARKUP_MAIN)
+        return
+    ALERTS.add_level(user_id, stock_info.figi, stock_info.ticker, level, direction)
+    sync_alert_checks()
+    bot.send_message(user_id, f"🔔 Уведомление для {stock_info.ticker}: цена {describe_level(level, direction)} "
+                              f"успешно добавлено! После срабатывания оно отключится.", reply_markup=MARKUP_MAIN)
+
+
+def add_alert_step2(message, ticker, window=0):
+    user_id = message.chat.id
+    try:
+        percent = float(message.text)
+
+        figi = INSTRUMENTS.by_ticker(ticker).figi
+        baseline = QUOTE_CACHE.get_last_price(figi).price
+        STORAGE.save_alert(user_id, figi, ticker, percent, baseline, window)
+        created = ALERTS.add(user_id, figi, ticker, percent, baseline, window)
+        sync_alert_checks()
+        bot.send_message(user_id, f"🔔 Уведомление для {ticker}{describe_window(window)} "
+                                  f"{'успешно добавлено' if created else 'обновлено'}: порог {percent}%!",
                          reply_markup=MARKUP_MAIN)
 
-    except Exception:
-        bot.send_message(user_id, f"❌ Некорректная запись.", reply_markup=MARKUP_MAIN)
+    except sqlite3.Error:
+        bot.send_message(user_id, ALERT_SAVE_ERROR, reply_markup=MARKUP_MAIN)
+    except Exception as e:
+        bot.send_message(user_id, api_error_message(e, "❌ Некорректная запись."), reply_markup=MARKUP_MAIN)
+
+
+def alert_label(alert):
+    return f"{alert.ticker} {alert.threshold:g}%{describe_window(alert.window)}"
+
+
+def level_label(alert):
+    return f"{alert.ticker} {describe_level(alert.level, alert.direction)}"
 
 
 def show_user_alerts(user_id):
-    if user_id not in USER_ALERTS or not USER_ALERTS[user_id]:
+    user_alerts = ALERTS.user_alerts(user_id)
+    user_levels = ALERTS.user_levels(user_id)
+    if not user_alerts and not user_levels:
         bot.send_message(user_id, "🔔 У вас нет активных уведомлений", reply_markup=MARKUP_MAIN)
         return
 
     alerts_msg = "🔔 Ваши активные уведомления:\n\n"
-    for ticker in [k for k in USER_ALERTS[user_id].keys() if not k.endswith("_price")]:
-        alerts_msg += f"{ticker}: уведомление при изменении на {USER_ALERTS[user_id][ticker]}%\n"
+    for alert in user_alerts:
+        alerts_msg += f"{alert.ticker}: уведомление при изменении на {alert.threshold}%" \
+                      f"{describe_window(alert.window)}\n"
+    for alert in user_levels:
+        alerts_msg += f"{alert.ticker}: уведомление, когда цена будет {describe_level(alert.level, alert.direction)}\n"
 
     bot.send_message(user_id, alerts_msg, reply_markup=MARKUP_MAIN)
 
 
 def show_alerts_for_deletion(user_id):
-    if user_id not in USER_ALERTS or not USER_ALERTS[user_id]:
+    user_alerts = ALERTS.user_alerts(user_id)
+    user_levels = ALERTS.user_levels(user_id)
+    if not user_alerts and not user_levels:
         bot.send_message(user_id, "🔔 У вас нет активных уведомлений.", reply_markup=MARKUP_MAIN)
         return
 
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=3, one_time_keyboard=True)
-    tickers = [k for k in USER_ALERTS[user_id].keys() if not k.endswith("_price")]
-
-    if not tickers:
-        bot.send_message(user_id, "🔔 Нет уведомлений для удаления.", reply_markup=MARKUP_MAIN)
-        return
-
-    buttons = [types.KeyboardButton(tick) for tick in tickers]
+    buttons = [types.KeyboardButton(alert_label(alert)) for alert in user_alerts]
+    buttons += [types.KeyboardButton(level_label(alert)) for alert in user_levels]
     markup.add(*buttons)
     markup.add(types.KeyboardButton("Отмена"))
 
-    msg = bot.send_message(user_id, "📋 Выберите уведомление для удаления:", reply_markup=markup)
-    bot.register_next_step_handler(msg, process_alert_deletion, user_id)
+    bot.send_message(user_id, "📋 Выберите уведомление для удаления:", reply_markup=markup)
+    CONVERSATION.expect(user_id, process_alert_deletion, user_id)
 
 
 def process_alert_deletion(message, user_id):
@@ -676,65 +911,268 @@ def process_alert_deletion(message, user_id):
         bot.send_message(user_id, "❌ Действие отменено.", reply_markup=MARKUP_MAIN)
         return
 
+    levels = [alert for alert in ALERTS.user_levels(user_id) if level_label(alert) == message.text]
+    user_alerts = ALERTS.user_alerts(user_id)
+    selected = [alert for alert in user_alerts if alert_label(alert) == message.text]
     ticker = message.text.upper()
-    if ticker in USER_ALERTS.get(user_id, {}):
-        del USER_ALERTS[user_id][ticker]
-        if f"{ticker}_price" in USER_ALERTS[user_id]:
-            del USER_ALERTS[user_id][f"{ticker}_price"]
-        bot.send_message(user_id, f"✅ Уведомления для {ticker} успешно удалены.", reply_markup=MARKUP_MAIN)
+    if not selected and not levels:
+        selected = [alert for alert in user_alerts if alert.ticker == ticker]
+    try:
+        for alert in levels:
+            STORAGE.delete_level_alert(user_id, alert.figi, alert.level)
+        for alert in selected:
+            STORAGE.delete_alert(user_id, alert.figi, alert.window)
+    except sqlite3.Error:
+        bot.send_message(user_id, "❌ Не удалось удалить уведомление, попробуйте ещё раз.", reply_markup=MARKUP_MAIN)
+        return
+
+    removed = [level_label(alert) for alert in levels if ALERTS.remove_level(user_id, alert.figi, alert.level)]
+    removed += [alert_label(alert) for alert in selected if ALERTS.remove(user_id, alert.figi, alert.window)]
+    if removed:
+        sync_alert_checks()
+        bot.send_message(user_id, f"✅ Удалено уведомлений: {', '.join(removed)}.",
+                         reply_markup=MARKUP_MAIN)
     else:
-        bot.send_message(user_id, f"❌ Уведомление для {ticker} не найдено.", reply_markup=MARKUP_MAIN)
+        bot.send_message(user_id, f"❌ Уведомление {message.text} не найдено.", reply_markup=MARKUP_MAIN)
+
+
+def notify_alerts(fired):
+    STORAGE.update_alert_baselines([alert for alert in fired if alert.direction is None])
+    STORAGE.delete_fired_levels([alert for alert in fired if alert.direction is not None])
+    enqueue_alert_notifications(fired)
+
+
+def enqueue_alert_notifications(fired):
+    for alert in fired:
+        if alert.direction is not None:
+            OUTBOX.enqueue(
+                alert.user_id,
+                f"🎯 {alert.ticker}: цена {'поднялась' if alert.direction == ABOVE else 'опустилась'} до уровня "
+                f"{format_price(alert.threshold)}!\n"
+                f"Текущая цена: {format_price(alert.new_price)}\n"
+                f"Уведомление отключено."
+            )
+            continue
+        direction = "выросла" if alert.new_price > alert.old_price else "упала"
+        OUTBOX.enqueue(
+            alert.user_id,
+            f"🚨 {alert.ticker}: цена {direction} на {round(alert.change, 2)}%{describe_window(alert.window)}!\n"
+            f"Старая цена: {format_price(alert.old_price)}\n"
+            f"Текущая цена: {format_price(alert.new_price)}"
+        )
+
+
+def on_stream_price(figi, price):
+    notify_alerts(ALERTS.evaluate(figi, price))
+    VALUATIONS.update({figi: price})
+
+
+def sync_alert_checks():
+    figis = ALERTS.instruments()
+    SCHEDULER.sync(figis)
+    if STREAM is not None:
+        STREAM.sync(figis)
+
+
+def check_prices_once(figis=None):
+    tracked = ALERTS.instruments()
+    HISTORY.retain(tracked)
+    quotes = QUOTES.get_last_prices(tracked if figis is None else figis)
+    QUOTE_CACHE.put_many(quotes)
+    notify_alerts(ALERTS.evaluate_many(quotes))
+    VALUATIONS.update({figi: quote.price for figi, quote in quotes.items()})
+    return quotes
 
 
 def check_price_changes():
     while True:
+        if STREAM is not None and STREAM.connected:
+            STREAM.wait_disconnected(ALERT_CHECK_INTERVAL)
+            continue
+
+        started = time.perf_counter()
         try:
-            for user_id in list(USER_ALERTS.keys()):
-                if not USER_ALERTS[user_id]:
-                    continue
-                with Client(os.getenv("API_TOKEN_INVEST")) as client:
-                    instruments = client.instruments
-                    r = DataFrame(
-                        instruments.shares().instruments,
-                        columns=['name', 'figi', 'ticker']
-                    )
-                    alerts_to_check = [k for k in USER_ALERTS[user_id].keys() if not k.endswith("_price")]
-                    for ticker in alerts_to_check:
-                        try:
-                            figi = r[r['ticker'] == ticker]['figi'].iloc[0]
-                            k = client.market_data.get_last_prices(figi=[str(figi)])
-                            massive = list(str(k).split(','))
-                            tmp1 = "".join(massive[1]).split("=")
-                            tmp2 = "".join(massive[2]).split("=")
-                            current_price = float(f'{tmp1[2]}.{(tmp2[1])[:2]}'.rstrip(''')( /.,'''))
-
-                            old_price = USER_ALERTS[user_id].get(f"{ticker}_price", current_price)
-                            percent_change = abs((current_price - old_price) / old_price * 100)
-                            alert_percent = USER_ALERTS[user_id][ticker]
-
-                            if percent_change >= alert_percent:
-                                direction = "выросла" if current_price > old_price else "упала"
-                                bot.send_message(
-                                    user_id,
-                                    f"🚨 {ticker}: цена {direction} на {round(percent_change, 2)}%!\n"
-                                    f"Старая цена: {old_price}\n"
-                                    f"Текущая цена: {current_price}"
-                                )
-                                USER_ALERTS[user_id][f"{ticker}_price"] = current_price
-
-                        except Exception as e:
-                            print(f"Ошибка при проверке {ticker} для пользователя {user_id}: {str(e)}")
-                            continue
+            SCHEDULER.run_once()
         except Exception as e:
             print(f"Ошибка в check_price_changes: {str(e)}")
+        duration = time.perf_counter() - started
+        METRICS.set("alert_cycle_seconds", duration)
+        METRICS.set("alert_cycle_utilization", duration / (duration + SCHEDULER.last_wait))
+
+        SCHEDULER.wait(ALERT_CHECK_INTERVAL)
+
 
-        time.sleep(300)
+def start_alert_worker(index):
+    process = multiprocessing.get_context("spawn").Process(
+        target=run_worker, args=(STORAGE.db_name, index), daemon=True,
+        kwargs={"min_interval": SCHEDULER.min_interval, "max_interval": SCHEDULER.max_interval,
+                "quota_scale": api_quota_share()})
+    process.start()
+    return process
+
+
+def deliver_alerts():
+    while True:
+        for index, process in enumerate(WORKERS):
+            if not process.is_alive():
+                print(f"Воркер уведомлений {index} завершился с кодом {process.exitcode}, перезапуск")
+                WORKERS[index] = start_alert_worker(index)
+        try:
+            if COORDINATOR.acquire(DELIVERY_LEASE):
+                fired = DELIVERIES.take(COORDINATOR)
+                for alert in fired:
+                    if alert.direction is not None:
+                        ALERTS.remove_level(alert.user_id, alert.figi, alert.threshold)
+                enqueue_alert_notifications(fired)
+        except Exception as e:
+            print(f"Ошибка доставки уведомлений: {str(e)}")
+
+        time.sleep(ALERT_DELIVERY_INTERVAL)
 
 
-@bot.message_handler(func=lambda message: True)
 def empty(message):
     bot.send_message(message.chat.id, '❌ Неизвестный текст, воспользуйтесь функциями', reply_markup=MARKUP_MAIN)
 
 
-threading.Thread(target=check_price_changes, daemon=True).start()
-bot.polling(none_stop=True)
+def popular_figis():
+    return [stock_info.figi for stock_info in map(INSTRUMENTS.by_ticker, POPULAR_TICKERS) if stock_info is not None]
+
+
+def load_state():
+    started = time.perf_counter()
+    for user_id, password in STORAGE.load_users().items():
+        USER_DB[user_id] = {"password": password, "portfolio": [], "alerts": {}}
+    USER_PORTFOLIOS.update(STORAGE.load_portfolios())
+    ALERTS.load(STORAGE.load_alerts())
+    ALERTS.load_levels(STORAGE.load_level_alerts())
+    print(f"Состояние загружено за {time.perf_counter() - started:.3f} с: "
+          f"пользователей {len(USER_DB)}, портфелей {len(USER_PORTFOLIOS)}, уведомлений {len(ALERTS)}")
+
+
+CONVERSATION_STEPS = [register_finish, login_finish, process_ticker, process_portfolio, add_to_portfolio,
+                      add_to_portfolio_quantity, process_ticker_selection, process_alerts, add_alert_step1,
+                      add_alert_type, add_alert_window, add_alert_step2, add_alert_level, process_alert_deletion]
+
+
+def register_handlers(bot):
+    for step in CONVERSATION_STEPS:
+        CONVERSATION.register(step.__name__, timed_handler(step))
+    bot.register_message_handler(timed_handler(import_portfolio), content_types=['document'])
+    bot.register_message_handler(CONVERSATION.resume, func=lambda m: CONVERSATION.pending(m.chat.id))
+    bot.register_message_handler(timed_handler(start), commands=['start'])
+    bot.register_message_handler(timed_handler(register_start), func=lambda m: m.text.lower() == "зарегистрироваться")
+    bot.register_message_handler(timed_handler(login_start), func=lambda m: m.text.lower() == "авторизоваться")
+    bot.register_message_handler(timed_handler(help), commands=['help'])
+    bot.register_message_handler(timed_handler(find_price), commands=['find_price'])
+    bot.register_message_handler(timed_handler(chart), commands=['chart'])
+    bot.register_message_handler(timed_handler(export_menu), commands=['export'])
+    bot.register_message_handler(timed_handler(export_txt), func=lambda m: m.text.lower() in ["📝 txt", "txt"])
+    bot.register_message_handler(timed_handler(export_csv), func=lambda m: m.text.lower() in ["📊 csv", "csv"])
+    bot.register_message_handler(timed_handler(export_sql), func=lambda m: m.text.lower() in ["🗃️ sql", "sql"])
+    bot.register_message_handler(timed_handler(portfolio), commands=['portfolio'])
+    bot.register_message_handler(timed_handler(alerts), commands=['alerts'])
+    bot.register_message_handler(timed_handler(empty), func=lambda message: True)
+
+
+def create_app(token=None, db_name=DB_NAME, client_factory=None):
+    global bot, DISPATCHER, OUTBOX, STORAGE, POOL, GATEWAY, INSTRUMENTS, QUOTES, QUOTE_CACHE, SEARCH, HISTORY, ALERTS, \
+        CALENDAR, SCHEDULER, COORDINATOR, DELIVERIES, CONVERSATION, FX, VALUATIONS, CANDLES, \
+        EXPORT_GZIP_ROWS, METRICS
+    METRICS = Metrics(enabled=os.getenv("METRICS", "1") != "0")
+    bot = telebot.TeleBot(token or os.getenv("API_TOKEN"), threaded=False)
+    if METRICS.enabled:
+        bot.send_message = METRICS.timed("telegram_request_seconds", bot.send_message, method="send_message")
+        bot.send_document = METRICS.timed("telegram_request_seconds", bot.send_document, method="send_document")
+        bot.send_photo = METRICS.timed("telegram_request_seconds", bot.send_photo, method="send_photo")
+        bot.get_file = METRICS.timed("telegram_request_seconds", bot.get_file, method="get_file")
+        bot.download_file = METRICS.timed("telegram_request_seconds", bot.download_file, method="download_file")
+    DISPATCHER = ChatDispatcher(lambda update: telebot.TeleBot.process_new_updates(bot, [update]),
+                                workers=int(os.getenv("BOT_WORKERS", 8)))
+    bot.process_new_updates = dispatch_updates
+    OUTBOX = Outbox(bot.send_message, senders=int(os.getenv("OUTBOX_SENDERS", 4)))
+
+    STORAGE = Storage(db_name)
+    state_ttl = float(os.getenv("STATE_TTL", STATE_TTL))
+    if os.getenv("STATE_BACKEND", "sqlite") == "memory":
+        CONVERSATION = Conversation(MemoryStateStore(ttl=state_ttl))
+    else:
+        CONVERSATION = Conversation(SqliteStateStore(STORAGE, ttl=state_ttl))
+    POOL = ClientPool(client_factory or new_invest_client, size=int(os.getenv("INVEST_POOL_SIZE", 2)),
+                      max_concurrency=int(os.getenv("INVEST_MAX_CONCURRENCY", 8)))
+    GATEWAY = ApiGateway(lambda: timed_client(POOL.client(), METRICS), scale=api_quota_share(),
+                         max_wait=float(os.getenv("INVEST_MAX_WAIT", 5)))
+    INSTRUMENTS = InstrumentIndex(invest_client, STORAGE)
+    QUOTES = QuoteService(invest_client)
+    QUOTE_CACHE = QuoteCache(QUOTES, ttl=float(os.getenv("QUOTE_TTL", 5)))
+    SEARCH = InstrumentSearch(INSTRUMENTS, limit=int(os.getenv("SEARCH_SUGGESTIONS", 6)))
+    HISTORY = TickHistory()
+    FX = FxRates(invest_client, QUOTES, ttl=float(os.getenv("FX_TTL", FX_TTL)))
+    VALUATIONS = PortfolioValuations()
+    CANDLES = CandleStore(invest_client, STORAGE)
+    ALERTS = AlertEngine(history=HISTORY)
+    CALENDAR = TradingCalendar(invest_client, STORAGE)
+    SCHEDULER = AlertScheduler(check_prices_once, ALERTS, CALENDAR, INSTRUMENTS,
+                               min_interval=float(os.getenv("ALERT_MIN_INTERVAL", 120)),
+                               max_interval=float(os.getenv("ALERT_MAX_INTERVAL", 900)))
+    COORDINATOR = LeaseCoordinator(STORAGE, f"bot:{worker_id()}")
+    DELIVERIES = AlertDeliveries(STORAGE)
+    EXPORT_GZIP_ROWS = int(os.getenv("EXPORT_GZIP_ROWS", 200))
+    METRICS.collector(collect_stats)
+
+    register_handlers(bot)
+    return bot
+
+
+def start_services():
+    global STREAM
+    load_state()
+    CALENDAR.load()
+    SCHEDULER.sync(ALERTS.instruments())
+    STORAGE.start()
+    POOL.start()
+    INSTRUMENTS.start()
+    load_valuations()
+    DISPATCHER.start()
+    if os.getenv("QUOTE_PREWARM") == "1":
+        QUOTE_CACHE.start_prewarm(popular_figis)
+    OUTBOX.start()
+    if os.getenv("ALERTS_MODE") == "sharded":
+        WORKERS.extend(start_alert_worker(index) for index in range(int(os.getenv("ALERT_WORKERS", 2))))
+        threading.Thread(target=deliver_alerts, daemon=True).start()
+    else:
+        if os.getenv("ALERTS_MODE") == "stream":
+            STREAM = PriceStream(lambda: TinkoffMarketDataStream(new_invest_client), on_stream_price)
+            STREAM.start(ALERTS.instruments())
+        threading.Thread(target=check_price_changes, daemon=True).start()
+    threading.Thread(target=refresh_valuations, daemon=True).start()
+    if METRICS.enabled:
+        MetricsServer(METRICS, host=os.getenv("METRICS_HOST", "127.0.0.1"),
+                      port=int(os.getenv("METRICS_PORT", 9108))).serve_in_background()
+
+
+def serve():
+    if os.getenv("BOT_MODE") == "webhook":
+        if not os.getenv("WEBHOOK_SECRET"):
+            raise SystemExit("Для режима webhook необходимо задать WEBHOOK_SECRET")
+        webhook_url = os.getenv("WEBHOOK_URL", "")
+        if not webhook_url.startswith("https://") or not webhook_url.endswith(WEBHOOK_PATH):
+            raise SystemExit(f"Для режима webhook необходимо задать WEBHOOK_URL вида https://<хост>{WEBHOOK_PATH}")
+        webhook = WebhookServer(dispatch_updates, os.getenv("WEBHOOK_SECRET"),
+                                host=os.getenv("WEBHOOK_HOST", "0.0.0.0"), port=int(os.getenv("WEBHOOK_PORT", 8443)),
+                                parse=types.Update.de_json)
+        bot.set_webhook(url=webhook_url, secret_token=os.getenv("WEBHOOK_SECRET"))
+        webhook.serve_forever()
+    else:
+        bot.remove_webhook()
+        bot.polling(none_stop=True)
+
+
+def main():
+    load_dotenv()
+    create_app()
+    start_services()
+    serve()
+
+
+if __name__ == "__main__":
+    main()
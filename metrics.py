@@ -0,0 +1,219 @@
+import functools
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRICS_PATH = "/metrics"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels_text(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class Metrics:
+    def __init__(self, enabled=True, buckets=BUCKETS):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _observe(self, name, key, value):
+        with self._lock:
+            histogram = self._histograms.get((name, key))
+            if histogram is None:
+                histogram = self._histograms[(name, key)] = Histogram(len(self.buckets) + 1)
+            histogram.counts[bisect_left(self.buckets, value)] += 1
+            histogram.sum += value
+            histogram.count += 1
+
+    def observe(self, name, value, **labels):
+        if self.enabled:
+            self._observe(name, _key(labels), value)
+
+    def inc(self, name, value=1, **labels):
+        if self.enabled:
+            key = (name, _key(labels))
+            with self._lock:
+                self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        if self.enabled:
+            with self._lock:
+                self._gauges[(name, _key(labels))] = value
+
+    @contextmanager
+    def timer(self, name, **labels):
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._observe(name, _key(labels), time.perf_counter() - started)
+
+    def timed(self, name, fn, **labels):
+        if not self.enabled:
+            return fn
+        key = _key(labels)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._observe(name, key, time.perf_counter() - started)
+
+        return wrapper
+
+    def collector(self, collect):
+        self._collectors.append(collect)
+        return collect
+
+    def render(self):
+        with self._lock:
+            histograms = {key: (list(h.counts), h.sum, h.count) for key, h in self._histograms.items()}
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+        for collect in self._collectors:
+            for kind, name, value, labels in collect():
+                (counters if kind == "counter" else gauges)[(name, _key(labels))] = value
+
+        lines = []
+        for kind, values in (("counter", counters), ("gauge", gauges)):
+            names = sorted({name for name, _ in values})
+            for name in names:
+                lines.append(f"# TYPE {name} {kind}")
+                for (metric, key), value in sorted(values.items()):
+                    if metric == name:
+                        lines.append(f"{name}{_labels_text(key)} {_number(value)}")
+
+        for name in sorted({name for name, _ in histograms}):
+            lines.append(f"# TYPE {name} histogram")
+            for (metric, key), (counts, total, count) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, bucket in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket
+                    le = "+Inf" if bound == float("inf") else _number(bound)
+                    lines.append(f"{name}_bucket{_labels_text(key, [('le', le)])} {cumulative}")
+                lines.append(f"{name}_sum{_labels_text(key)} {total!r}")
+                lines.append(f"{name}_count{_labels_text(key)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+class TimedService:
+    def __init__(self, service, name, metrics):
+        self._service = service
+        self._name = name
+        self._metrics = metrics
+
+    def __getattr__(self, method):
+        target = getattr(self._service, method)
+        if not callable(target):
+            return target
+        key = (("method", f"{self._name}.{method}"),)
+        metrics = self._metrics
+
+        def call(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return target(*args, **kwargs)
+            finally:
+                metrics._observe("invest_rpc_seconds", key, time.perf_counter() - started)
+
+        return call
+
+
+class TimedServices:
+    def __init__(self, services, metrics):
+        self._services = services
+        self._metrics = metrics
+
+    def __getattr__(self, name):
+        return TimedService(getattr(self._services, name), name, self._metrics)
+
+
+@contextmanager
+def timed_client(client, metrics):
+    with client as services:
+        yield TimedServices(services, metrics) if metrics.enabled else services
+
+
+class MetricsServer:
+    def __init__(self, metrics, host="127.0.0.1", port=9108, path=METRICS_PATH):
+        self.metrics = metrics
+        self.path = path
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+
+    @property
+    def address(self):
+        return self._httpd.server_address
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.handle_get(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def handle_get(self, request):
+        if request.path != self.path:
+            request.send_response(404)
+            request.send_header("Content-Length", "0")
+            request.end_headers()
+            return
+        body = self.metrics.render().encode()
+        request.send_response(200)
+        request.send_header("Content-Type", CONTENT_TYPE)
+        request.send_header("Content-Length", str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+    def serve_in_background(self):
+        thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def shutdown(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
@@ -0,0 +1,104 @@
+import codecs
+import csv
+import gzip
+import io
+import math
+from collections import namedtuple
+
+MAX_IMPORT_SIZE = 1 << 20
+MAX_UNPACKED_SIZE = MAX_IMPORT_SIZE * 8
+MAX_QUANTITY = 10 ** 9
+MAX_IMPORT_ROWS = 5000
+SAMPLE_SIZE = 4096
+FALLBACK_ENCODING = "cp1251"
+DELIMITERS = ";\t,"
+TICKER_HEADERS = ("тикер", "ticker", "secid")
+QUANTITY_HEADERS = ("количество", "quantity", "qty", "кол-во")
+
+InvalidRow = namedtuple("InvalidRow", ["line", "text", "reason"])
+ImportResult = namedtuple("ImportResult", ["positions", "invalid", "truncated"])
+
+
+class ImportTooLarge(ValueError):
+    pass
+
+
+def open_text(data):
+    if data[:2] == b"\x1f\x8b":
+        with gzip.GzipFile(fileobj=io.BytesIO(data)) as packed:
+            data = packed.read(MAX_UNPACKED_SIZE + 1)
+        if len(data) > MAX_UNPACKED_SIZE:
+            raise ImportTooLarge(MAX_UNPACKED_SIZE)
+    raw = io.BufferedReader(io.BytesIO(data))
+    sample = raw.peek(SAMPLE_SIZE)[:SAMPLE_SIZE]
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        encoding = "utf-16"
+    elif sample.startswith(codecs.BOM_UTF8):
+        encoding = "utf-8-sig"
+    else:
+        try:
+            codecs.getincrementaldecoder("utf-8")().decode(sample)
+            encoding = "utf-8"
+        except UnicodeDecodeError:
+            encoding = FALLBACK_ENCODING
+    return io.TextIOWrapper(raw, encoding=encoding, errors="replace", newline="")
+
+
+def parse_quantity(text):
+    text = text.replace(" ", "").replace("\xa0", "").replace(",", ".")
+    if not text:
+        return 1.0
+    quantity = float(text)
+    if not math.isfinite(quantity) or quantity <= 0 or quantity > MAX_QUANTITY:
+        raise ValueError(text)
+    return quantity
+
+
+def _split(line, ticker_column):
+    delimiter = next((item for item in DELIMITERS if item in line), None)
+    if delimiter is None:
+        return line.split()
+    cells = [cell.strip() for cell in next(csv.reader([line], delimiter=delimiter), [])]
+    if delimiter == "," and ticker_column < len(cells) and len(cells[ticker_column].split()) > 1:
+        return line.split()
+    return cells
+
+
+def parse_portfolio(data, instruments, max_rows=MAX_IMPORT_ROWS):
+    positions, invalid = {}, []
+    ticker_column, quantity_column = 0, 1
+    truncated = False
+    rows = 0
+    with open_text(data) as lines:
+        for number, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            cells = _split(line, ticker_column)
+            if not cells or all(set(cell) <= {"-", "="} for cell in cells):
+                continue
+            header = [cell.casefold() for cell in cells]
+            if any(name in header for name in TICKER_HEADERS):
+                ticker_column = next(header.index(name) for name in TICKER_HEADERS if name in header)
+                quantity_column = next((header.index(name) for name in QUANTITY_HEADERS if name in header), None)
+                if not positions:
+                    invalid.clear()
+                continue
+            rows += 1
+            if rows > max_rows:
+                truncated = True
+                break
+
+            ticker = cells[ticker_column] if ticker_column < len(cells) else ""
+            stock_info = instruments.by_ticker(ticker) if ticker else None
+            if stock_info is None:
+                invalid.append(InvalidRow(number, line, "тикер не найден"))
+                continue
+            try:
+                quantity = parse_quantity(cells[quantity_column] if quantity_column is not None and
+                                          quantity_column < len(cells) else "")
+            except ValueError:
+                invalid.append(InvalidRow(number, line, "некорректное количество"))
+                continue
+            positions[stock_info.ticker] = positions.get(stock_info.ticker, 0.0) + quantity
+    return ImportResult(positions, invalid, truncated)
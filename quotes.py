@@ -0,0 +1,131 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+Quote = namedtuple("Quote", ["figi", "price", "time"])
+
+LAST_PRICES_CHUNK = 1000
+QUOTE_TTL = 5
+QUOTE_CACHE_SIZE = 5000
+
+
+def quotation_to_float(quotation):
+    return quotation.units + quotation.nano / 1_000_000_000
+
+
+def format_price(price):
+    return f"{price:.2f}" if abs(price) >= 1 else f"{price:.4f}"
+
+
+class QuoteService:
+    def __init__(self, client_factory, chunk_size=LAST_PRICES_CHUNK):
+        self.client_factory = client_factory
+        self.chunk_size = chunk_size
+
+    def get_last_prices(self, figis):
+        unique = list(dict.fromkeys(f for f in figis if f))
+        quotes = {}
+        if not unique:
+            return quotes
+
+        with self.client_factory() as client:
+            for start in range(0, len(unique), self.chunk_size):
+                chunk = unique[start:start + self.chunk_size]
+                response = client.market_data.get_last_prices(figi=chunk)
+                for last_price in response.last_prices:
+                    if not last_price.price.units and not last_price.price.nano:
+                        continue
+                    quotes[last_price.figi] = Quote(last_price.figi, quotation_to_float(last_price.price),
+                                                    last_price.time)
+        return quotes
+
+    def get_last_price(self, figi):
+        return self.get_last_prices([figi]).get(figi)
+
+
+class QuoteCache:
+    def __init__(self, service, ttl=QUOTE_TTL, maxsize=QUOTE_CACHE_SIZE):
+        self.service = service
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._prewarm_thread = None
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "shared": self.shared, "size": len(self._entries),
+                    "hit_ratio": self.hits / total if total else 0.0}
+
+    def _store(self, quotes, now):
+        for figi, quote in quotes.items():
+            self._entries[figi] = (now, quote)
+            self._entries.move_to_end(figi)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def put_many(self, quotes):
+        with self._lock:
+            self._store(quotes, time.monotonic())
+
+    def get_last_prices(self, figis):
+        result, fetch, wait = {}, [], {}
+        with self._lock:
+            now = time.monotonic()
+            for figi in dict.fromkeys(f for f in figis if f):
+                entry = self._entries.get(figi)
+                if entry is not None and now - entry[0] < self.ttl:
+                    self._entries.move_to_end(figi)
+                    result[figi] = entry[1]
+                    self.hits += 1
+                elif figi in self._inflight:
+                    wait[figi] = self._inflight[figi]
+                    self.shared += 1
+                else:
+                    self._inflight[figi] = threading.Event()
+                    fetch.append(figi)
+                    self.misses += 1
+
+        if fetch:
+            try:
+                quotes = self.service.get_last_prices(fetch)
+                with self._lock:
+                    self._store(quotes, time.monotonic())
+                result.update(quotes)
+            finally:
+                with self._lock:
+                    for figi in fetch:
+                        self._inflight.pop(figi).set()
+
+        for figi, event in wait.items():
+            event.wait()
+            with self._lock:
+                entry = self._entries.get(figi)
+            if entry is not None:
+                result[figi] = entry[1]
+        return result
+
+    def get_last_price(self, figi):
+        return self.get_last_prices([figi]).get(figi)
+
+    def _prewarm_loop(self, figis_source, interval):
+        while True:
+            try:
+                figis = list(figis_source())
+                quotes = self.service.get_last_prices(figis)
+                self.put_many(quotes)
+            except Exception as e:
+                print(f"Ошибка прогрева кэша котировок: {e}")
+            time.sleep(interval)
+
+    def start_prewarm(self, figis_source, interval=None):
+        if self._prewarm_thread is None:
+            interval = interval if interval is not None else max(self.ttl * 0.8, 1)
+            self._prewarm_thread = threading.Thread(target=self._prewarm_loop, args=(figis_source, interval),
+                                                    daemon=True)
+            self._prewarm_thread.start()
@@ -0,0 +1,255 @@
+import heapq
+import sqlite3
+import threading
+import time
+from bisect import bisect_right
+from datetime import datetime, timedelta, timezone
+
+SCHEDULE_DAYS = 7
+SCHEDULE_TTL = 12 * 60 * 60
+RETRY_DELAY = 15 * 60
+MIN_INTERVAL = 120
+MAX_INTERVAL = 900
+SIGMAS = 3
+DEFAULT_VARIANCE = 4 / 30600
+VARIANCE_DECAY = 0.3
+
+
+def _timestamp(value):
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class TradingCalendar:
+    def __init__(self, client_factory, storage, days=SCHEDULE_DAYS, ttl=SCHEDULE_TTL):
+        self.client_factory = client_factory
+        self.storage = storage
+        self.days = days
+        self.ttl = ttl
+        self.loaded_at = 0.0
+        self._retry_at = 0.0
+        self._sessions = {}
+        self._horizon = {}
+        self._lock = threading.Lock()
+
+        with self.storage.transaction() as db:
+            db.execute('''CREATE TABLE IF NOT EXISTS trading_sessions (
+                exchange TEXT,
+                day REAL,
+                start_time REAL,
+                end_time REAL,
+                updated_at REAL,
+                PRIMARY KEY (exchange, day)
+            )''')
+
+    def _swap(self, rows, loaded_at):
+        sessions, horizon = {}, {}
+        for exchange, day, start, end in sorted(rows, key=lambda row: (row[0], row[1])):
+            starts, ends = sessions.setdefault(exchange, ([], []))
+            if start is not None and end is not None and end > start:
+                starts.append(start)
+                ends.append(end)
+            horizon[exchange] = max(horizon.get(exchange, 0.0), day + 24 * 60 * 60)
+        self._sessions, self._horizon = sessions, horizon
+        self.loaded_at = loaded_at
+
+    def load(self):
+        rows = self.storage.query("SELECT exchange, day, start_time, end_time, updated_at FROM trading_sessions")
+        if rows:
+            self._swap([row[:4] for row in rows], min(row[4] for row in rows))
+        return len(rows)
+
+    def refresh(self, now=None):
+        now = time.time() if now is None else now
+        start = datetime.fromtimestamp(now, timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        with self.client_factory() as client:
+            response = client.instruments.trading_schedules(exchange="", from_=start,
+                                                            to=start + timedelta(days=self.days))
+        rows = []
+        for schedule in response.exchanges:
+            for day in schedule.days:
+                session = (None, None)
+                if day.is_trading_day:
+                    end = max(_timestamp(day.end_time),
+                              _timestamp(getattr(day, "evening_end_time", None)) or 0.0)
+                    session = (_timestamp(day.start_time), end)
+                rows.append((schedule.exchange.lower(), _timestamp(day.date), *session))
+        with self._lock:
+            self._swap(rows, now)
+        try:
+            with self.storage.transaction() as db:
+                db.execute("DELETE FROM trading_sessions")
+                db.executemany("INSERT OR REPLACE INTO trading_sessions "
+                               "(exchange, day, start_time, end_time, updated_at) VALUES (?, ?, ?, ?, ?)",
+                               [(*row, now) for row in rows])
+        except sqlite3.Error as e:
+            print(f"Ошибка базы данных: {e}")
+        return len(rows)
+
+    def ensure_fresh(self, now=None):
+        now = time.time() if now is None else now
+        if now - self.loaded_at < self.ttl or now < self._retry_at:
+            return
+        try:
+            print(f"Расписание торгов обновлено: {self.refresh(now)} записей")
+        except Exception as e:
+            self._retry_at = now + RETRY_DELAY
+            print(f"Ошибка обновления расписания торгов: {e}")
+
+    def next_open(self, exchange, now):
+        exchange = (exchange or "").lower()
+        sessions = self._sessions.get(exchange)
+        if sessions is None or now >= self._horizon[exchange]:
+            return now
+        starts, ends = sessions
+        position = bisect_right(starts, now)
+        if position and now < ends[position - 1]:
+            return now
+        if position < len(starts):
+            return starts[position]
+        return self._horizon[exchange]
+
+    def is_open(self, exchange, now):
+        return self.next_open(exchange, now) <= now
+
+
+class AlertScheduler:
+    def __init__(self, check, alerts, calendar, instruments, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL,
+                 coalesce=None):
+        self.check = check
+        self.alerts = alerts
+        self.calendar = calendar
+        self.instruments = instruments
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.coalesce = min_interval if coalesce is None else coalesce
+        self.checked = 0
+        self.skipped = 0
+        self.last_wait = 0.0
+        self.due_lag = 0.0
+        self._heap = []
+        self._tracked = set()
+        self._due = {}
+        self._last = {}
+        self._variance = {}
+        self._wakeup = threading.Condition()
+
+    def __len__(self):
+        return len(self._tracked)
+
+    def _exchange(self, figi):
+        item = self.instruments.by_figi(figi)
+        return item.exchange if item is not None else None
+
+    def _push(self, figi, due):
+        self._due[figi] = due
+        heapq.heappush(self._heap, (due, figi))
+
+    def sync(self, figis, now=None):
+        now = time.time() if now is None else now
+        figis = set(figis)
+        with self._wakeup:
+            for figi in self._tracked - figis:
+                self._due.pop(figi, None)
+                self._last.pop(figi, None)
+                self._variance.pop(figi, None)
+            for figi in figis - self._tracked:
+                self._push(figi, now)
+            for figi in figis & self._tracked:
+                window = self.alerts.min_window(figi)
+                due = self._due.get(figi)
+                if window is not None and due is not None and due > now + window / 2:
+                    self._push(figi, now + window / 2)
+            self._tracked = figis
+            self._wakeup.notify_all()
+
+    def next_due(self):
+        with self._wakeup:
+            while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    def wait(self, timeout):
+        with self._wakeup:
+            due = self.next_due()
+            delay = timeout if due is None else min(timeout, due - time.time())
+            started = time.time()
+            if delay > 0:
+                self._wakeup.wait(delay)
+            self.last_wait = time.time() - started
+
+    def _pop_due(self, now):
+        due, closed = [], []
+        with self._wakeup:
+            while self._heap and self._heap[0][0] <= now + self.coalesce:
+                when, figi = heapq.heappop(self._heap)
+                if self._due.get(figi) != when:
+                    continue
+                opens_at = self.calendar.next_open(self._exchange(figi), now)
+                if opens_at > now:
+                    closed.append((figi, opens_at))
+                    continue
+                del self._due[figi]
+                if not due:
+                    self.due_lag = max(0.0, now - when)
+                due.append(figi)
+            for figi, opens_at in closed:
+                self._push(figi, opens_at)
+            self.skipped += len(closed)
+        return due
+
+    def _observe(self, figi, price, now):
+        last = self._last.get(figi)
+        self._last[figi] = (now, price)
+        if last is None or now <= last[0] or last[1] <= 0:
+            return
+        move = (price - last[1]) / last[1] * 100
+        sample = move * move / (now - last[0])
+        variance = self._variance.get(figi, DEFAULT_VARIANCE)
+        self._variance[figi] = variance + VARIANCE_DECAY * (sample - variance)
+
+    def interval(self, figi, price, now):
+        window = self.alerts.min_window(figi)
+        longest = self.max_interval if window is None else min(self.max_interval, window / 2)
+        headroom = self.alerts.headroom(figi, price, now)
+        if headroom is None:
+            return longest
+        if headroom <= 0:
+            return min(longest, self.min_interval)
+        variance = self._variance.get(figi, DEFAULT_VARIANCE)
+        if variance <= 0:
+            return longest
+        return min(longest, max(self.min_interval, (headroom / SIGMAS) ** 2 / variance))
+
+    def run_once(self, now=None):
+        now = time.time() if now is None else now
+        self.calendar.ensure_fresh(now)
+        figis = self._pop_due(now)
+        if not figis:
+            return 0
+        try:
+            quotes = self.check(figis)
+        except Exception:
+            with self._wakeup:
+                for figi in figis:
+                    if figi in self._tracked:
+                        self._push(figi, now + self.min_interval)
+            raise
+
+        with self._wakeup:
+            for figi in figis:
+                if figi not in self._tracked or figi in self._due:
+                    continue
+                quote = quotes.get(figi)
+                if quote is None:
+                    self._push(figi, now + self.max_interval)
+                    continue
+                self._observe(figi, quote.price, now)
+                self._push(figi, now + self.interval(figi, quote.price, now))
+        self.checked += len(figis)
+        return len(figis)
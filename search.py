@@ -0,0 +1,144 @@
+import re
+import threading
+from bisect import bisect_left
+
+SUGGESTIONS = 6
+TICKER_DISTANCE = 2
+NAME_DISTANCE = 1
+MIN_FUZZY_TICKER = 3
+MIN_FUZZY_NAME = 4
+
+WORD = re.compile(r"[\wё]+", re.IGNORECASE)
+
+
+def deletes(word, distance):
+    variants, frontier = {word}, {word}
+    for _ in range(distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        variants |= frontier
+    return variants
+
+
+def edit_distance(a, b, limit):
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class InstrumentSearch:
+    def __init__(self, instruments, limit=SUGGESTIONS):
+        self.instruments = instruments
+        self.limit = limit
+        self._built_at = None
+        self._lock = threading.Lock()
+        self._tickers = {}
+        self._prefix_keys = []
+        self._prefix_items = []
+        self._ticker_deletes = {}
+        self._word_deletes = {}
+
+    def build(self, items):
+        tickers, prefix, ticker_deletes, word_deletes = {}, [], {}, {}
+        for item in items:
+            ticker = item.ticker.lower()
+            if ticker in tickers:
+                continue
+            tickers[ticker] = item
+            prefix.append((ticker, 0, item))
+            for variant in deletes(ticker, TICKER_DISTANCE):
+                ticker_deletes.setdefault(variant, set()).add(ticker)
+
+            name = (item.name or "").lower()
+            if name:
+                prefix.append((name, 1, item))
+            for word in set(WORD.findall(name)):
+                if word != name:
+                    prefix.append((word, 1, item))
+                if len(word) >= MIN_FUZZY_NAME:
+                    for variant in deletes(word, NAME_DISTANCE):
+                        word_deletes.setdefault(variant, {}).setdefault(word, []).append(item)
+
+        prefix.sort(key=lambda entry: (entry[0], entry[1]))
+        self._tickers = tickers
+        self._prefix_keys = [entry[0] for entry in prefix]
+        self._prefix_items = [(entry[1], entry[2]) for entry in prefix]
+        self._ticker_deletes = ticker_deletes
+        self._word_deletes = word_deletes
+
+    def _ensure_built(self):
+        self.instruments.ensure_loaded()
+        if self._built_at != self.instruments.loaded_at:
+            with self._lock:
+                if self._built_at != self.instruments.loaded_at:
+                    loaded_at = self.instruments.loaded_at
+                    self.build(self.instruments.all())
+                    self._built_at = loaded_at
+
+    def search(self, query, limit=None):
+        self._ensure_built()
+        limit = limit or self.limit
+        query = query.strip().lower()
+        if not query:
+            return []
+        found = {}
+
+        def add(item, score):
+            if item.figi not in found or score < found[item.figi][0]:
+                found[item.figi] = (score, item)
+
+        exact = self._tickers.get(query)
+        if exact is not None:
+            add(exact, (0, 0, ""))
+
+        position = bisect_left(self._prefix_keys, query)
+        scanned = 0
+        while position < len(self._prefix_keys) and scanned < limit * 4:
+            key = self._prefix_keys[position]
+            if not key.startswith(query):
+                break
+            kind, item = self._prefix_items[position]
+            add(item, (1 + kind, len(key) - len(query), key))
+            position += 1
+            scanned += 1
+
+        if exact is not None or len(found) >= limit or len(query) < MIN_FUZZY_TICKER:
+            return self._ranked(found, limit)
+
+        distance = 1 if len(query) <= 4 else TICKER_DISTANCE
+        checked = set()
+        for variant in deletes(query, distance):
+            for ticker in self._ticker_deletes.get(variant, ()):
+                if ticker in checked or abs(len(ticker) - len(query)) > distance:
+                    continue
+                checked.add(ticker)
+                ticker_distance = edit_distance(query, ticker, distance)
+                if ticker_distance <= distance:
+                    add(self._tickers[ticker], (3, ticker_distance, ticker))
+
+        if len(query) >= MIN_FUZZY_NAME:
+            for variant in deletes(query, NAME_DISTANCE):
+                for word, items in self._word_deletes.get(variant, {}).items():
+                    if word in checked:
+                        continue
+                    checked.add(word)
+                    word_distance = edit_distance(query, word, NAME_DISTANCE)
+                    if word_distance <= NAME_DISTANCE:
+                        for item in items:
+                            add(item, (4, word_distance, word))
+
+        return self._ranked(found, limit)
+
+    @staticmethod
+    def _ranked(found, limit):
+        return [item for _, item in sorted(found.values(), key=lambda entry: entry[0])[:limit]]
@@ -0,0 +1,168 @@
+import hashlib
+import time
+from bisect import bisect_left
+
+from alerts import FiredAlert
+
+SHARDS = 64
+REPLICAS = 64
+LEASE_TTL = 30
+DELIVERY_LEASE = "delivery"
+DELIVERY_BATCH = 500
+DELIVERY_RETENTION = 24 * 60 * 60
+
+
+def stable_hash(value):
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), "big")
+
+
+def shard_of(figi, shards=SHARDS):
+    return stable_hash(figi) % shards
+
+
+def owns_shard(shards, count, figi):
+    return shard_of(figi, count) in shards
+
+
+def shard_lease(shard):
+    return f"shard:{shard}"
+
+
+class HashRing:
+    def __init__(self, members, replicas=REPLICAS):
+        points = sorted((stable_hash(f"{member}#{i}"), member) for member in members for i in range(replicas))
+        self._hashes = [point for point, _ in points]
+        self._members = [member for _, member in points]
+
+    def __len__(self):
+        return len(set(self._members))
+
+    def owner(self, key):
+        if not self._hashes:
+            return None
+        position = bisect_left(self._hashes, stable_hash(key))
+        return self._members[position % len(self._members)]
+
+
+class LeaseCoordinator:
+    def __init__(self, storage, owner, shards=SHARDS, ttl=LEASE_TTL):
+        self.storage = storage
+        self.owner = owner
+        self.shards = shards
+        self.ttl = ttl
+        self.owned = frozenset()
+
+        with self.storage.transaction() as db:
+            db.execute('''CREATE TABLE IF NOT EXISTS workers (
+                worker_id TEXT PRIMARY KEY,
+                expires_at REAL
+            )''')
+            db.execute('''CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                owner TEXT,
+                expires_at REAL
+            )''')
+
+    def _claim(self, db, name, now):
+        return db.execute('''
+            INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+            WHERE leases.owner = excluded.owner OR leases.expires_at <= ?
+        ''', (name, self.owner, now + self.ttl, now)).rowcount > 0
+
+    def acquire(self, name, now=None):
+        now = time.time() if now is None else now
+        with self.storage.transaction() as db:
+            return self._claim(db, name, now)
+
+    def heartbeat(self, now=None):
+        now = time.time() if now is None else now
+        with self.storage.transaction() as db:
+            db.execute("INSERT OR REPLACE INTO workers (worker_id, expires_at) VALUES (?, ?)",
+                       (self.owner, now + self.ttl))
+            db.execute("DELETE FROM workers WHERE expires_at <= ?", (now,))
+            ring = HashRing([row[0] for row in db.execute("SELECT worker_id FROM workers")])
+            owned = set()
+            for shard in range(self.shards):
+                name = shard_lease(shard)
+                if ring.owner(name) == self.owner:
+                    if self._claim(db, name, now):
+                        owned.add(shard)
+                else:
+                    db.execute("UPDATE leases SET expires_at = 0 WHERE name = ? AND owner = ?", (name, self.owner))
+        self.owned = frozenset(owned)
+        return self.owned
+
+    def owns(self, figi):
+        return owns_shard(self.owned, self.shards, figi)
+
+    def release(self):
+        with self.storage.transaction() as db:
+            db.execute("DELETE FROM workers WHERE worker_id = ?", (self.owner,))
+            db.execute("UPDATE leases SET expires_at = 0 WHERE owner = ?", (self.owner,))
+        self.owned = frozenset()
+
+
+class AlertDeliveries:
+    def __init__(self, storage):
+        self.storage = storage
+
+        with self.storage.transaction() as db:
+            db.execute('''CREATE TABLE IF NOT EXISTS alert_deliveries (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                figi TEXT,
+                ticker TEXT,
+                threshold REAL,
+                old_price REAL,
+                new_price REAL,
+                change REAL,
+                window REAL,
+                direction TEXT,
+                worker_id TEXT,
+                created_at REAL,
+                delivered_at REAL
+            )''')
+            db.execute("CREATE INDEX IF NOT EXISTS alert_deliveries_pending ON alert_deliveries (delivered_at, id)")
+            self.storage.ensure_column(db, "alert_deliveries", "direction", "TEXT")
+
+    def publish(self, fired, coordinator, now=None):
+        now = time.time() if now is None else now
+        published = 0
+        with self.storage.transaction() as db:
+            for alert in fired:
+                fence = (shard_lease(shard_of(alert.figi, coordinator.shards)), coordinator.owner, now)
+                inserted = db.execute('''
+                    INSERT INTO alert_deliveries (user_id, figi, ticker, threshold, old_price, new_price, change,
+                                                  window, direction, worker_id, created_at)
+                    SELECT ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?
+                    WHERE EXISTS (SELECT 1 FROM leases WHERE name = ? AND owner = ? AND expires_at > ?)
+                ''', (*alert, coordinator.owner, now, *fence)).rowcount
+                if inserted and alert.direction is not None:
+                    db.execute("DELETE FROM level_alerts WHERE user_id = ? AND figi = ? AND level = ?",
+                               (alert.user_id, alert.figi, alert.threshold))
+                elif inserted:
+                    db.execute("UPDATE alerts SET baseline = ? WHERE user_id = ? AND figi = ? AND window = ?",
+                               (alert.new_price, alert.user_id, alert.figi, alert.window))
+                published += bool(inserted)
+        return published
+
+    def take(self, coordinator, limit=DELIVERY_BATCH, now=None):
+        now = time.time() if now is None else now
+        with self.storage.transaction() as db:
+            rows = db.execute('''
+                SELECT id, user_id, figi, ticker, threshold, old_price, new_price, change, window, direction
+                FROM alert_deliveries WHERE delivered_at IS NULL ORDER BY id LIMIT ?
+            ''', (limit,)).fetchall()
+            if not rows:
+                return []
+            claimed = db.execute(f'''
+                UPDATE alert_deliveries SET delivered_at = ?
+                WHERE id IN ({",".join("?" * len(rows))}) AND delivered_at IS NULL
+                AND EXISTS (SELECT 1 FROM leases WHERE name = ? AND owner = ? AND expires_at > ?)
+            ''', (now, *(row[0] for row in rows), DELIVERY_LEASE, coordinator.owner, now)).rowcount
+            if claimed != len(rows):
+                db.rollback()
+                return []
+            db.execute("DELETE FROM alert_deliveries WHERE delivered_at < ?", (now - DELIVERY_RETENTION,))
+        return [FiredAlert(*row[1:]) for row in rows]
@@ -0,0 +1,284 @@
+import hashlib
+import hmac
+import itertools
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+FLUSH_INTERVAL = 1.0
+FLUSH_BATCH = 500
+BUSY_ERRORS = ("database is locked", "database table is locked", "database is busy")
+ALERT_CHANGES_KEPT = 100_000
+
+
+def hash_password(password, salt=None):
+    salt = salt or os.urandom(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, 100_000)
+    return f"{salt.hex()}${digest.hex()}"
+
+
+def check_password(password, stored):
+    salt = stored.partition("$")[0]
+    return hmac.compare_digest(hash_password(password, bytes.fromhex(salt)), stored)
+
+
+class Storage:
+    def __init__(self, db_name, flush_interval=FLUSH_INTERVAL, flush_batch=FLUSH_BATCH):
+        self.db_name = db_name
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self._conn = sqlite3.connect(db_name, check_same_thread=False)
+        self._lock = threading.RLock()
+        self.errors = 0
+        self._pending = []
+        self._wakeup = threading.Event()
+        self._thread = None
+
+        with self.transaction() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute('''CREATE TABLE IF NOT EXISTS users (
+                user_id INTEGER PRIMARY KEY,
+                password TEXT
+            )''')
+            db.execute('''CREATE TABLE IF NOT EXISTS portfolios (
+                user_id INTEGER,
+                ticker TEXT,
+                quantity REAL DEFAULT 1,
+                PRIMARY KEY (user_id, ticker)
+            )''')
+            self.ensure_column(db, "portfolios", "quantity", "REAL DEFAULT 1")
+            db.execute('''CREATE TABLE IF NOT EXISTS alerts (
+                user_id INTEGER,
+                figi TEXT,
+                ticker TEXT,
+                threshold REAL,
+                baseline REAL,
+                window REAL DEFAULT 0,
+                PRIMARY KEY (user_id, figi, window)
+            )''')
+            self.ensure_column(db, "alerts", "window", "REAL DEFAULT 0")
+            self.migrate_alerts_key(db)
+            db.execute("CREATE INDEX IF NOT EXISTS alerts_figi ON alerts (figi)")
+            db.execute('''CREATE TABLE IF NOT EXISTS level_alerts (
+                user_id INTEGER,
+                figi TEXT,
+                ticker TEXT,
+                level REAL,
+                direction TEXT,
+                PRIMARY KEY (user_id, figi, level)
+            )''')
+            db.execute("CREATE INDEX IF NOT EXISTS level_alerts_figi ON level_alerts (figi)")
+            db.execute('''CREATE TABLE IF NOT EXISTS alert_changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT,
+                user_id INTEGER,
+                figi TEXT,
+                key REAL
+            )''')
+            self.track_changes(db, "alerts", "alert", "window", "ticker, threshold, window")
+            self.track_changes(db, "level_alerts", "level", "level", "ticker, level, direction")
+
+    @staticmethod
+    def track_changes(db, table, kind, key, columns):
+        for event, row in (("INSERT", "NEW"), ("DELETE", "OLD"), (f"UPDATE OF {columns}", "NEW")):
+            db.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_{event.split()[0].lower()}_changes
+                AFTER {event} ON {table} BEGIN
+                    INSERT INTO alert_changes (kind, user_id, figi, key)
+                    VALUES ('{kind}', {row}.user_id, {row}.figi, {row}.{key});
+                    DELETE FROM alert_changes WHERE seq <= (SELECT MAX(seq) FROM alert_changes) - {ALERT_CHANGES_KEPT};
+                END''')
+
+    @staticmethod
+    def migrate_alerts_key(db):
+        key = {row[1] for row in db.execute("PRAGMA table_info(alerts)") if row[5]}
+        if "window" in key:
+            return
+        db.execute("ALTER TABLE alerts RENAME TO alerts_old")
+        db.execute('''CREATE TABLE alerts (
+            user_id INTEGER,
+            figi TEXT,
+            ticker TEXT,
+            threshold REAL,
+            baseline REAL,
+            window REAL DEFAULT 0,
+            PRIMARY KEY (user_id, figi, window)
+        )''')
+        db.execute("INSERT INTO alerts (user_id, figi, ticker, threshold, baseline, window) "
+                   "SELECT user_id, figi, ticker, threshold, baseline, COALESCE(window, 0) FROM alerts_old")
+        db.execute("DROP TABLE alerts_old")
+
+    @staticmethod
+    def ensure_column(db, table, column, declaration):
+        columns = [row[1] for row in db.execute(f"PRAGMA table_info({table})")]
+        if column not in columns:
+            db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            self._flush_pending()
+            try:
+                yield self._conn
+                self._conn.commit()
+            except sqlite3.Error:
+                self.errors += 1
+                self._conn.rollback()
+                raise
+
+    def execute(self, sql, params=()):
+        with self.transaction() as db:
+            return db.execute(sql, params).rowcount
+
+    def executemany(self, sql, rows):
+        with self.transaction() as db:
+            return db.executemany(sql, rows).rowcount
+
+    def query(self, sql, params=()):
+        with self._lock:
+            self._flush_pending()
+            try:
+                return self._conn.execute(sql, params).fetchall()
+            except sqlite3.Error:
+                self.errors += 1
+                raise
+
+    def write_behind(self, sql, params=()):
+        with self._lock:
+            self._pending.append((sql, params))
+            if len(self._pending) >= self.flush_batch:
+                self._wakeup.set()
+
+    def _flush_pending(self):
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, []
+        groups = [(sql, [params for _, params in group])
+                  for sql, group in itertools.groupby(pending, key=lambda item: item[0])]
+        try:
+            for sql, rows in groups:
+                self._conn.executemany(sql, rows)
+            self._conn.commit()
+            return len(pending)
+        except sqlite3.Error as e:
+            print(f"Ошибка базы данных: {e}")
+            self.errors += 1
+            self._conn.rollback()
+            if isinstance(e, sqlite3.OperationalError) and str(e) in BUSY_ERRORS:
+                self._pending = pending + self._pending
+                return 0
+
+        written = 0
+        for sql, rows in groups:
+            try:
+                self._conn.executemany(sql, rows)
+                self._conn.commit()
+                written += len(rows)
+            except sqlite3.Error as e:
+                print(f"Ошибка базы данных, отброшено {len(rows)} отложенных записей: {e}")
+                self.errors += 1
+                self._conn.rollback()
+        return written
+
+    def flush(self):
+        with self._lock:
+            return self._flush_pending()
+
+    def _flush_loop(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._flush_loop, daemon=True)
+            self._thread.start()
+
+    def close(self):
+        with self._lock:
+            self._flush_pending()
+            self._conn.close()
+
+    def add_user(self, user_id, password_hash):
+        self.execute("INSERT OR REPLACE INTO users (user_id, password) VALUES (?, ?)", (user_id, password_hash))
+
+    def load_users(self):
+        return dict(self.query("SELECT user_id, password FROM users"))
+
+    def portfolio(self, user_id):
+        return dict(self.query("SELECT ticker, quantity FROM portfolios WHERE user_id=? ORDER BY rowid", (user_id,)))
+
+    def add_to_portfolio(self, user_id, ticker, quantity=1):
+        self.import_portfolio(user_id, [(ticker, quantity)])
+
+    def import_portfolio(self, user_id, positions):
+        return self.executemany("INSERT INTO portfolios (user_id, ticker, quantity) VALUES (?, ?, ?) "
+                                "ON CONFLICT (user_id, ticker) DO UPDATE SET quantity = excluded.quantity",
+                                [(user_id, ticker, quantity) for ticker, quantity in positions])
+
+    def delete_from_portfolio(self, user_id, ticker):
+        self.execute("DELETE FROM portfolios WHERE user_id = ? AND ticker = ?", (user_id, ticker))
+
+    def load_portfolios(self):
+        portfolios = {}
+        for user_id, ticker, quantity in self.query("SELECT user_id, ticker, quantity FROM portfolios ORDER BY rowid"):
+            portfolios.setdefault(user_id, {})[ticker] = quantity
+        return portfolios
+
+    def save_alert(self, user_id, figi, ticker, threshold, baseline, window=0):
+        self.execute("INSERT OR REPLACE INTO alerts (user_id, figi, ticker, threshold, baseline, window) "
+                     "VALUES (?, ?, ?, ?, ?, ?)", (user_id, figi, ticker, threshold, baseline, window))
+
+    def delete_alert(self, user_id, figi, window=0):
+        self.execute("DELETE FROM alerts WHERE user_id = ? AND figi = ? AND window = ?", (user_id, figi, window))
+
+    def update_alert_baselines(self, fired):
+        for alert in fired:
+            self.write_behind("UPDATE alerts SET baseline = ? WHERE user_id = ? AND figi = ? AND window = ?",
+                              (alert.new_price, alert.user_id, alert.figi, alert.window))
+
+    def _owned(self, table, owns):
+        if owns is None:
+            return ""
+        self._conn.create_function("owns_figi", 1, owns)
+        return f" WHERE figi IN (SELECT figi FROM {table} GROUP BY figi HAVING owns_figi(figi))"
+
+    def load_alerts(self, owns=None):
+        with self._lock:
+            return self.query("SELECT user_id, figi, ticker, threshold, baseline, window FROM alerts" +
+                              self._owned("alerts", owns))
+
+    def save_level_alert(self, user_id, figi, ticker, level, direction):
+        self.execute("INSERT OR REPLACE INTO level_alerts (user_id, figi, ticker, level, direction) "
+                     "VALUES (?, ?, ?, ?, ?)", (user_id, figi, ticker, level, direction))
+
+    def delete_level_alert(self, user_id, figi, level):
+        self.execute("DELETE FROM level_alerts WHERE user_id = ? AND figi = ? AND level = ?", (user_id, figi, level))
+
+    def delete_fired_levels(self, fired):
+        for alert in fired:
+            self.write_behind("DELETE FROM level_alerts WHERE user_id = ? AND figi = ? AND level = ?",
+                              (alert.user_id, alert.figi, alert.threshold))
+
+    def load_level_alerts(self, owns=None):
+        with self._lock:
+            return self.query("SELECT user_id, figi, ticker, level, direction FROM level_alerts" +
+                              self._owned("level_alerts", owns))
+
+    def alert_changes(self, since=None):
+        with self._lock:
+            oldest, latest = self.query("SELECT MIN(seq), COALESCE(MAX(seq), 0) FROM alert_changes")[0]
+            if since is None or oldest is not None and oldest > since + 1:
+                return latest, None
+            return latest, self.query('''
+                SELECT c.kind, c.user_id, c.figi, c.key, COALESCE(a.ticker, l.ticker), a.threshold, a.baseline,
+                       l.direction, a.user_id IS NOT NULL OR l.user_id IS NOT NULL
+                FROM (SELECT DISTINCT kind, user_id, figi, key FROM alert_changes WHERE seq > ? AND seq <= ?) c
+                LEFT JOIN alerts a ON c.kind = 'alert' AND a.user_id = c.user_id AND a.figi = c.figi
+                                  AND a.window = c.key
+                LEFT JOIN level_alerts l ON c.kind = 'level' AND l.user_id = c.user_id AND l.figi = c.figi
+                                        AND l.level = c.key
+            ''', (since, latest))
+
@@ -0,0 +1,155 @@
+import queue
+import threading
+import time
+
+from quotes import quotation_to_float
+
+RECONNECT_DELAY = 5
+
+
+class TinkoffMarketDataStream:
+    def __init__(self, client_factory):
+        self._client = client_factory()
+        self._manager = self._client.__enter__().create_market_data_stream()
+
+    def subscribe(self, figis):
+        from tinkoff.invest import LastPriceInstrument
+        self._manager.last_price.subscribe([LastPriceInstrument(figi=figi) for figi in figis])
+
+    def unsubscribe(self, figis):
+        from tinkoff.invest import LastPriceInstrument
+        self._manager.last_price.unsubscribe([LastPriceInstrument(figi=figi) for figi in figis])
+
+    def __iter__(self):
+        for response in self._manager:
+            if response.last_price:
+                yield response.last_price.figi, quotation_to_float(response.last_price.price)
+
+    def close(self):
+        try:
+            self._manager.stop()
+        finally:
+            self._client.__exit__(None, None, None)
+
+
+class FakeMarketDataStream:
+    _DROP = object()
+
+    def __init__(self):
+        self.subscribed = set()
+        self._queue = queue.Queue()
+        self._iterating = False
+
+    def subscribe(self, figis):
+        self.subscribed.update(figis)
+
+    def unsubscribe(self, figis):
+        self.subscribed.difference_update(figis)
+
+    def push(self, figi, price):
+        self._queue.put((figi, price))
+
+    def drop(self):
+        self._queue.put(self._DROP)
+
+    def __iter__(self):
+        self._iterating = True
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+                if item is self._DROP:
+                    raise ConnectionError("fake stream dropped")
+                if item[0] in self.subscribed:
+                    yield item
+        finally:
+            self._iterating = False
+
+    def close(self):
+        if self._iterating:
+            self._queue.put(None)
+
+
+class PriceStream:
+    def __init__(self, stream_factory, on_price, reconnect_delay=RECONNECT_DELAY):
+        self.stream_factory = stream_factory
+        self.on_price = on_price
+        self.reconnect_delay = reconnect_delay
+        self.connected = False
+        self.disconnected = threading.Event()
+        self.disconnected.set()
+        self._wanted = set()
+        self._subscribed = set()
+        self._stream = None
+        self._stopped = False
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def sync(self, figis):
+        with self._lock:
+            self._wanted = set(figis)
+            if self._stream is None or not self.connected:
+                return
+            added = self._wanted - self._subscribed
+            removed = self._subscribed - self._wanted
+            try:
+                if added:
+                    self._stream.subscribe(sorted(added))
+                if removed:
+                    self._stream.unsubscribe(sorted(removed))
+                self._subscribed = set(self._wanted)
+            except Exception as e:
+                print(f"Ошибка изменения подписки на цены: {e}")
+
+    def _connect(self):
+        stream = self.stream_factory()
+        with self._lock:
+            self._stream = stream
+            self._subscribed = set(self._wanted)
+            if self._subscribed:
+                stream.subscribe(sorted(self._subscribed))
+            self.connected = True
+            self.disconnected.clear()
+        return stream
+
+    def _run(self):
+        while not self._stopped:
+            stream = None
+            try:
+                stream = self._connect()
+                for figi, price in stream:
+                    try:
+                        self.on_price(figi, price)
+                    except Exception as e:
+                        print(f"Ошибка обработки цены {figi}: {e}")
+            except Exception as e:
+                print(f"Поток цен прерван: {e}")
+            finally:
+                with self._lock:
+                    self.connected = False
+                    self._stream = None
+                    self.disconnected.set()
+                if stream is not None:
+                    try:
+                        stream.close()
+                    except Exception:
+                        pass
+            if not self._stopped:
+                time.sleep(self.reconnect_delay)
+
+    def wait_disconnected(self, timeout):
+        return self.disconnected.wait(timeout)
+
+    def start(self, figis=()):
+        self._wanted = set(figis)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped = True
+        with self._lock:
+            stream = self._stream
+        if stream is not None:
+            stream.close()
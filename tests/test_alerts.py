@@ -0,0 +1,31 @@
+from alerts import AlertEngine
+
+FIGI = "BBG000000001"
+
+
+def test_add_replaces_and_remove_keeps_members_consistent():
+    alerts = AlertEngine()
+    for user_id in range(100):
+        assert alerts.add(user_id, FIGI, "SZY", 5, 100)
+    assert not alerts.add(7, FIGI, "SZY", 3, 100)
+    assert alerts.add(7, FIGI, "SZY", 3, 100, window=300)
+    assert len(alerts) == 101
+
+    for user_id in range(0, 100, 3):
+        assert alerts.remove(user_id, FIGI)
+    assert not alerts.remove(0, FIGI)
+    assert alerts.remove(7, FIGI, 300)
+
+    remaining = sorted(alert.user_id for alert in alerts.evaluate(FIGI, 200, 0))
+    assert remaining == [user_id for user_id in range(100) if user_id % 3]
+    assert [(alert.threshold, alert.window) for alert in alerts.user_alerts(7)] == [(3, 0)]
+
+
+def test_load_then_incremental_changes():
+    alerts = AlertEngine()
+    alerts.load([(user_id, FIGI, "SZY", 5, 100, 0) for user_id in range(10)])
+    assert not alerts.add(3, FIGI, "SZY", 1, 100)
+    assert alerts.remove(9, FIGI)
+    assert alerts.add(9, FIGI, "SZY", 5, 100, window=300)
+    assert len(alerts) == 10
+    assert [alert.threshold for alert in alerts.user_alerts(3)] == [1]
@@ -0,0 +1,54 @@
+from functools import partial
+
+import pytest
+
+from benchmarks.fakes import FakeApiError, FakeClient, FakeMarket, make_shares
+from client_pool import ClientPool
+
+
+@pytest.fixture
+def market():
+    return FakeMarket(make_shares(3))
+
+
+def test_connections_are_reused(market):
+    calls = {}
+    pool = ClientPool(partial(FakeClient, market, calls=calls), size=2)
+    for _ in range(10):
+        with pool.client() as client:
+            client.users.get_info()
+    assert calls == {"connect": 2, "get_info": 10}
+
+
+def test_connection_error_reconnects_only_that_connection(market):
+    calls = {}
+    pool = ClientPool(partial(FakeClient, market, calls=calls), size=1)
+    with pool.client() as client:
+        client.users.get_info()
+    with pytest.raises(FakeApiError):
+        with pool.client():
+            raise FakeApiError("INVALID_ARGUMENT")
+    with pool.client() as client:
+        client.users.get_info()
+    assert calls["connect"] == 1
+
+    with pytest.raises(FakeApiError):
+        with pool.client():
+            raise FakeApiError("UNAVAILABLE")
+    with pool.client() as client:
+        client.users.get_info()
+    assert calls["connect"] == 2
+
+
+def test_health_check_resets_unresponsive_connections(market):
+    calls = {}
+    pool = ClientPool(partial(FakeClient, market, calls=calls), size=2)
+    with pool.client() as client:
+        client.users.get_info()
+    assert pool.check() == 1
+    market.outage = True
+    assert pool.check() == 0
+    market.outage = False
+    with pool.client() as client:
+        client.users.get_info()
+    assert calls["connect"] == 2
@@ -0,0 +1,69 @@
+import threading
+import time
+
+from dispatch import ChatDispatcher
+
+
+def test_chat_updates_run_in_order_without_blocking_other_chats():
+    handled, fast_latencies = {}, []
+    lock = threading.Lock()
+    done = threading.Event()
+    expected = 3 * 5 + 20
+
+    def handler(item):
+        chat_id, seq, submitted = item
+        if chat_id == 1:
+            time.sleep(0.05)
+        else:
+            fast_latencies.append(time.perf_counter() - submitted)
+        with lock:
+            handled.setdefault(chat_id, []).append(seq)
+            if sum(len(items) for items in handled.values()) == expected:
+                done.set()
+
+    dispatcher = ChatDispatcher(handler, workers=4)
+    dispatcher.start()
+    try:
+        for seq in range(5):
+            for chat_id in (1, 2, 3):
+                assert dispatcher.submit(chat_id, (chat_id, seq, time.perf_counter()))
+        for chat_id in range(10, 30):
+            assert dispatcher.submit(chat_id, (chat_id, 0, time.perf_counter()))
+        assert done.wait(5)
+    finally:
+        dispatcher.stop()
+
+    for chat_id in (1, 2, 3):
+        assert handled[chat_id] == [0, 1, 2, 3, 4]
+    assert max(fast_latencies) < 0.05 * 5 / 2
+    assert dispatcher.pending() == 0
+
+
+def test_failed_update_does_not_stall_its_chat():
+    handled = []
+    done = threading.Event()
+
+    def handler(seq):
+        if seq == 0:
+            raise ValueError("boom")
+        handled.append(seq)
+        if seq == 2:
+            done.set()
+
+    dispatcher = ChatDispatcher(handler, workers=2)
+    dispatcher.start()
+    try:
+        for seq in range(3):
+            dispatcher.submit(1, seq)
+        assert done.wait(5)
+    finally:
+        dispatcher.stop()
+    assert handled == [1, 2]
+
+
+def test_submit_times_out_when_pending_limit_is_reached():
+    dispatcher = ChatDispatcher(lambda item: None, workers=1, max_pending=2)
+    assert dispatcher.submit(1, "a")
+    assert dispatcher.submit(2, "b")
+    assert not dispatcher.submit(3, "c", timeout=0.01)
+    assert dispatcher.pending() == 2
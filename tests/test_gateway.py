@@ -0,0 +1,101 @@
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.fakes import FakeApiError
+from gateway import ApiGateway, CircuitOpenError
+
+
+class ScriptedApi:
+    def __init__(self):
+        self.outcomes = []
+        self.calls = 0
+        self.market_data = SimpleNamespace(get_last_prices=self.get_last_prices)
+
+    def get_last_prices(self, figi):
+        self.calls += 1
+        outcome = self.outcomes.pop(0) if self.outcomes else "ok"
+        if outcome != "ok":
+            raise FakeApiError(outcome)
+        return f"prices {figi} #{self.calls}"
+
+    @contextmanager
+    def client(self):
+        yield self
+
+
+def make_gateway(api, **options):
+    options = {"quotas": {}, "retries": 0, "failure_threshold": 3, "reset_timeout": 60, **options}
+    return ApiGateway(api.client, **options)
+
+
+def call(gateway, figi="A"):
+    with gateway.client() as client:
+        return client.market_data.get_last_prices(figi=[figi])
+
+
+def test_non_retryable_errors_do_not_reset_failures():
+    api = ScriptedApi()
+    gateway = make_gateway(api)
+    for outcome in ["UNAVAILABLE", "INVALID_ARGUMENT", "UNAVAILABLE", "INVALID_ARGUMENT", "UNAVAILABLE"]:
+        api.outcomes.append(outcome)
+        with pytest.raises(FakeApiError):
+            call(gateway)
+    assert gateway.breaker("market_data").state == "open"
+    with pytest.raises(CircuitOpenError):
+        call(gateway)
+    assert api.calls == 5
+
+
+def test_breaker_opens_after_failures_and_closes_after_successful_trial():
+    api = ScriptedApi()
+    gateway = make_gateway(api, reset_timeout=0.05)
+    breaker = gateway.breaker("market_data")
+    api.outcomes.extend(["UNAVAILABLE"] * 3)
+    for _ in range(3):
+        with pytest.raises(FakeApiError):
+            call(gateway)
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError) as error:
+        call(gateway)
+    assert 0 < error.value.retry_after <= 0.05
+    assert api.calls == 3
+
+    time.sleep(0.06)
+    assert breaker.state == "half_open"
+    api.outcomes.append("UNAVAILABLE")
+    with pytest.raises(FakeApiError):
+        call(gateway)
+    assert breaker.state == "open"
+
+    time.sleep(0.06)
+    assert call(gateway) == "prices ['A'] #5"
+    assert breaker.state == "closed"
+    assert call(gateway) == "prices ['A'] #6"
+
+
+def test_stale_result_is_served_while_unavailable():
+    api = ScriptedApi()
+    gateway = make_gateway(api, retries=1, backoff_base=0.001, backoff_cap=0.001)
+    fresh = call(gateway, "A")
+    api.outcomes.extend(["UNAVAILABLE"] * 6)
+    for _ in range(3):
+        assert call(gateway, "A") == fresh
+    assert gateway.breaker("market_data").state == "open"
+    assert call(gateway, "A") == fresh
+    with pytest.raises(CircuitOpenError):
+        call(gateway, "B")
+    assert gateway.stats["stale"] == 4
+    assert gateway.stats["retries"] == 3
+    assert api.calls == 7
+
+
+def test_retryable_error_is_retried_before_counting_as_failure():
+    api = ScriptedApi()
+    gateway = make_gateway(api, retries=2, backoff_base=0.001, backoff_cap=0.001)
+    api.outcomes.extend(["RESOURCE_EXHAUSTED", "UNAVAILABLE"])
+    assert call(gateway) == "prices ['A'] #3"
+    assert gateway.breaker("market_data").failures == 0
+    assert gateway.stats["retries"] == 2
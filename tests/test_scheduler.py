@@ -0,0 +1,82 @@
+from collections import namedtuple
+
+from alerts import AlertEngine
+from scheduler import AlertScheduler
+from tick_history import TickHistory
+
+Quote = namedtuple("Quote", ["price"])
+FIGI = "BBG000000001"
+RISE_AT = 10000
+
+
+class OpenCalendar:
+    def ensure_fresh(self, now=None):
+        pass
+
+    def next_open(self, exchange, now):
+        return now
+
+
+class NoInstruments:
+    def by_figi(self, figi):
+        return None
+
+
+def price_at(now):
+    return 100 * (1 + 0.06 * min(1.0, max(0.0, (now - RISE_AT) / 240)))
+
+
+def run_scheduler(window, until):
+    clock = [0.0]
+    alerts = AlertEngine(history=TickHistory())
+    fired, intervals = [], []
+
+    def check(figis):
+        quotes = {figi: Quote(price_at(clock[0])) for figi in figis}
+        for figi, quote in quotes.items():
+            fired.extend((clock[0], alert) for alert in alerts.evaluate(figi, quote.price, clock[0]))
+        return quotes
+
+    alerts.add(1, FIGI, "SZY", 5, price_at(0), window=window)
+    alerts._since[:] = 0
+    scheduler = AlertScheduler(check, alerts, OpenCalendar(), NoInstruments(), min_interval=120, max_interval=900)
+    scheduler.sync([FIGI], now=0)
+    while clock[0] < until:
+        previous, clock[0] = clock[0], scheduler.next_due()
+        intervals.append(clock[0] - previous)
+        scheduler.run_once(clock[0])
+    return fired, intervals[1:]
+
+
+def test_windowed_alert_fires_under_scheduler():
+    fired, intervals = run_scheduler(window=300, until=RISE_AT + 900)
+    assert max(intervals) <= 150
+    assert [alert.window for _, alert in fired] == [300]
+    assert RISE_AT < fired[0][0] < RISE_AT + 240 + 300
+
+
+def test_interval_is_capped_by_shortest_window():
+    alerts = AlertEngine(history=TickHistory())
+    alerts.add(1, FIGI, "SZY", 5, 100)
+    alerts.add(2, FIGI, "SZY", 5, 100, window=900)
+    scheduler = AlertScheduler(lambda figis: {}, alerts, OpenCalendar(), NoInstruments(),
+                               min_interval=120, max_interval=900)
+    assert scheduler.interval(FIGI, 100, 0) == 450
+    alerts.add(3, FIGI, "SZY", 5, 100, window=300)
+    assert scheduler.interval(FIGI, 100, 0) == 150
+    alerts.remove(2, FIGI, 900)
+    alerts.remove(3, FIGI, 300)
+    assert scheduler.interval(FIGI, 100, 0) == 900
+
+
+def test_sync_pulls_in_instrument_when_windowed_alert_is_added():
+    alerts = AlertEngine(history=TickHistory())
+    alerts.add(1, FIGI, "SZY", 5, 100)
+    scheduler = AlertScheduler(lambda figis: {FIGI: Quote(100)}, alerts, OpenCalendar(), NoInstruments(),
+                               min_interval=120, max_interval=900)
+    scheduler.sync([FIGI], now=0)
+    scheduler.run_once(0)
+    assert scheduler.next_due() == 900
+    alerts.add(2, FIGI, "SZY", 5, 100, window=300)
+    scheduler.sync([FIGI], now=10)
+    assert scheduler.next_due() == 160
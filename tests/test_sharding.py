@@ -0,0 +1,66 @@
+import pytest
+
+from alerts import FiredAlert
+from sharding import DELIVERY_LEASE, AlertDeliveries, HashRing, LeaseCoordinator, shard_lease, shard_of
+from storage import Storage
+
+SHARDS = 8
+TTL = 30
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = Storage(str(tmp_path / "shards.sqlite"))
+    yield storage
+    storage.close()
+
+
+def fired(user_id, figi="BBG000000001"):
+    return FiredAlert(user_id, figi, "SZY", 5, 100, 106, 6, 0)
+
+
+def test_every_shard_has_one_owner(storage):
+    workers = [LeaseCoordinator(storage, f"worker:{index}", shards=SHARDS, ttl=TTL) for index in range(3)]
+    for _ in range(2):
+        for worker in workers:
+            worker.heartbeat(1000)
+    owned = [shard for worker in workers for shard in worker.owned]
+    assert sorted(owned) == list(range(SHARDS))
+    ring = HashRing([worker.owner for worker in workers])
+    for worker in workers:
+        assert worker.owned == {shard for shard in range(SHARDS) if ring.owner(shard_lease(shard)) == worker.owner}
+
+
+def test_expired_owner_cannot_publish_after_takeover(storage):
+    deliveries = AlertDeliveries(storage)
+    old = LeaseCoordinator(storage, "old", shards=SHARDS, ttl=TTL)
+    new = LeaseCoordinator(storage, "new", shards=SHARDS, ttl=TTL)
+    old.heartbeat(1000)
+    assert old.owned == frozenset(range(SHARDS))
+    assert deliveries.publish([fired(1)], old, now=1001) == 1
+
+    new.heartbeat(1000 + TTL + 1)
+    assert new.owned == frozenset(range(SHARDS))
+    assert shard_of("BBG000000001", SHARDS) in new.owned
+    assert deliveries.publish([fired(1)], old, now=1000 + TTL + 2) == 0
+    assert deliveries.publish([fired(2)], new, now=1000 + TTL + 2) == 1
+
+
+def test_each_alert_is_delivered_once(storage):
+    deliveries = AlertDeliveries(storage)
+    workers = [LeaseCoordinator(storage, f"bot:{index}", shards=SHARDS, ttl=TTL) for index in range(2)]
+    workers[0].heartbeat(1000)
+    deliveries.publish([fired(user_id) for user_id in range(10)], workers[0], now=1000)
+
+    holder, other = workers
+    assert holder.acquire(DELIVERY_LEASE, now=1000)
+    assert not other.acquire(DELIVERY_LEASE, now=1001)
+    assert deliveries.take(other, now=1001) == []
+    first = deliveries.take(holder, limit=4, now=1001)
+    rest = deliveries.take(holder, now=1002)
+    assert deliveries.take(holder, now=1003) == []
+
+    assert other.acquire(DELIVERY_LEASE, now=1000 + TTL + 1)
+    assert deliveries.take(holder, now=1000 + TTL + 1) == []
+    assert deliveries.take(other, now=1000 + TTL + 1) == []
+    assert sorted(alert.user_id for alert in first + rest) == list(range(10))
@@ -0,0 +1,101 @@
+import threading
+import time
+from functools import partial
+
+import pytest
+
+from benchmarks.fakes import FakeClient, FakeMarket, make_shares
+from streaming import FakeMarketDataStream, PriceStream
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class Streams(list):
+    def factory(self):
+        self.append(FakeMarketDataStream())
+        return self[-1]
+
+
+def stop_checker(now=None):
+    raise SystemExit
+
+
+@pytest.fixture
+def streams():
+    return Streams()
+
+
+def test_price_stream_follows_subscriptions_and_reconnects(streams):
+    prices = []
+    stream = PriceStream(streams.factory, lambda figi, price: prices.append((figi, price)), reconnect_delay=0.05)
+    assert stream.disconnected.is_set()
+    stream.start(["A", "B"])
+    try:
+        assert wait_for(lambda: stream.connected)
+        assert not stream.disconnected.is_set()
+        assert streams[0].subscribed == {"A", "B"}
+
+        stream.sync(["B", "C"])
+        assert streams[0].subscribed == {"B", "C"}
+        streams[0].push("A", 1.0)
+        streams[0].push("C", 2.0)
+        assert wait_for(lambda: prices)
+        assert prices == [("C", 2.0)]
+
+        streams[0].drop()
+        assert stream.wait_disconnected(1)
+        assert not stream.connected
+        assert wait_for(lambda: len(streams) == 2 and stream.connected)
+        assert streams[1].subscribed == {"B", "C"}
+    finally:
+        stream.stop()
+
+
+def test_checker_polls_as_soon_as_stream_drops(tmp_path, streams):
+    import main as app
+
+    shares = make_shares(3)
+    first, second, third = (share.figi for share in shares)
+    market = FakeMarket(shares)
+    market.trading_hours = {}
+    checks, fired = [], []
+
+    def counted_check(figis=None):
+        checks.append(set(figis or ()))
+        return app.check_prices_once(figis)
+
+    app.create_app(token="1:test", db_name=str(tmp_path / "bot.sqlite"), client_factory=partial(FakeClient, market))
+    app.notify_alerts = fired.extend
+    app.SCHEDULER.check = counted_check
+    for user_id, share in enumerate(shares[:2]):
+        app.ALERTS.add(user_id, share.figi, share.ticker, 1, market.price(share.figi))
+    app.STREAM = PriceStream(streams.factory, app.on_stream_price, reconnect_delay=10)
+    try:
+        app.STREAM.start(app.ALERTS.instruments())
+        app.SCHEDULER.sync(app.ALERTS.instruments())
+        assert wait_for(lambda: app.STREAM.connected)
+        threading.Thread(target=app.check_price_changes, daemon=True).start()
+
+        streams[0].push(first, market.price(first) * 1.05)
+        assert wait_for(lambda: fired)
+        assert [alert.figi for alert in fired] == [first]
+
+        app.ALERTS.add(2, third, shares[2].ticker, 1, market.price(third))
+        app.ALERTS.remove(1, second)
+        app.sync_alert_checks()
+        assert streams[0].subscribed == {first, third}
+        time.sleep(0.1)
+        assert checks == []
+
+        streams[0].drop()
+        assert wait_for(lambda: checks, timeout=1)
+        assert checks[0] == {first, third}
+    finally:
+        app.SCHEDULER.run_once = stop_checker
+        app.STREAM.stop()
+        app.STORAGE.close()
@@ -0,0 +1,84 @@
+import http.client
+import json
+import threading
+import time
+
+import pytest
+
+from webhook import SECRET_HEADER, WebhookServer
+
+SECRET = "test-secret"
+
+
+@pytest.fixture
+def server():
+    handled = []
+    server = WebhookServer(handled.extend, SECRET, host="127.0.0.1", port=0)
+    server.handled = handled
+    server.serve_in_background()
+    yield server
+    server.shutdown()
+
+
+def post(server, payload, secret=SECRET):
+    body = json.dumps(payload).encode()
+    connection = http.client.HTTPConnection("127.0.0.1", server.address[1], timeout=5)
+    connection.putrequest("POST", "/webhook")
+    connection.putheader(SECRET_HEADER, secret.encode() if isinstance(secret, str) else secret)
+    connection.putheader("Content-Type", "application/json")
+    connection.putheader("Content-Length", str(len(body)))
+    connection.endheaders()
+    connection.send(body)
+    try:
+        return connection.getresponse().status
+    finally:
+        connection.close()
+
+
+@pytest.mark.parametrize("secret", ["wrong", "", "секрет", b"\xff\xfe"])
+def test_wrong_secret_is_forbidden(server, secret):
+    assert post(server, {"update_id": 1}, secret) == 403
+    assert server.received == 0
+
+
+def test_unknown_path_and_bad_body_are_rejected(server):
+    assert post(server, {"update_id": 1}) == 200
+    connection = http.client.HTTPConnection("127.0.0.1", server.address[1], timeout=5)
+    connection.request("POST", "/other", body=b"{}", headers={SECRET_HEADER: SECRET})
+    assert connection.getresponse().status == 404
+    connection.close()
+    connection = http.client.HTTPConnection("127.0.0.1", server.address[1], timeout=5)
+    connection.request("POST", "/webhook", body=b"{not json", headers={SECRET_HEADER: SECRET})
+    assert connection.getresponse().status == 400
+    connection.close()
+
+
+def test_full_queue_answers_429_and_every_update_is_delivered_once():
+    gate = threading.Event()
+    handled = []
+
+    def on_updates(batch):
+        gate.wait(5)
+        handled.extend(batch)
+
+    server = WebhookServer(on_updates, SECRET, host="127.0.0.1", port=0, max_queue=10, max_batch=5)
+    server.serve_in_background()
+    try:
+        statuses = [post(server, {"update_id": update_id}) for update_id in range(30)]
+        assert statuses.count(429) > 0
+        assert set(statuses) == {200, 429}
+        assert server.rejected == statuses.count(429)
+        rejected = [update_id for update_id, status in enumerate(statuses) if status == 429]
+
+        gate.set()
+        for update_id in rejected:
+            deadline = time.monotonic() + 5
+            while post(server, {"update_id": update_id}) == 429:
+                assert time.monotonic() < deadline
+                time.sleep(0.01)
+        deadline = time.monotonic() + 5
+        while len(handled) < 30 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        server.shutdown()
+    assert sorted(update["update_id"] for update in handled) == list(range(30))
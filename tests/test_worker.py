@@ -0,0 +1,86 @@
+import random
+
+import pytest
+
+from alerts import ABOVE, BELOW
+from sharding import shard_of
+from storage import Storage
+from worker import AlertWorker
+
+SHARDS = 8
+FIGIS = [f"BBG{i:09d}" for i in range(30)]
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = Storage(str(tmp_path / "alerts.sqlite"))
+    yield storage
+    storage.close()
+
+
+def stored(storage, worker):
+    owned = worker.coordinator.owned
+    alerts = sorted((row[0], row[1], row[3], row[5]) for row in storage.load_alerts()
+                    if shard_of(row[1], SHARDS) in owned)
+    levels = sorted(row[:2] + row[3:] for row in storage.load_level_alerts() if shard_of(row[1], SHARDS) in owned)
+    return alerts, levels
+
+
+def loaded(worker, users):
+    alerts = sorted((alert.user_id, alert.figi, alert.threshold, alert.window)
+                    for user_id in users for alert in worker.alerts.user_alerts(user_id))
+    levels = sorted((level.user_id, level.figi, level.level, level.direction)
+                    for user_id in users for level in worker.alerts.user_levels(user_id))
+    return alerts, levels
+
+
+def change_randomly(storage, rng):
+    for _ in range(rng.randrange(10)):
+        user_id, figi, roll = rng.randrange(50), rng.choice(FIGIS), rng.random()
+        if roll < 0.35:
+            storage.save_alert(user_id, figi, figi, rng.choice([1, 2, 3]), 100, rng.choice([0, 300]))
+        elif roll < 0.55:
+            storage.delete_alert(user_id, figi, rng.choice([0, 300]))
+        elif roll < 0.8:
+            storage.save_level_alert(user_id, figi, figi, rng.choice([90, 110]), rng.choice([ABOVE, BELOW]))
+        else:
+            storage.delete_level_alert(user_id, figi, rng.choice([90, 110]))
+
+
+def test_incremental_sync_matches_owned_rows(storage):
+    rng = random.Random(5)
+    first = AlertWorker(storage, lambda: None, "first", shards=SHARDS)
+    second = AlertWorker(storage, lambda: None, "second", shards=SHARDS)
+    now = 1000.0
+    for step in range(150):
+        change_randomly(storage, rng)
+        now += 1
+        if step == 50:
+            second.sync(now)
+        if step == 100:
+            second.coordinator.release()
+        first.sync(now)
+        assert loaded(first, range(50)) == stored(storage, first)
+        if 50 <= step < 100:
+            second.sync(now)
+            assert loaded(second, range(50)) == stored(storage, second)
+    assert first.coordinator.owned == frozenset(range(SHARDS))
+
+
+def test_sync_reads_only_changes(storage):
+    with storage.transaction() as db:
+        db.executemany("INSERT INTO alerts (user_id, figi, ticker, threshold, baseline, window) "
+                       "VALUES (?, ?, ?, 3, 100, 0)", [(user_id, FIGIS[user_id % 30], "SZY") for user_id in range(300)])
+    worker = AlertWorker(storage, lambda: None, "only", shards=SHARDS)
+    worker.sync(1000)
+    assert len(worker.alerts) == 300
+    seq, changes = storage.alert_changes(worker.changes_seq)
+    assert changes == []
+
+    storage.save_alert(1, FIGIS[1], "SZY", 7, 100)
+    storage.delete_alert(2, FIGIS[2])
+    seq, changes = storage.alert_changes(worker.changes_seq)
+    assert sorted(change[1] for change in changes) == [1, 2]
+    worker.sync(1001)
+    assert len(worker.alerts) == 299
+    assert [alert.threshold for alert in worker.alerts.user_alerts(1)] == [7]
@@ -0,0 +1,126 @@
+import threading
+from array import array
+from collections import namedtuple
+
+HISTORY_CAPACITY = 720
+MIN_SAMPLE_INTERVAL = 5
+
+WindowStats = namedtuple("WindowStats", ["first_time", "first", "low", "high", "samples"])
+
+
+def _zeros(typecode, size):
+    return array(typecode, bytes(8 * size))
+
+
+class TickRing:
+    __slots__ = ("capacity", "times", "prices", "total",
+                 "low_seq", "low_head", "low_len", "high_seq", "high_head", "high_len")
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = _zeros("d", capacity)
+        self.prices = _zeros("d", capacity)
+        self.total = 0
+        self.low_seq, self.low_head, self.low_len = _zeros("q", capacity), 0, 0
+        self.high_seq, self.high_head, self.high_len = _zeros("q", capacity), 0, 0
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    def last_time(self):
+        return self.times[(self.total - 1) % self.capacity] if self.total else None
+
+    def _append(self, queue, head, length, seq, oldest, is_lower):
+        capacity = self.capacity
+        price = self.prices[seq % capacity]
+        while length and queue[head] < oldest:
+            head = (head + 1) % capacity
+            length -= 1
+        while length:
+            tail_price = self.prices[queue[(head + length - 1) % capacity] % capacity]
+            if (tail_price < price) if is_lower else (tail_price > price):
+                break
+            length -= 1
+        queue[(head + length) % capacity] = seq
+        return head, length + 1
+
+    def push(self, timestamp, price):
+        seq = self.total
+        self.times[seq % self.capacity] = timestamp
+        self.prices[seq % self.capacity] = price
+        self.total += 1
+        oldest = self.total - self.capacity
+        self.low_head, self.low_len = self._append(self.low_seq, self.low_head, self.low_len, seq, oldest, True)
+        self.high_head, self.high_len = self._append(self.high_seq, self.high_head, self.high_len, seq, oldest, False)
+
+    def _first_seq(self, start_time):
+        low, high = max(0, self.total - self.capacity), self.total
+        while low < high:
+            middle = (low + high) // 2
+            if self.times[middle % self.capacity] < start_time:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _extreme(self, queue, head, length, first_seq):
+        low, high = 0, length
+        while low < high:
+            middle = (low + high) // 2
+            if queue[(head + middle) % self.capacity] < first_seq:
+                low = middle + 1
+            else:
+                high = middle
+        return self.prices[queue[(head + low) % self.capacity] % self.capacity]
+
+    def window(self, start_time, reference_since=None):
+        first_seq = self._first_seq(start_time)
+        if reference_since is not None and first_seq > max(0, self.total - self.capacity) and \
+                self.times[(first_seq - 1) % self.capacity] >= reference_since:
+            first_seq -= 1
+        if first_seq >= self.total:
+            return None
+        position = first_seq % self.capacity
+        return WindowStats(self.times[position], self.prices[position],
+                           self._extreme(self.low_seq, self.low_head, self.low_len, first_seq),
+                           self._extreme(self.high_seq, self.high_head, self.high_len, first_seq),
+                           self.total - first_seq)
+
+    def nbytes(self):
+        return sum(a.itemsize * len(a) for a in (self.times, self.prices, self.low_seq, self.high_seq))
+
+
+class TickHistory:
+    def __init__(self, capacity=HISTORY_CAPACITY, min_interval=MIN_SAMPLE_INTERVAL):
+        self.capacity = capacity
+        self.min_interval = min_interval
+        self._rings = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._rings)
+
+    def record(self, figi, timestamp, price):
+        with self._lock:
+            ring = self._rings.get(figi)
+            if ring is None:
+                ring = self._rings[figi] = TickRing(self.capacity)
+            last = ring.last_time()
+            if last is not None and timestamp - last < self.min_interval:
+                return False
+            ring.push(timestamp, price)
+            return True
+
+    def window(self, figi, start_time, reference_since=None):
+        with self._lock:
+            ring = self._rings.get(figi)
+            return ring.window(start_time, reference_since) if ring is not None else None
+
+    def retain(self, figis):
+        keep = set(figis)
+        with self._lock:
+            for figi in [f for f in self._rings if f not in keep]:
+                del self._rings[figi]
+
+    def nbytes(self):
+        return len(self._rings) * TickRing(1).nbytes() * self.capacity
@@ -0,0 +1,197 @@
+import threading
+import time
+
+import numpy as np
+
+from quotes import quotation_to_float
+
+BASE_CURRENCY = "rub"
+FX_TTL = 60
+VALUATION_INTERVAL = 60
+SPARSE_UPDATE_SHARE = 0.25
+
+
+class FxRates:
+    def __init__(self, client_factory, quotes, ttl=FX_TTL):
+        self.client_factory = client_factory
+        self.quotes = quotes
+        self.ttl = ttl
+        self._instruments = None
+        self._rates = {BASE_CURRENCY: 1.0}
+        self._fetched_at = {}
+        self._lock = threading.Lock()
+
+    def _load_instruments(self):
+        with self.client_factory() as client:
+            currencies = client.instruments.currencies().instruments
+        instruments = {}
+        for currency in currencies:
+            code = currency.iso_currency_name.lower()
+            nominal = quotation_to_float(currency.nominal) or 1.0
+            if code not in instruments or currency.ticker.upper().endswith("TOM"):
+                instruments[code] = (currency.figi, nominal)
+        self._instruments = instruments
+
+    def rates(self, currencies, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            wanted = {(code or "").lower() for code in currencies} - {BASE_CURRENCY}
+            stale = [code for code in wanted if now - self._fetched_at.get(code, 0.0) >= self.ttl]
+            if stale:
+                if self._instruments is None:
+                    self._load_instruments()
+                figis = {self._instruments[code][0]: code for code in stale if code in self._instruments}
+                quotes = self.quotes.get_last_prices(list(figis))
+                for figi, code in figis.items():
+                    quote = quotes.get(figi)
+                    if quote is not None:
+                        self._rates[code] = quote.price / self._instruments[code][1]
+                for code in stale:
+                    self._fetched_at[code] = now
+            return {code: self._rates.get(code) for code in wanted | {BASE_CURRENCY}}
+
+
+class PortfolioValuations:
+    def __init__(self):
+        self._users = {}
+        self._figis = {}
+        self._figi_list = []
+        self._currencies = {BASE_CURRENCY: 0}
+        self._positions = {}
+        self._lock = threading.Lock()
+        self._size = 0
+        self._user = np.zeros(0, np.int64)
+        self._instrument = np.zeros(0, np.int64)
+        self._quantity = np.zeros(0)
+        self._currency = np.zeros(0, np.int64)
+        self._prices = np.zeros(0)
+        self._values = np.zeros(0)
+        self._rates = np.ones(1)
+        self._totals = np.zeros(0)
+        self._order = None
+
+    def __len__(self):
+        return int(np.count_nonzero(self._quantity[:self._size]))
+
+    @staticmethod
+    def _grow(values, size, fill=0):
+        if size <= len(values):
+            return values
+        grown = np.full(max(size, 2 * len(values), 16), fill, dtype=values.dtype)
+        grown[:len(values)] = values
+        return grown
+
+    def _user_index(self, user_id):
+        index = self._users.get(user_id)
+        if index is None:
+            index = self._users[user_id] = len(self._users)
+            self._totals = self._grow(self._totals, index + 1)
+            self._positions[index] = {}
+        return index
+
+    def _currency_index(self, currency):
+        currency = (currency or "").lower()
+        index = self._currencies.get(currency)
+        if index is None:
+            index = self._currencies[currency] = len(self._currencies)
+            self._rates = self._grow(self._rates, index + 1, np.nan)
+        return index
+
+    def _instrument_index(self, figi, currency):
+        index = self._figis.get(figi)
+        if index is None:
+            index = self._figis[figi] = len(self._figis)
+            self._figi_list.append(figi)
+            self._currency = self._grow(self._currency, index + 1)
+            self._prices = self._grow(self._prices, index + 1, np.nan)
+            self._values = self._grow(self._values, index + 1)
+        if currency is not None:
+            self._currency[index] = self._currency_index(currency)
+        return index
+
+    def set_position(self, user_id, figi, currency, quantity):
+        with self._lock:
+            user = self._user_index(user_id)
+            instrument = self._instrument_index(figi, currency)
+            slot = self._positions[user].get(instrument)
+            if slot is None:
+                if not quantity:
+                    return
+                slot = self._positions[user][instrument] = self._size
+                self._size += 1
+                for name in ("_user", "_instrument", "_quantity"):
+                    setattr(self, name, self._grow(getattr(self, name), self._size))
+                self._user[slot], self._instrument[slot], self._quantity[slot] = user, instrument, 0.0
+                self._order = None
+            self._totals[user] += (quantity - self._quantity[slot]) * self._values[instrument]
+            self._quantity[slot] = quantity
+
+    def remove(self, user_id, figi):
+        self.set_position(user_id, figi, None, 0)
+
+    def load(self, positions):
+        for user_id, figi, currency, quantity in positions:
+            self.set_position(user_id, figi, currency, quantity)
+
+    def _holders(self, instruments):
+        size = self._size
+        if self._order is None:
+            self._order = np.argsort(self._instrument[:size], kind="stable")
+        starts = np.searchsorted(self._instrument[:size], instruments, sorter=self._order)
+        ends = np.searchsorted(self._instrument[:size], instruments, side="right", sorter=self._order)
+        counts = ends - starts
+        offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+        return self._order[offsets + np.arange(counts.sum())]
+
+    def update(self, prices, rates=None):
+        with self._lock:
+            for figi, price in prices.items():
+                index = self._figis.get(figi)
+                if index is not None:
+                    self._prices[index] = price
+            for currency, rate in (rates or {}).items():
+                index = self._currencies.get((currency or "").lower())
+                if index is not None and rate is not None:
+                    self._rates[index] = rate
+            count, size = len(self._figis), self._size
+            values = np.nan_to_num(self._prices[:count] * self._rates[self._currency[:count]])
+            changed = np.flatnonzero(values != self._values[:count])
+            if not changed.size:
+                return 0
+            users = len(self._users)
+            if changed.size > SPARSE_UPDATE_SHARE * count:
+                weights = self._quantity[:size] * values[self._instrument[:size]]
+                self._totals[:users] = np.bincount(self._user[:size], weights, minlength=users)
+            else:
+                slots = self._holders(changed)
+                delta = values[self._instrument[slots]] - self._values[self._instrument[slots]]
+                np.add.at(self._totals, self._user[slots], self._quantity[slots] * delta)
+            self._values[:count] = values
+            return int(changed.size)
+
+    def total(self, user_id):
+        index = self._users.get(user_id)
+        return float(self._totals[index]) if index is not None else 0.0
+
+    def positions(self, user_id):
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is None or not self._positions[index]:
+                return {}
+            held = self._positions[index]
+            instruments = np.fromiter(held.keys(), np.int64, len(held))
+            quantities = self._quantity[np.fromiter(held.values(), np.int64, len(held))]
+            prices = self._prices[instruments]
+            values = quantities * prices * self._rates[self._currency[instruments]]
+        return {self._figi_list[instrument]: (quantity, None if price != price else price,
+                                              None if value != value else value)
+                for instrument, quantity, price, value in zip(instruments.tolist(), quantities.tolist(),
+                                                              prices.tolist(), values.tolist()) if quantity}
+
+    def instruments(self):
+        with self._lock:
+            held = np.unique(self._instrument[:self._size][self._quantity[:self._size] != 0])
+            return [self._figi_list[index] for index in held.tolist()]
+
+    def currencies(self):
+        return list(self._currencies)
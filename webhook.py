@@ -0,0 +1,109 @@
+import hmac
+import json
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WEBHOOK_PATH = "/webhook"
+MAX_QUEUE = 1000
+MAX_BATCH = 100
+MAX_BODY = 1 << 20
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    def __init__(self, on_updates, secret_token, host="0.0.0.0", port=8443, path=WEBHOOK_PATH,
+                 parse=None, max_queue=MAX_QUEUE, max_batch=MAX_BATCH):
+        self.on_updates = on_updates
+        self.secret_token = (secret_token or "").encode()
+        self.path = path
+        self.parse = parse or (lambda raw: raw)
+        self.max_batch = max_batch
+        self.received = 0
+        self.rejected = 0
+        self._queue = queue.Queue(max_queue)
+        self._put_lock = threading.Lock()
+        self._feeder = None
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+
+    @property
+    def address(self):
+        return self._httpd.server_address
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                server.handle_post(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def _reply(self, request, status, retry_after=None):
+        request.send_response(status)
+        if retry_after is not None:
+            request.send_header("Retry-After", str(retry_after))
+        request.send_header("Content-Length", "0")
+        request.end_headers()
+
+    def handle_post(self, request):
+        if request.path != self.path:
+            return self._reply(request, 404)
+        secret = request.headers.get(SECRET_HEADER, "").encode("latin-1", "replace")
+        if not hmac.compare_digest(secret, self.secret_token):
+            return self._reply(request, 403)
+        length = int(request.headers.get("Content-Length") or 0)
+        if length <= 0 or length > MAX_BODY:
+            return self._reply(request, 413 if length > MAX_BODY else 400)
+
+        try:
+            payload = json.loads(request.rfile.read(length))
+            raw_updates = payload if isinstance(payload, list) else [payload]
+            updates = [self.parse(raw) for raw in raw_updates]
+        except (ValueError, TypeError, KeyError):
+            return self._reply(request, 400)
+
+        with self._put_lock:
+            if self._queue.maxsize - self._queue.qsize() < len(updates):
+                self.rejected += len(updates)
+                return self._reply(request, 429, retry_after=1)
+            for update in updates:
+                self._queue.put_nowait(update)
+            self.received += len(updates)
+        self._reply(request, 200)
+
+    def _feed(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.on_updates(batch)
+            except Exception as e:
+                print(f"Ошибка обработки пакета обновлений: {e}")
+
+    def start(self):
+        if self._feeder is None:
+            self._feeder = threading.Thread(target=self._feed, daemon=True)
+            self._feeder.start()
+
+    def serve_forever(self):
+        self.start()
+        self._httpd.serve_forever()
+
+    def serve_in_background(self):
+        self.start()
+        thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def shutdown(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
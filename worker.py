@@ -0,0 +1,110 @@
+import os
+import socket
+import threading
+import time
+from functools import partial
+
+from alerts import AlertEngine
+from client_pool import ClientPool, new_invest_client
+from gateway import ApiGateway
+from instruments import InstrumentIndex
+from quotes import QuoteService
+from scheduler import MAX_INTERVAL, MIN_INTERVAL, AlertScheduler, TradingCalendar
+from sharding import LEASE_TTL, SHARDS, AlertDeliveries, LeaseCoordinator, owns_shard
+from storage import Storage
+from tick_history import TickHistory
+
+SYNC_INTERVAL = 10
+
+
+def worker_id(index=0):
+    return f"{socket.gethostname()}:{os.getpid()}:{index}"
+
+
+class AlertWorker:
+    def __init__(self, storage, client_factory, owner, shards=SHARDS, lease_ttl=LEASE_TTL,
+                 sync_interval=SYNC_INTERVAL, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL, quota_scale=1.0):
+        self.storage = storage
+        self.sync_interval = sync_interval
+        self.coordinator = LeaseCoordinator(storage, owner, shards=shards, ttl=lease_ttl)
+        self.deliveries = AlertDeliveries(storage)
+        self.pool = ClientPool(client_factory, size=1)
+        self.gateway = ApiGateway(self.pool.client, scale=quota_scale)
+        self.instruments = InstrumentIndex(self.gateway.client, storage)
+        self.quotes = QuoteService(self.gateway.client)
+        self.history = TickHistory()
+        self.alerts = AlertEngine(history=self.history)
+        self.scheduler = AlertScheduler(self.check, self.alerts, TradingCalendar(self.gateway.client, storage),
+                                        self.instruments, min_interval=min_interval, max_interval=max_interval)
+        self.published = 0
+        self.changes_seq = None
+        self._stop = threading.Event()
+
+    def check(self, figis):
+        quotes = self.quotes.get_last_prices(figis)
+        fired = self.alerts.evaluate_many(quotes)
+        if fired:
+            self.published += self.deliveries.publish(fired, self.coordinator)
+        return quotes
+
+    def sync(self, now=None):
+        previous = self.coordinator.owned
+        owned = self.coordinator.heartbeat(now)
+        seq, changes = self.storage.alert_changes(self.changes_seq)
+        if changes is None:
+            self.alerts.load(self.storage.load_alerts(self.coordinator.owns))
+            self.alerts.load_levels(self.storage.load_level_alerts(self.coordinator.owns))
+        else:
+            if previous - owned:
+                self.alerts.drop([figi for figi in self.alerts.instruments() if not self.coordinator.owns(figi)])
+            if owned - previous:
+                gained = partial(owns_shard, owned - previous, self.coordinator.shards)
+                for row in self.storage.load_alerts(gained):
+                    self.alerts.add(*row)
+                for row in self.storage.load_level_alerts(gained):
+                    self.alerts.add_level(*row)
+            self.apply_changes(change for change in changes if self.coordinator.owns(change[2]))
+        self.changes_seq = seq
+        figis = self.alerts.instruments()
+        self.history.retain(figis)
+        self.scheduler.sync(figis, now)
+
+    def apply_changes(self, changes):
+        for kind, user_id, figi, key, ticker, threshold, baseline, direction, present in changes:
+            if kind == "level" and present:
+                self.alerts.add_level(user_id, figi, ticker, key, direction)
+            elif kind == "level":
+                self.alerts.remove_level(user_id, figi, key)
+            elif present:
+                self.alerts.add(user_id, figi, ticker, threshold, baseline, key)
+            else:
+                self.alerts.remove(user_id, figi, key)
+
+    def run(self):
+        self.instruments.start()
+        next_sync = 0.0
+        while not self._stop.is_set():
+            if time.time() >= next_sync:
+                try:
+                    self.sync()
+                except Exception as e:
+                    print(f"Ошибка синхронизации воркера {self.coordinator.owner}: {e}")
+                next_sync = time.time() + self.sync_interval
+            try:
+                self.scheduler.run_once()
+            except Exception as e:
+                print(f"Ошибка проверки уведомлений в воркере {self.coordinator.owner}: {e}")
+            self.scheduler.wait(max(0.0, next_sync - time.time()))
+        self.coordinator.release()
+
+    def stop(self):
+        self._stop.set()
+        self.scheduler.sync(())
+
+
+def run_worker(db_name, index=0, client_factory=None, **options):
+    storage = Storage(db_name)
+    storage.start()
+    worker = AlertWorker(storage, client_factory or new_invest_client, worker_id(index), **options)
+    print(f"Воркер уведомлений {worker.coordinator.owner} запущен")
+    worker.run()